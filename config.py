@@ -8,7 +8,8 @@ class ConfigTemplate:
     """
 
     def __init__(self, database_kwargs: dict, rag_architecture_name: str, embedder_name: str, embedder_kwargs: dict, tokenizer_name: str, tokenizer_kwargs: dict,
-                 llm_name: str, llm_kwargs: dict, evaluation_llm_name: str, evaluation_kwargs: dict) -> None:
+                 llm_name: str, llm_kwargs: dict, evaluation_llm_name: str, evaluation_kwargs: dict, parser_kwargs: dict = None,
+                 rag_architecture_kwargs: dict = None) -> None:
         self.database_kwargs = database_kwargs
         self.rag_architecture_name = rag_architecture_name
         self.embedder_name = embedder_name
@@ -19,6 +20,8 @@ class ConfigTemplate:
         self.llm_kwargs = llm_kwargs
         self.evaluation_llm_name = evaluation_llm_name
         self.evaluation_kwargs = evaluation_kwargs
+        self.parser_kwargs = parser_kwargs if parser_kwargs is not None else {}
+        self.rag_architecture_kwargs = rag_architecture_kwargs if rag_architecture_kwargs is not None else {}
 
 
 
@@ -26,6 +29,7 @@ class ConfigTemplate:
         return (f"Config (\n"
                 f"  database_kwargs: {self.database_kwargs},\n"
                 f"  rag_architecture_name: {self.rag_architecture_name},\n"
+                f"  rag_architecture_kwargs: {self.rag_architecture_kwargs},\n"
                 f"  embedder_name: {self.embedder_name},\n"
                 f"  embedder_kwargs: {self.embedder_kwargs},\n"
                 f"  tokenizer_name: {self.tokenizer_name},\n"
@@ -34,6 +38,7 @@ class ConfigTemplate:
                 f"  llm_kwargs: {self.llm_kwargs}\n"
                 f"  evaluation_llm_name: {self.evaluation_llm_name},\n"
                 f"  evaluation_kwargs: {self.evaluation_kwargs}\n"
+                f"  parser_kwargs: {self.parser_kwargs}\n"
                 f")")
 
 
@@ -42,23 +47,76 @@ class Config(ConfigTemplate):
     def __init__(self) -> None:
         super().__init__(
             database_kwargs = {
+                "backend": "milvus",  # "milvus" or "numpy" (in-process, exact search)
                 "embedding_dimension": 384,
+                "insert_batch_max_bytes": 16 * 1024 ** 2,
+                "max_inflight_batches": 2,
+                "residency_memory_budget_bytes": 4 * 1024 ** 3,
+                "index_type": "FLAT",  # FLAT, HNSW, IVF_FLAT, IVF_SQ8, IVF_PQ, DISKANN or AUTO (selected by row count)
+                "index_build_params": None,  # e.g. {"M": 16, "efConstruction": 200} for HNSW, None for the defaults
+                "index_search_params": None,  # e.g. {"ef": 64} for HNSW or {"nprobe": 16} for IVF
+                "metric_type": "COSINE",
+                "layout": "collection",  # milvus backend: "collection" (one per conversation) or "partition_key" (one shared)
+                "storage_dir": None,  # numpy backend: directory of the memory-mapped collections (None to keep them in memory)
+                "vector_quantization": "none",  # milvus backend: "none", "float16", "bfloat16", "int8" or "binary"
+                "rescore_factor": 4,  # Number of quantized candidates per result rescored with full-precision embeddings
+                "full_precision_dir": ".cache/full_precision",  # Directory of the full-precision embeddings of quantized collections
+                "consistency_level": "Strong",  # milvus backend: searches see all completed writes (cached results are never stale)
+                "retrieval_cache": {  # None disables the cache of retrieval results (invalidated by writes to the conversation)
+                    "max_entries": 10_000,
+                    "ttl_seconds": 300,  # Bounds the staleness after writes done by other processes
+                    "embedding_step": None,  # e.g. 1e-3 to also cache the searches by the quantized query embeddings
+                },
             },
             rag_architecture_name = "classic-rag",
+            rag_architecture_kwargs = {
+                "streaming_ingestion": False,
+                "incremental_ingestion": False,
+                "pages_per_batch": 16,
+                "queue_depth": 4,
+                "max_concurrent_llm_calls": 8,
+                "top_k": 5,  # Number of relevant documents per query
+                "fetch_k_factor": 4,  # MMR only: top_k * fetch_k_factor candidates are searched and diversified
+                "mmr_lambda": None,  # MMR trade-off between relevance (1) and diversity (0), None disables MMR
+                "hybrid_search": False,  # Fuse dense and lexical (BM25) search results (the texts are indexed at ingest time)
+                "hybrid_candidates": 20,  # Number of candidates of each search fused into the relevant documents
+                "rrf_k": 60,  # Rank constant of reciprocal rank fusion
+                "answer_cache": None,  # e.g. {"similarity_threshold": 0.95, "max_entries": 1_000, "max_conversations": 1_000}
+                "prompt_budget": None,  # e.g. {"max_tokens": 3_000, "duplicate_threshold": 0.8}, counted by the LLM tokenizer
+            },
             embedder_name = "basic-embedder",
             embedder_kwargs= {
                 "sentence_transformer_name": "all-MiniLM-L12-v2",
                 "device": "cuda",
+                "cache": {
+                    "cache_dir": ".cache/embeddings",
+                    "max_entries": 200_000,
+                },
             },
             tokenizer_name = "fixed-size-tokenizer",
             tokenizer_kwargs = {
                 "chunk_size": 256
             },
+            # tokenizer_name = "token-budget-tokenizer",
+            # tokenizer_kwargs = {
+            #     "max_tokens": None, # None uses the sequence length of the embedder
+            #     "overlap_tokens": 32,
+            # },
             llm_name = "chat-gpt",
             llm_kwargs = {
                 "api_key": os.getenv("OPENAI_API_KEY"),
                 "initial_prompt": "You are a helpful assistant. Answer the question based on the provided context.",
                 "model_name": "gpt-3.5-turbo",
+                "cache": {
+                    "cache_dir": ".cache/llm_responses",
+                    "ttl_seconds": 7 * 24 * 3600, # None to never expire
+                    "max_entries": 100_000,
+                },
+                "rate_limit": { # Shared by all LLMs of the process using the same model and key
+                    "requests_per_minute": 500, # None for no limit
+                    "tokens_per_minute": 200_000, # None for no limit
+                    "max_retries": 5, # Retries of rate limit, server and connection errors
+                },
             },
             # llm_name = "open-router",
             # llm_kwargs = {
@@ -66,13 +124,39 @@ class Config(ConfigTemplate):
             #     "initial_prompt": "You are a helpful assistant. Answer the question based on the provided context.",
             #     "model_name": "deepseek/deepseek-chat-v3-0324:free",
             # }
+            # llm_name = "local-stub", # Offline benchmarks (deterministic synthetic answers, no API calls)
+            # llm_kwargs = {
+            #     "initial_prompt": "You are a helpful assistant. Answer the question based on the provided context.",
+            #     "api": "chat-completions", # or "responses"
+            #     "server": { # Started in this process, or pass "base_url" of python -m rag.llms.local_stub_server
+            #         "latency": {"distribution": "lognormal", "median": 0.4, "sigma": 0.5},
+            #         "token_latency": {"distribution": "constant", "value": 0.01},
+            #         "rate_limit_error_rate": 0.02,
+            #         "server_error_rate": 0.01,
+            #     },
+            # },
             evaluation_llm_name="chat-gpt",
             evaluation_kwargs = {
                 "llm_kwargs": {
                     "api_key": os.getenv("OPENAI_API_KEY"),
                     "initial_prompt": "You are a helpful assistant.",
                     "model_name": "gpt-3.5-turbo",
+                    "cache": {
+                        "cache_dir": ".cache/llm_responses",
+                        "ttl_seconds": None, # Judge responses never expire, so re-scoring is reproducible
+                        "max_entries": 100_000,
+                    },
+                    "rate_limit": {
+                        "requests_per_minute": 500,
+                        "tokens_per_minute": 200_000,
+                        "max_retries": 5,
+                    },
                 },
+            },
+            parser_kwargs = {
+                "min_pages_per_process": 16,
+                "cache_dir": ".cache/markdown",
+                "cache_max_size_bytes": 1024 ** 3,
             }
         )
 
@@ -0,0 +1,256 @@
+from abc import ABC, abstractmethod
+from typing import Sequence
+from numpy import ndarray
+import asyncio
+
+
+class VectorDatabaseTemplate(ABC):
+    """
+    Base class for vector databases. This class defines the interface for vector databases, which store the fragments
+    of every conversation in a separate collection together with their embeddings. A new vector database backend can be
+    created by inheriting from this class and implementing the abstract methods.
+    Search results have the Milvus format: a list (one item per query embedding) of lists of hits, where every hit is
+    a dictionary with "id", "distance" and "entity" (dictionary with the "text" field).
+
+    :param backend_name: Name of the vector database backend
+    """
+
+    def __init__(self, backend_name: str) -> None:
+        self.backend_name = backend_name
+
+
+    @abstractmethod
+    def create_collection(self, conversation_id: int, dimension: int) -> None:
+        """
+        Create a collection for the conversation. If the collection already exists, it is removed first.
+
+        :param conversation_id: ID of the conversation
+        :param dimension: Dimension of the embedding
+        :return: None
+        """
+
+        pass
+
+
+    @abstractmethod
+    def remove_collection(self, conversation_id: int) -> None:
+        """
+        Remove the collection of the conversation (if it exists).
+
+        :param conversation_id: ID of the conversation
+        :return: None
+        """
+
+        pass
+
+
+    @abstractmethod
+    def has_collection(self, conversation_id: int) -> bool:
+        """
+        Check if the collection of the conversation exists.
+
+        :param conversation_id: ID of the conversation
+        :return: True if the collection exists, False otherwise
+        """
+
+        pass
+
+
+    @abstractmethod
+    def has_field(self, conversation_id: int, field_name: str) -> bool:
+        """
+        Check if the collection has a field (collections created by older versions may lack some fields).
+
+        :param conversation_id: ID of the conversation
+        :param field_name: Name of the field
+        :return: True if the collection has the field, False otherwise
+        """
+
+        pass
+
+
+    @abstractmethod
+    def get_fingerprints(self, conversation_id: int, document_id: str) -> dict:
+        """
+        Get the fingerprints of the fragments of a document stored in the collection.
+
+        :param conversation_id: ID of the conversation
+        :param document_id: ID of the document
+        :return: Dictionary mapping fingerprints to the lists of IDs of the rows having them
+        """
+
+        pass
+
+
+    @abstractmethod
+    def delete_data(self, conversation_id: int, ids: list) -> None:
+        """
+        Delete rows from the collection.
+
+        :param conversation_id: ID of the conversation
+        :param ids: IDs of the rows to be deleted
+        :return: None
+        """
+
+        pass
+
+
+    @abstractmethod
+    def insert_data(self, conversation_id: int, data: list, flush: bool = True):
+        """
+        Insert rows (dictionaries with "embedding", "text" and optionally "fingerprint" and "document_id") into the collection.
+
+        :param conversation_id: ID of the conversation
+        :param data: Data to be inserted (list of rows)
+        :param flush: Whether to flush the collection after inserting
+        """
+
+        pass
+
+
+    @abstractmethod
+    def insert_columns(self, conversation_id: int, embeddings: ndarray, texts: Sequence, fingerprints: Sequence = None,
+                       flush: bool = False, document_id: str = None) -> int:
+        """
+        Insert columnar data into the collection.
+
+        :param conversation_id: ID of the conversation
+        :param embeddings: 2D array of embeddings
+        :param texts: Sequence of texts corresponding to the embeddings (list or Chunks)
+        :param fingerprints: Sequence of fingerprints corresponding to the embeddings (optional)
+        :param flush: Whether to flush the collection after inserting
+        :param document_id: ID of the document the rows belong to (optional)
+        :return: Number of inserted rows
+        """
+
+        pass
+
+
+    @abstractmethod
+    def flush(self, conversation_id: int) -> None:
+        """
+        Persist the inserted data of the collection.
+
+        :param conversation_id: ID of the conversation
+        :return: None
+        """
+
+        pass
+
+
+    @abstractmethod
+    def search(self, conversation_id: int, query_embedding: list, limit: int = 5, include_embeddings: bool = False):
+        """
+        Search for the fragments most similar to the query embeddings.
+
+        :param conversation_id: ID of the conversation
+        :param query_embedding: List of query embeddings to search for
+        :param limit: Number of results per query
+        :param include_embeddings: Whether to return the embeddings of the hits (as entity["embedding"])
+        :return: Search results
+        """
+
+        pass
+
+
+    async def a_search(self, conversation_id: int, query_embedding: list, limit: int = 5,
+                       include_embeddings: bool = False):
+        """
+        Asynchronously search for the fragments most similar to the query embeddings. Backends without an async client
+        don't have to override this method (the search runs in a worker thread).
+
+        :param conversation_id: ID of the conversation
+        :param query_embedding: List of query embeddings to search for
+        :param limit: Number of results per query
+        :param include_embeddings: Whether to return the embeddings of the hits (as entity["embedding"])
+        :return: Search results
+        """
+
+        return await asyncio.to_thread(self.search, conversation_id, query_embedding, limit, include_embeddings)
+
+
+    def search_text(self, conversation_id: int, queries: list, limit: int = 5, include_embeddings: bool = False):
+        """
+        Search for the fragments with the highest lexical (BM25) scores for the query texts. Backends without
+        a lexical index don't have to override this method.
+
+        :param conversation_id: ID of the conversation
+        :param queries: List of query texts to search for
+        :param limit: Number of results per query
+        :param include_embeddings: Whether to return the embeddings of the hits (as entity["embedding"])
+        :return: Search results
+        """
+
+        raise NotImplementedError(f"The {self.backend_name} backend does not support lexical search.")
+
+
+    async def a_search_text(self, conversation_id: int, queries: list, limit: int = 5,
+                            include_embeddings: bool = False):
+        """
+        Asynchronously search for the fragments with the highest lexical (BM25) scores for the query texts. Backends
+        without an async client don't have to override this method (the search runs in a worker thread).
+
+        :param conversation_id: ID of the conversation
+        :param queries: List of query texts to search for
+        :param limit: Number of results per query
+        :param include_embeddings: Whether to return the embeddings of the hits (as entity["embedding"])
+        :return: Search results
+        """
+
+        return await asyncio.to_thread(self.search_text, conversation_id, queries, limit, include_embeddings)
+
+
+    async def a_insert_columns(self, conversation_id: int, embeddings: ndarray, texts: Sequence,
+                               fingerprints: Sequence = None, flush: bool = False, document_id: str = None) -> int:
+        """
+        Asynchronously insert columnar data into the collection. Backends without an async client don't have to
+        override this method (the insert runs in a worker thread).
+
+        :param conversation_id: ID of the conversation
+        :param embeddings: 2D array of embeddings
+        :param texts: Sequence of texts corresponding to the embeddings (list or Chunks)
+        :param fingerprints: Sequence of fingerprints corresponding to the embeddings (optional)
+        :param flush: Whether to flush the collection after inserting
+        :param document_id: ID of the document the rows belong to (optional)
+        :return: Number of inserted rows
+        """
+
+        return await asyncio.to_thread(self.insert_columns, conversation_id, embeddings, texts, fingerprints, flush,
+                                       document_id)
+
+
+    def get_index_info(self, conversation_id: int) -> dict:
+        """
+        Get the index of the embedding field of the collection. Backends without configurable indexes don't have to
+        override this method.
+
+        :param conversation_id: ID of the conversation
+        :return: Dictionary with the index type, the search parameters and the number of rows waiting to be indexed
+        """
+
+        return {"index_type": "FLAT", "search_params": {}, "pending_index_rows": 0}
+
+
+    def wait_for_index(self, conversation_id: int, poll_seconds: float = 0.5, timeout: float = None) -> None:
+        """
+        Wait until all flushed rows of the collection are indexed. Backends which index synchronously don't have to
+        override this method.
+
+        :param conversation_id: ID of the conversation
+        :param poll_seconds: Time between the checks of the index state
+        :param timeout: Maximal waiting time in seconds (None to wait indefinitely)
+        :return: None
+        """
+
+        return None
+
+
+    def get_residency_stats(self) -> dict:
+        """
+        Get the statistics of the collections kept in memory between searches. Backends without such statistics
+        don't have to override this method.
+
+        :return: Dictionary of statistics
+        """
+
+        return {}
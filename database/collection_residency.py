@@ -0,0 +1,306 @@
+from pymilvus import MilvusClient
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+import logging
+import threading
+import time
+
+
+class CollectionResidencyManager:
+    """
+    Manager of the collections loaded into the Milvus query node memory. Instead of loading a collection before every
+    search and releasing it afterwards, collections stay loaded and are released only when the estimated memory
+    footprint of all loaded collections exceeds the memory budget (least recently queried collections first).
+    Collections are pinned while they are queried, so a running search never loses its collection to an eviction.
+    Collections are loaded and released outside of the lock of the manager, so only the threads querying the same
+    collection wait for its load.
+    The footprint of a collection is estimated from its row count, embedding dimension and average text size.
+
+    :param client: Milvus client
+    :param memory_budget_bytes: Memory budget for all loaded collections
+    :param text_bytes_per_row: Estimated average size of the scalar fields of a row
+    """
+
+    # Size of a single dimension of the vector fields by their data type (float vectors take 4 bytes)
+    __BYTES_PER_DIMENSION = {
+        "FLOAT16_VECTOR": 2,
+        "BFLOAT16_VECTOR": 2,
+        "BINARY_VECTOR": 1 / 8,
+    }
+
+
+    def __init__(self, client: MilvusClient, memory_budget_bytes: int = 4 * 1024 ** 3, text_bytes_per_row: int = 1024) -> None:
+        self.client = client
+        self.memory_budget_bytes = memory_budget_bytes
+        self.text_bytes_per_row = text_bytes_per_row
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_seconds = 0.0
+
+        # Loaded collections ordered from the least to the most recently queried, mapped to their footprints
+        # (None if the footprint has to be estimated again)
+        self.__loaded = OrderedDict()
+
+        # Collections being loaded or released (by another thread), mapped to the events set when it is done
+        self.__pending = {}
+
+        # Number of running queries of every collection (pinned collections are never evicted)
+        self.__pins = Counter()
+
+        # The lock only guards the bookkeeping, the Milvus calls are made outside of it
+        self.__lock = threading.Lock()
+
+
+    def acquire(self, collection_name: str, pin: bool = False) -> None:
+        """
+        Make sure the collection is loaded and mark it as the most recently queried. Other collections are released
+        if the memory budget is exceeded. Only the threads acquiring the same collection wait for its load.
+
+        :param collection_name: Name of the collection
+        :param pin: Whether to pin the collection, so it is not evicted until unpin is called
+        :return: None
+        """
+
+        while True:
+            with self.__lock:
+                pending = self.__pending.get(collection_name)
+                if pending is None:
+                    if collection_name in self.__loaded:
+                        self.hits += 1
+                        self.__loaded.move_to_end(collection_name)
+                        if pin:
+                            self.__pins[collection_name] += 1
+                        if self.__loaded[collection_name] is not None:
+                            return
+                        load = False
+                    else:
+                        self.misses += 1
+                        if pin:
+                            self.__pins[collection_name] += 1
+                        pending = self.__pending[collection_name] = threading.Event()
+                        load = True
+                    break
+
+            # The collection is being loaded or released by another thread
+            pending.wait()
+
+        if load:
+            start = time.perf_counter()
+            try:
+                self.client.load_collection(collection_name)
+            except BaseException:
+                with self.__lock:
+                    self.__pending.pop(collection_name).set()
+                if pin:
+                    self.unpin(collection_name)
+                raise
+
+            with self.__lock:
+                self.load_seconds += time.perf_counter() - start
+                self.__loaded[collection_name] = None
+                self.__pending.pop(collection_name).set()
+
+        # The footprint is estimated outside of the lock too (it calls the Milvus server)
+        try:
+            footprint = self.__estimate_footprint(collection_name)
+        except BaseException:
+            if pin:
+                self.unpin(collection_name)
+            raise
+
+        with self.__lock:
+            if collection_name in self.__loaded:
+                self.__loaded[collection_name] = footprint
+            evicted = self.__select_evicted(keep=collection_name)
+
+        self.__release_evicted(evicted)
+
+
+    def touch(self, collection_name: str, pin: bool = False) -> bool:
+        """
+        Mark the collection as the most recently queried if it is loaded and its footprint is known. Unlike acquire,
+        this never calls the Milvus server, so it can be used from an event loop before falling back to acquire.
+
+        :param collection_name: Name of the collection
+        :param pin: Whether to pin the collection if it is loaded, so it is not evicted until unpin is called
+        :return: True if the collection is loaded, False if it has to be acquired
+        """
+
+        with self.__lock:
+            if self.__loaded.get(collection_name) is None or collection_name in self.__pending:
+                return False
+
+            self.hits += 1
+            self.__loaded.move_to_end(collection_name)
+            if pin:
+                self.__pins[collection_name] += 1
+            return True
+
+
+    def unpin(self, collection_name: str) -> None:
+        """
+        Unpin the collection pinned by acquire or touch (once per pin).
+
+        :param collection_name: Name of the collection
+        :return: None
+        """
+
+        with self.__lock:
+            self.__pins[collection_name] -= 1
+            if self.__pins[collection_name] <= 0:
+                del self.__pins[collection_name]
+
+
+    @contextmanager
+    def pinned(self, collection_name: str):
+        """
+        Acquire the collection and keep it pinned while the block runs (e.g. a search).
+
+        :param collection_name: Name of the collection
+        """
+
+        self.acquire(collection_name, pin=True)
+        try:
+            yield
+        finally:
+            self.unpin(collection_name)
+
+
+    def invalidate_footprint(self, collection_name: str) -> None:
+        """
+        Mark the footprint of the collection as outdated (e.g. after inserting data), so it is estimated again
+        on the next query.
+
+        :param collection_name: Name of the collection
+        :return: None
+        """
+
+        with self.__lock:
+            if collection_name in self.__loaded:
+                self.__loaded[collection_name] = None
+
+
+    def forget(self, collection_name: str) -> None:
+        """
+        Stop tracking the collection (e.g. after it was dropped or released by someone else).
+
+        :param collection_name: Name of the collection
+        :return: None
+        """
+
+        with self.__lock:
+            self.__loaded.pop(collection_name, None)
+
+
+    def release_all(self) -> None:
+        """
+        Release all loaded collections.
+
+        :return: None
+        """
+
+        with self.__lock:
+            released = list(self.__loaded)
+            self.__loaded.clear()
+
+        for collection_name in released:
+            self.__release(collection_name)
+
+
+    def get_stats(self) -> dict:
+        """
+        Get the residency statistics.
+
+        :return: Dictionary with hits, misses, evictions, hit rate, total and average load time and estimated memory usage
+        """
+
+        with self.__lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+                "load_seconds": self.load_seconds,
+                "average_load_seconds": self.load_seconds / self.misses if self.misses else 0.0,
+                "loaded_collections": len(self.__loaded),
+                "estimated_memory_bytes": sum(footprint or 0 for footprint in self.__loaded.values()),
+            }
+
+
+    def __estimate_footprint(self, collection_name: str) -> int:
+        """
+        Estimate the memory footprint of the loaded collection.
+
+        :param collection_name: Name of the collection
+        :return: Estimated footprint in bytes
+        """
+
+        row_count = int(self.client.get_collection_stats(collection_name).get("row_count", 0))
+        description = self.client.describe_collection(collection_name)
+
+        vector_bytes = 0
+        for field in description["fields"]:
+            dimension = field.get("params", {}).get("dim")
+            if dimension is not None:
+                vector_bytes += self.__BYTES_PER_DIMENSION.get(getattr(field.get("type"), "name", None), 4) * int(dimension)
+
+        return int(row_count * (vector_bytes + self.text_bytes_per_row))
+
+
+    def __select_evicted(self, keep: str) -> list:
+        """
+        Select the least recently queried collections to be released, so the loaded collections fit into the memory
+        budget (pinned collections are skipped). They are removed from the loaded collections and marked as being
+        released, the caller has to release them by __release_evicted (outside of the lock).
+
+        :param keep: Name of the collection which must stay loaded
+        :return: List of names of the collections to be released
+        """
+
+        total = sum(footprint or 0 for footprint in self.__loaded.values())
+
+        evicted = []
+        for collection_name in list(self.__loaded):
+            if total <= self.memory_budget_bytes:
+                break
+            if collection_name == keep or self.__pins[collection_name] > 0 or collection_name in self.__pending:
+                continue
+
+            total -= self.__loaded.pop(collection_name) or 0
+            self.__pending[collection_name] = threading.Event()
+            evicted.append(collection_name)
+            self.evictions += 1
+
+        return evicted
+
+
+    def __release_evicted(self, evicted: list) -> None:
+        """
+        Release the evicted collections and wake up the threads waiting to load them again.
+
+        :param evicted: List of names of the collections selected by __select_evicted
+        :return: None
+        """
+
+        for collection_name in evicted:
+            try:
+                self.__release(collection_name)
+            finally:
+                with self.__lock:
+                    self.__pending.pop(collection_name).set()
+
+
+    def __release(self, collection_name: str) -> None:
+        """
+        Release the collection from memory.
+
+        :param collection_name: Name of the collection
+        :return: None
+        """
+
+        try:
+            self.client.release_collection(collection_name)
+        except Exception as e:  # The collection might have been dropped in the meantime
+            logging.info("Releasing collection %s failed: %s", collection_name, e)
@@ -0,0 +1,99 @@
+from pymilvus import MilvusClient, AsyncMilvusClient
+from database.collection_residency import CollectionResidencyManager
+import asyncio
+import atexit
+import logging
+import threading
+import weakref
+
+
+# Process-wide Milvus clients shared by all vector databases, keyed by the server URI and the token
+__clients = {}
+
+# Residency managers of the shared clients, keyed like the clients (the loaded collections belong to the server)
+__residency_managers = {}
+
+# Async clients are bound to the event loop they were created in, so they are kept per event loop
+__async_clients = weakref.WeakKeyDictionary()
+
+__lock = threading.Lock()
+
+
+def get_milvus_client(uri: str, token: str) -> MilvusClient:
+    """
+    Get the Milvus client connected to the server. The client (and its gRPC channel) is created once per process
+    and shared by all vector databases connected to the same server.
+
+    :param uri: URI of the Milvus server
+    :param token: Token used to authenticate to the Milvus server
+    :return: Milvus client
+    """
+
+    with __lock:
+        if (uri, token) not in __clients:
+            __clients[(uri, token)] = MilvusClient(uri=uri, token=token)
+
+        return __clients[(uri, token)]
+
+
+def get_residency_manager(uri: str, token: str, memory_budget_bytes: int = 4 * 1024 ** 3) -> CollectionResidencyManager:
+    """
+    Get the residency manager of the collections loaded through the shared Milvus client. The manager is created once
+    per process and client, so all vector databases connected to the same server share the memory budget and never
+    release the collections pinned by each other. The memory budget of the first caller is used.
+
+    :param uri: URI of the Milvus server
+    :param token: Token used to authenticate to the Milvus server
+    :param memory_budget_bytes: Memory budget for all loaded collections
+    :return: Residency manager
+    """
+
+    client = get_milvus_client(uri, token)
+
+    with __lock:
+        if (uri, token) not in __residency_managers:
+            __residency_managers[(uri, token)] = CollectionResidencyManager(client, memory_budget_bytes=memory_budget_bytes)
+
+        return __residency_managers[(uri, token)]
+
+
+def get_async_milvus_client(uri: str, token: str) -> AsyncMilvusClient:
+    """
+    Get the async Milvus client connected to the server. The client is created once per event loop and shared by all
+    vector databases connected to the same server. It must be called from a coroutine.
+
+    :param uri: URI of the Milvus server
+    :param token: Token used to authenticate to the Milvus server
+    :return: Async Milvus client
+    """
+
+    loop = asyncio.get_running_loop()
+
+    with __lock:
+        clients = __async_clients.setdefault(loop, {})
+        if (uri, token) not in clients:
+            clients[(uri, token)] = AsyncMilvusClient(uri=uri, token=token)
+
+        return clients[(uri, token)]
+
+
+def close_connections() -> None:
+    """
+    Close all synchronous Milvus clients of the process (async clients are closed with their event loops).
+
+    :return: None
+    """
+
+    with __lock:
+        clients = list(__clients.values())
+        __clients.clear()
+        __residency_managers.clear()
+
+    for client in clients:
+        try:
+            client.close()
+        except Exception as e:
+            logging.info(f"Closing Milvus client failed: {e}")
+
+
+atexit.register(close_connections)
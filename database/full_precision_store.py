@@ -0,0 +1,115 @@
+from numpy import ndarray
+import numpy as np
+import os
+import shutil
+import threading
+
+
+class FullPrecisionStore:
+    """
+    On-disk store of the full-precision (float32) embeddings of a collection whose vector field is quantized.
+    Embeddings are appended to a flat float32 file together with the IDs of their rows, and read back through
+    a memory map, so only the embeddings of the rescored candidates are touched.
+
+    :param directory: Directory of the store
+    :param dimension: Dimension of the embedding
+    """
+
+    def __init__(self, directory: str, dimension: int) -> None:
+        self.directory = directory
+        self.dimension = dimension
+        self.__lock = threading.Lock()
+
+        # Memory maps and the sorted IDs, created lazily and dropped after every append
+        self.__embeddings = None
+        self.__sorted_ids = None
+        self.__order = None
+
+        os.makedirs(directory, exist_ok=True)
+
+
+    def append(self, ids: list, embeddings: ndarray) -> None:
+        """
+        Append the embeddings of the rows.
+
+        :param ids: IDs of the rows
+        :param embeddings: 2D array of embeddings of the rows
+        :return: None
+        """
+
+        ids = np.asarray(ids, dtype=np.int64)
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32).reshape(len(ids), self.dimension)
+
+        with self.__lock:
+            # Embeddings are written first, so an interrupted append never leaves IDs without embeddings
+            with open(os.path.join(self.directory, "embeddings.f32"), "ab") as file:
+                file.write(embeddings.tobytes())
+            with open(os.path.join(self.directory, "ids.i64"), "ab") as file:
+                file.write(ids.tobytes())
+
+            self.__embeddings = None
+            self.__sorted_ids = None
+            self.__order = None
+
+
+    def get(self, ids: list) -> tuple:
+        """
+        Get the embeddings of the rows.
+
+        :param ids: IDs of the rows
+        :return: Tuple of a 2D float32 array of embeddings (rows of missing IDs are zeros) and a boolean array
+                 marking the IDs found in the store
+        """
+
+        ids = np.asarray(ids, dtype=np.int64)
+        result = np.zeros((len(ids), self.dimension), dtype=np.float32)
+
+        with self.__lock:
+            self.__open()
+            if self.__sorted_ids is None or len(self.__sorted_ids) == 0:
+                return result, np.zeros(len(ids), dtype=bool)
+
+            positions = np.minimum(np.searchsorted(self.__sorted_ids, ids), len(self.__sorted_ids) - 1)
+            found = self.__sorted_ids[positions] == ids
+            # The last appended embedding of an ID wins
+            result[found] = self.__embeddings[self.__order[positions[found]]]
+
+        return result, found
+
+
+    def remove(self) -> None:
+        """
+        Remove the store from the disk.
+
+        :return: None
+        """
+
+        with self.__lock:
+            self.__embeddings = None
+            self.__sorted_ids = None
+            self.__order = None
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+    def __open(self) -> None:
+        """
+        Open the memory map of the embeddings and sort the IDs (if not done since the last append).
+
+        :return: None
+        """
+
+        if self.__sorted_ids is not None:
+            return
+
+        ids_path = os.path.join(self.directory, "ids.i64")
+        if not os.path.isfile(ids_path) or os.path.getsize(ids_path) == 0:
+            return
+
+        ids = np.fromfile(ids_path, dtype=np.int64)
+        self.__embeddings = np.memmap(os.path.join(self.directory, "embeddings.f32"), dtype=np.float32, mode="r",
+                                      shape=(len(ids), self.dimension))
+
+        # Stable sort of the reversed IDs, so the last occurrence of a duplicated ID comes first
+        reversed_order = np.argsort(ids[::-1], kind="stable")
+        self.__order = len(ids) - 1 - reversed_order
+        self.__sorted_ids = ids[self.__order]
@@ -0,0 +1,96 @@
+import math
+
+
+# Collections with fewer rows are searched by brute force in auto mode
+AUTO_FLAT_MAX_ROWS = 20_000
+
+# Collections with fewer rows (and more than AUTO_FLAT_MAX_ROWS) use HNSW in auto mode, bigger ones use IVF
+AUTO_HNSW_MAX_ROWS = 2_000_000
+
+
+# Default build and search parameters of the supported index types
+DEFAULT_INDEX_PARAMS = {
+    "FLAT": ({}, {}),
+    "HNSW": ({"M": 16, "efConstruction": 200}, {"ef": 64}),
+    "IVF_FLAT": ({"nlist": 1024}, {"nprobe": 16}),
+    "IVF_SQ8": ({"nlist": 1024}, {"nprobe": 16}),
+    "IVF_PQ": ({"nlist": 1024, "m": 8, "nbits": 8}, {"nprobe": 16}),
+    "DISKANN": ({}, {"search_list": 100}),
+    "BIN_FLAT": ({}, {}),
+    "BIN_IVF_FLAT": ({"nlist": 1024}, {"nprobe": 16}),
+}
+
+
+def get_index_params(index_type: str, build_params: dict = None, search_params: dict = None) -> tuple:
+    """
+    Get the build and search parameters of the index, filling the missing ones with the defaults of the index type.
+
+    :param index_type: Type of the index (e.g. "FLAT", "HNSW", "IVF_FLAT")
+    :param build_params: Build parameters overriding the defaults
+    :param search_params: Search parameters overriding the defaults
+    :return: Tuple of the build and search parameters
+    """
+
+    if index_type not in DEFAULT_INDEX_PARAMS:
+        raise ValueError(f"Unsupported index type: {index_type}. Please use one of {list(DEFAULT_INDEX_PARAMS)} or AUTO.")
+
+    default_build_params, default_search_params = DEFAULT_INDEX_PARAMS[index_type]
+    return {**default_build_params, **(build_params or {})}, {**default_search_params, **(search_params or {})}
+
+
+def select_index(row_count: int) -> tuple:
+    """
+    Select the index for a collection of the given size. Small collections are searched by brute force (exact and
+    cheap to build), medium ones use HNSW and big ones use IVF with the number of clusters growing with the square root
+    of the row count.
+
+    :param row_count: Number of rows in the collection
+    :return: Tuple of the index type, the build parameters and the search parameters
+    """
+
+    if row_count < AUTO_FLAT_MAX_ROWS:
+        return "FLAT", {}, {}
+
+    if row_count < AUTO_HNSW_MAX_ROWS:
+        build_params, search_params = get_index_params("HNSW")
+        return "HNSW", build_params, search_params
+
+    nlist = min(65536, max(1024, int(4 * math.sqrt(row_count))))
+    build_params, search_params = get_index_params("IVF_FLAT", {"nlist": nlist}, {"nprobe": max(16, nlist // 64)})
+    return "IVF_FLAT", build_params, search_params
+
+
+def estimate_index_memory(index_type: str, row_count: int, dimension: int, build_params: dict) -> int:
+    """
+    Estimate the memory used by the loaded index (Milvus does not report it per collection).
+
+    :param index_type: Type of the index
+    :param row_count: Number of rows in the collection
+    :param dimension: Embedding dimension
+    :param build_params: Build parameters of the index
+    :return: Estimated memory in bytes
+    """
+
+    vectors_bytes = row_count * dimension * 4
+
+    match index_type:
+        case "FLAT":
+            return vectors_bytes
+        case "HNSW":
+            # Neighbour lists: 2 * M links on the base layer, about 1 / (M - 1) of that on the upper layers
+            m = build_params.get("M", 16)
+            return vectors_bytes + int(row_count * 2 * m * 4 * (1 + 1 / max(1, m - 1)))
+        case "IVF_FLAT":
+            return vectors_bytes + build_params.get("nlist", 1024) * dimension * 4 + row_count * 8
+        case "IVF_SQ8":
+            return row_count * dimension + build_params.get("nlist", 1024) * dimension * 4 + row_count * 8
+        case "IVF_PQ":
+            codes_bytes = row_count * build_params.get("m", 8) * build_params.get("nbits", 8) // 8
+            return codes_bytes + build_params.get("nlist", 1024) * dimension * 4 + row_count * 8
+        case "BIN_FLAT":
+            return row_count * dimension // 8
+        case "BIN_IVF_FLAT":
+            return row_count * dimension // 8 + build_params.get("nlist", 1024) * dimension // 8 + row_count * 8
+        case _:
+            # DISKANN keeps the full vectors on disk and only compressed ones in memory
+            return row_count * dimension // 4
@@ -0,0 +1,145 @@
+from typing import Sequence
+from collections import Counter
+from numpy import ndarray
+import numpy as np
+import re
+
+
+# Tokens are runs of word characters, which may be joined by ".", "-", "/" or ":" (e.g. "4.2.1", "A-113", "ISO/IEC")
+__TOKEN_PATTERN = re.compile(r"\w+(?:[.\-/:]\w+)*")
+
+
+def tokenize_text(text: str) -> list:
+    """
+    Split the text into lowercase lexical tokens. Identifiers like part numbers and clause IDs are kept whole,
+    so they can be matched exactly.
+
+    :param text: Text to be tokenized
+    :return: List of tokens
+    """
+
+    return __TOKEN_PATTERN.findall(text.lower())
+
+
+class LexicalIndex:
+    """
+    In-process BM25 inverted index of the texts of a collection. Document IDs are the positions of the texts in the order
+    they were added (the same as the row IDs of the NumPy collection).
+    Postings are kept in compact arrays (compressed sparse rows: the document IDs and the term frequencies of every
+    term are contiguous slices), so a query term is scored by a single vectorized operation over its postings.
+    Postings of the added texts are collected separately and merged into the arrays by the next search.
+
+    :param k1: Term frequency saturation of BM25
+    :param b: Document length normalization of BM25
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self.size = 0
+        self.__terms = {}
+        self.__document_lengths = np.zeros(0, dtype=np.float32)
+
+        # Compact postings: postings of term t are at offsets[t]:offsets[t + 1]
+        self.__offsets = np.zeros(1, dtype=np.int64)
+        self.__document_ids = np.zeros(0, dtype=np.int32)
+        self.__term_frequencies = np.zeros(0, dtype=np.float32)
+
+        # Postings of the added texts not merged yet (term IDs, document IDs and term frequencies)
+        self.__pending = []
+
+
+    def add(self, texts: Sequence) -> None:
+        """
+        Add texts to the index (their document IDs continue after the last added text).
+
+        :param texts: Sequence of texts
+        :return: None
+        """
+
+        term_ids, document_ids, term_frequencies = [], [], []
+        lengths = np.zeros(len(texts), dtype=np.float32)
+
+        for i, text in enumerate(texts):
+            tokens = tokenize_text(text)
+            lengths[i] = len(tokens)
+            for term, frequency in Counter(tokens).items():
+                term_ids.append(self.__terms.setdefault(term, len(self.__terms)))
+                document_ids.append(self.size + i)
+                term_frequencies.append(frequency)
+
+        self.__pending.append((np.asarray(term_ids, dtype=np.int64), np.asarray(document_ids, dtype=np.int32),
+                               np.asarray(term_frequencies, dtype=np.float32)))
+        self.__document_lengths = np.concatenate([self.__document_lengths, lengths])
+        self.size += len(texts)
+
+
+    def search(self, queries: Sequence, limit: int, deleted: ndarray = None) -> list:
+        """
+        Find the documents with the highest BM25 scores for the queries. Only documents containing at least one
+        query term are returned.
+
+        :param queries: Sequence of query texts
+        :param limit: Number of results per query
+        :param deleted: Boolean array marking the deleted documents (optional)
+        :return: List (one item per query) of tuples of the document IDs and their scores (descending)
+        """
+
+        self.__merge()
+
+        if self.size == 0 or limit <= 0:
+            return [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)) for _ in queries]
+
+        average_length = max(float(self.__document_lengths.mean()), 1e-6)
+        length_norms = self.k1 * (1 - self.b + self.b * self.__document_lengths / average_length)
+
+        results = []
+        for query in queries:
+            scores = np.zeros(self.size, dtype=np.float32)
+            for term in set(tokenize_text(query)):
+                term_id = self.__terms.get(term)
+                if term_id is None:
+                    continue
+
+                start, end = self.__offsets[term_id], self.__offsets[term_id + 1]
+                documents = self.__document_ids[start:end]
+                frequencies = self.__term_frequencies[start:end]
+
+                idf = np.log1p((self.size - len(documents) + 0.5) / (len(documents) + 0.5))
+                # Every document occurs once in the postings of a term, so the fancy-indexed addition is safe
+                scores[documents] += idf * frequencies * (self.k1 + 1) / (frequencies + length_norms[documents])
+
+            if deleted is not None:
+                scores[deleted[:self.size]] = 0
+
+            # Partial selection among the matching documents only
+            candidates = np.flatnonzero(scores > 0)
+            if len(candidates) > limit:
+                candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+            candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+            results.append((candidates, scores[candidates]))
+
+        return results
+
+
+    def __merge(self) -> None:
+        """
+        Merge the pending postings into the compact postings arrays.
+
+        :return: None
+        """
+
+        if not self.__pending:
+            return
+
+        # Expand the compact postings back to term IDs and sort everything by the term (stable, so documents stay sorted)
+        term_ids = np.concatenate([np.repeat(np.arange(len(self.__offsets) - 1), np.diff(self.__offsets))]
+                                  + [pending[0] for pending in self.__pending])
+        document_ids = np.concatenate([self.__document_ids] + [pending[1] for pending in self.__pending])
+        term_frequencies = np.concatenate([self.__term_frequencies] + [pending[2] for pending in self.__pending])
+
+        order = np.argsort(term_ids, kind="stable")
+        self.__document_ids = document_ids[order]
+        self.__term_frequencies = term_frequencies[order]
+        self.__offsets = np.concatenate([[0], np.cumsum(np.bincount(term_ids, minlength=len(self.__terms)))])
+        self.__pending = []
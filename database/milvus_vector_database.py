@@ -0,0 +1,1157 @@
+from pymilvus import MilvusClient, MilvusException, DataType, CollectionSchema, Function, FunctionType
+from database.__vector_database_template import VectorDatabaseTemplate
+from database.connection_pool import get_milvus_client, get_async_milvus_client, get_residency_manager
+from database.index_selection import get_index_params, select_index
+from database.full_precision_store import FullPrecisionStore
+from database.vector_quantization import (check_quantization, encode_vectors, get_quantized_index,
+                                          get_vector_field_type)
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from typing import Iterable, Iterator, Sequence
+from numpy import ndarray
+import numpy as np
+import asyncio
+import json
+import logging
+import os
+import shutil
+import time
+
+
+class MilvusVectorDatabase(VectorDatabaseTemplate):
+    """
+    Milvus vector database storing the fragments of every conversation in a separate collection.
+    Inserts are split into batches which respect the Milvus message size limit, and up to max_inflight_batches
+    batches are sent concurrently while the next ones are being prepared.
+    Clients come from the process-wide connection pool (database.connection_pool), so all vector databases connected
+    to the same server share their connections. The async methods use the async Milvus client of the running event loop.
+    Collections stay loaded between searches and are released by the residency manager only when the memory budget
+    is exceeded (the manager is shared like the client, so the budget covers all vector databases of the process).
+    The index of the embedding field is configurable. In the "AUTO" mode the index type is selected by the row count
+    of the collection (see database.index_selection) and rebuilt when the collection outgrows it after a flush.
+    With the "partition_key" layout, all conversations share a single collection whose conversation_id field is
+    a partition key, so creating and removing a conversation are only deletes, searches are filtered by the
+    conversation, and Milvus does not keep a collection (schema, index, segments) per conversation.
+    The vector field can be quantized (float16, bfloat16, int8 via the IVF_SQ8 index, or binary with the Hamming
+    distance) to reduce the memory of the query nodes. The full-precision embeddings are then kept on the local disk
+    (database.full_precision_store) and rescore_factor times more candidates than requested are re-ranked exactly.
+    With lexical_index, Milvus also indexes the texts for BM25 search: a BM25 function fills a sparse vector field
+    from the analyzed text on insert, so the lexical index is built at ingest time without any client-side work.
+    Searches and queries use the Strong consistency level by default, so they see every completed insert and delete
+    (with the default Bounded level of Milvus, a search right after an insert can miss the new rows, and the retrieval
+    cache would keep the stale results).
+
+    :param backend_name: Name of the vector database backend
+    :param uri: URI of the Milvus server
+    :param token: Token used to authenticate to the Milvus server
+    :param insert_batch_max_bytes: Maximal estimated size of a single insert request
+    :param max_inflight_batches: Maximal number of insert requests sent concurrently
+    :param residency_memory_budget_bytes: Memory budget for the collections kept loaded between searches (shared by
+                                          the vector databases connected to the same server, the first one sets it)
+    :param index_type: Type of the index ("FLAT", "HNSW", "IVF_FLAT", "IVF_SQ8", "IVF_PQ", "DISKANN" or "AUTO")
+    :param index_build_params: Build parameters of the index (e.g. {"M": 16, "efConstruction": 200} for HNSW)
+    :param index_search_params: Search parameters of the index (e.g. {"ef": 64} for HNSW or {"nprobe": 16} for IVF)
+    :param metric_type: Similarity metric
+    :param layout: Storage layout ("collection" for a collection per conversation or "partition_key" for a shared collection)
+    :param shared_collection_name: Name of the shared collection of the "partition_key" layout
+    :param num_partitions: Number of partitions the conversations are hashed into in the "partition_key" layout
+    :param vector_quantization: Quantization of the searched vectors ("none", "float16", "bfloat16", "int8" or "binary")
+    :param rescore_factor: Number of first-pass candidates per requested result rescored with full-precision embeddings
+    :param full_precision_dir: Directory of the full-precision embeddings of the quantized collections
+    :param lexical_index: Whether to index the texts for lexical (BM25) search
+    :param consistency_level: Consistency level of the searches and queries ("Strong", "Session", "Bounded" or "Eventually")
+    :param kwargs: Other database parameters (not used by the database itself, e.g. embedding_dimension)
+    """
+
+    # Error code of the searches of collections which are not loaded (ErrCollectionNotLoaded)
+    __COLLECTION_NOT_LOADED_CODE = 101
+
+
+    def __init__(self, backend_name: str, uri: str = "http://localhost:19530", token: str = "root:Milvus",
+                 insert_batch_max_bytes: int = 16 * 1024 ** 2, max_inflight_batches: int = 2,
+                 residency_memory_budget_bytes: int = 4 * 1024 ** 3, index_type: str = "FLAT",
+                 index_build_params: dict = None, index_search_params: dict = None, metric_type: str = "COSINE",
+                 layout: str = "collection", shared_collection_name: str = "conversations", num_partitions: int = 64,
+                 vector_quantization: str = "none", rescore_factor: int = 4, full_precision_dir: str = ".cache/full_precision",
+                 lexical_index: bool = False, consistency_level: str = "Strong", **kwargs):
+        super().__init__(backend_name)
+        self.uri = uri
+        self.token = token
+        self.client = get_milvus_client(uri, token)
+        self.insert_batch_max_bytes = insert_batch_max_bytes
+        self.max_inflight_batches = max_inflight_batches
+        self.__insert_executor = None
+        self.residency = get_residency_manager(uri, token, memory_budget_bytes=residency_memory_budget_bytes)
+        self.index_type = index_type.upper()
+        self.index_build_params = index_build_params
+        self.index_search_params = index_search_params
+        self.metric_type = metric_type
+
+        self.layout = layout
+        self.shared_collection_name = shared_collection_name
+        self.num_partitions = num_partitions
+
+        if self.layout not in ("collection", "partition_key"):
+            raise ValueError(f"Unsupported layout: {layout}. Please use collection or partition_key.")
+
+        check_quantization(vector_quantization)
+        self.vector_quantization = vector_quantization
+        self.rescore_factor = rescore_factor
+        self.full_precision_dir = full_precision_dir
+        self.lexical_index = lexical_index
+        self.consistency_level = consistency_level
+
+        # Full-precision embeddings of the quantized collections
+        self.__full_precision_stores = {}
+
+        # Type and search parameters of the index of every known collection
+        self.__indexes = {}
+
+
+    def create_collection(self, conversation_id: int, dimension: int) -> None:
+        """
+        This function creates a collection in the vector database. If the collection already exists, it removes it first.
+
+        :param conversation_id: ID of the conversation
+        :param dimension: Dimension of the embedding
+        :return: None
+        """
+
+        collection_name = self.__get_collection_name_by_id(conversation_id)
+
+        if self.layout == "partition_key":
+            # The shared collection is created once, the conversation only has to be empty
+            if not self.client.has_collection(collection_name):
+                self.client.create_collection(collection_name, dimension, schema=self.__create_schema(dimension),
+                                              num_partitions=self.num_partitions)
+                self.__build_index(collection_name, *self.__get_configured_index(row_count=0))
+                self.__build_lexical_index(collection_name)
+            self.remove_collection(conversation_id)
+            return
+
+        # Remove the collection if it already exists
+        if self.client.has_collection(collection_name):
+            self.remove_collection(conversation_id)
+
+        self.client.create_collection(collection_name, dimension, schema=self.__create_schema(dimension))
+        self.__build_index(collection_name, *self.__get_configured_index(row_count=0))
+        self.__build_lexical_index(collection_name)
+
+
+    def __get_collection_name_by_id(self, conversation_id: int) -> str:
+        """
+        This function generates a collection name based on the conversation ID.
+
+        :param conversation_id: ID of the conversation
+        :return: Collection name
+        """
+
+        if self.layout == "partition_key":
+            return self.shared_collection_name
+
+        return f"conversation_{conversation_id}"
+
+
+    def __get_conversation_filter(self, conversation_id: int, expression: str = "") -> str:
+        """
+        This function generates a filter expression selecting the rows of the conversation (in the "partition_key" layout,
+        where the rows of all conversations are in the same collection).
+
+        :param conversation_id: ID of the conversation
+        :param expression: Filter expression to be combined with the conversation filter
+        :return: Filter expression
+        """
+
+        if self.layout != "partition_key":
+            return expression
+
+        conversation_filter = f"conversation_id == {int(conversation_id)}"
+        return f"{conversation_filter} and ({expression})" if expression else conversation_filter
+
+
+    def __create_schema(self, dimension: int) -> CollectionSchema:
+        """
+        This function creates a schema for the collection.
+
+        :param dimension: Dimension of the embedding
+        :return: Collection schema
+        """
+
+        schema = MilvusClient.create_schema()
+
+        # Add fields to the schema
+        schema.add_field("id", datatype=DataType.INT64, is_primary=True, auto_id=True)
+        if self.layout == "partition_key":
+            schema.add_field("conversation_id", datatype=DataType.INT64, is_partition_key=True)
+        schema.add_field("embedding", datatype=get_vector_field_type(self.vector_quantization), dim=dimension)
+        schema.add_field("text", datatype=DataType.VARCHAR, max_length=65535, enable_analyzer=self.lexical_index)
+        # Fragment metadata of the incremental ingestion (empty for rows inserted without it)
+        schema.add_field("fingerprint", datatype=DataType.VARCHAR, max_length=64, default_value="")
+        schema.add_field("document_id", datatype=DataType.VARCHAR, max_length=64, default_value="")
+
+        # BM25 sparse vectors computed by Milvus from the text
+        if self.lexical_index:
+            schema.add_field("sparse_embedding", datatype=DataType.SPARSE_FLOAT_VECTOR)
+            schema.add_function(Function(
+                name="text_bm25",
+                function_type=FunctionType.BM25,
+                input_field_names=["text"],
+                output_field_names=["sparse_embedding"],
+            ))
+
+        return schema
+
+
+    def __create_index(self, index_type: str, build_params: dict):
+        """
+        This function creates an index for the embedding field in the collection.
+
+        :param index_type: Type of the index
+        :param build_params: Build parameters of the index
+        :return: Index parameters for the embedding field
+        """
+
+        # Binary vectors are compared by the Hamming distance
+        _, _, _, metric_type = get_quantized_index(self.vector_quantization, index_type, build_params, {}, self.metric_type)
+
+        # Create an index for the embedding field
+        index_params = self.client.prepare_index_params()
+        index_params.add_index(
+            field_name="embedding",
+            index_name="embedding",
+            index_type=index_type,
+            metric_type=metric_type,
+            params=build_params,
+        )
+
+        return index_params
+
+
+    def __get_configured_index(self, row_count: int) -> tuple:
+        """
+        This function gets the configured index (or selects it by the row count in the AUTO mode).
+
+        :param row_count: Number of rows in the collection
+        :return: Tuple of the index type, the build parameters and the search parameters
+        """
+
+        if self.index_type == "AUTO":
+            index_type, build_params, search_params = select_index(row_count)
+        else:
+            index_type = self.index_type
+            build_params, search_params = get_index_params(self.index_type, self.index_build_params, self.index_search_params)
+
+        # Quantized vectors may need another index type
+        index_type, build_params, search_params, _ = get_quantized_index(self.vector_quantization, index_type,
+                                                                          build_params, search_params, self.metric_type)
+        return index_type, build_params, search_params
+
+
+    def __build_index(self, collection_name: str, index_type: str, build_params: dict, search_params: dict) -> None:
+        """
+        This function creates the index of the embedding field and remembers its search parameters.
+
+        :param collection_name: Name of the collection
+        :param index_type: Type of the index
+        :param build_params: Build parameters of the index
+        :param search_params: Search parameters of the index
+        :return: None
+        """
+
+        self.client.create_index(collection_name, index_params=self.__create_index(index_type, build_params))
+        self.__indexes[collection_name] = (index_type, search_params)
+
+
+    def __build_lexical_index(self, collection_name: str) -> None:
+        """
+        This function creates the BM25 index of the sparse vector field (if the texts are indexed for lexical search).
+        It is not affected by the AUTO mode, so it is never rebuilt.
+
+        :param collection_name: Name of the collection
+        :return: None
+        """
+
+        if not self.lexical_index:
+            return
+
+        index_params = self.client.prepare_index_params()
+        index_params.add_index(
+            field_name="sparse_embedding",
+            index_name="sparse_embedding",
+            index_type="SPARSE_INVERTED_INDEX",
+            metric_type="BM25",
+        )
+        self.client.create_index(collection_name, index_params=index_params)
+
+
+    def __get_index(self, collection_name: str) -> tuple:
+        """
+        This function gets the type and the search parameters of the index of the collection.
+
+        :param collection_name: Name of the collection
+        :return: Tuple of the index type and the search parameters
+        """
+
+        if collection_name not in self.__indexes:
+            # Collection created by another client, so read its index type from the server
+            index_type = self.client.describe_index(collection_name, "embedding")["index_type"]
+            if self.index_type == "AUTO" or index_type != self.__get_configured_index(row_count=0)[0]:
+                _, search_params = get_index_params(index_type)
+            else:
+                _, search_params = get_index_params(index_type, search_params=self.index_search_params)
+            self.__indexes[collection_name] = (index_type, search_params)
+
+        return self.__indexes[collection_name]
+
+
+    def __update_auto_index(self, collection_name: str) -> None:
+        """
+        This function rebuilds the index of the collection if the AUTO mode selects another index type for its
+        current row count. The collection is released for the rebuild and loaded again by the next search.
+
+        :param collection_name: Name of the collection
+        :return: None
+        """
+
+        if self.index_type != "AUTO":
+            return
+
+        row_count = int(self.client.get_collection_stats(collection_name).get("row_count", 0))
+        index_type, build_params, search_params = self.__get_configured_index(row_count)
+        current_index_type, _ = self.__get_index(collection_name)
+
+        if index_type == current_index_type:
+            return
+
+        logging.info(f"Rebuilding the index of {collection_name} ({row_count} rows): {current_index_type} -> {index_type}.")
+
+        self.residency.forget(collection_name)
+        self.client.release_collection(collection_name)
+        self.client.drop_index(collection_name, "embedding")
+        self.__build_index(collection_name, index_type, build_params, search_params)
+
+
+    def __flush(self, collection_name: str) -> None:
+        """
+        This function flushes the collection and updates its index in the AUTO mode.
+
+        :param collection_name: Name of the collection
+        :return: None
+        """
+
+        self.client.flush(collection_name)
+        self.__update_auto_index(collection_name)
+
+
+    def remove_collection(self, conversation_id: int) -> None:
+        """
+        This function removes a collection from the vector database.
+
+        :param conversation_id: ID of the conversation
+        :return: None
+        """
+
+        collection_name = self.__get_collection_name_by_id(conversation_id)
+
+        # Full-precision embeddings of the conversation (even if they were stored by another client)
+        directory = self.__get_full_precision_directory(conversation_id)
+        store = self.__full_precision_stores.pop(directory, None)
+        if store is not None:
+            store.remove()
+        else:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        if self.layout == "partition_key":
+            # Deleting the rows of a single partition key is cheap, the shared collection stays loaded
+            if self.client.has_collection(collection_name):
+                self.client.delete(collection_name, filter=self.__get_conversation_filter(conversation_id))
+            return
+
+        self.residency.forget(collection_name)
+        self.__indexes.pop(collection_name, None)
+
+        if self.client.has_collection(collection_name):
+            self.client.drop_collection(collection_name)
+        else:
+            return
+
+
+    def has_collection(self, conversation_id: int) -> bool:
+        """
+        This function checks if a collection exists in the vector database.
+
+        :param conversation_id: ID of the conversation
+        :return: True if the collection exists, False otherwise
+        """
+
+        collection_name = self.__get_collection_name_by_id(conversation_id)
+
+        if self.layout == "partition_key":
+            # A conversation exists in the shared collection as long as it has rows
+            if not self.client.has_collection(collection_name):
+                return False
+            with self.residency.pinned(collection_name):
+                return len(self.client.query(collection_name, filter=self.__get_conversation_filter(conversation_id),
+                                             output_fields=["id"], limit=1,
+                                             consistency_level=self.consistency_level)) > 0
+
+        return self.client.has_collection(collection_name)
+
+
+    def has_field(self, conversation_id: int, field_name: str) -> bool:
+        """
+        This function checks if the collection has a field (collections created by older versions may lack some fields).
+
+        :param conversation_id: ID of the conversation
+        :param field_name: Name of the field
+        :return: True if the collection has the field, False otherwise
+        """
+
+        collection_name = self.__get_collection_name_by_id(conversation_id)
+        description = self.client.describe_collection(collection_name)
+        return any(field["name"] == field_name for field in description["fields"])
+
+
+    def get_fingerprints(self, conversation_id: int, document_id: str) -> dict:
+        """
+        This function gets the fingerprints of the fragments of a document stored in the collection.
+
+        :param conversation_id: ID of the conversation
+        :param document_id: ID of the document
+        :return: Dictionary mapping fingerprints to the lists of IDs of the rows having them
+        """
+
+        collection_name = self.__get_collection_name_by_id(conversation_id)
+
+        fingerprints = {}
+        document_filter = f"document_id == {json.dumps(document_id)}"
+        with self.residency.pinned(collection_name):
+            iterator = self.client.query_iterator(collection_name, batch_size=4096,
+                                                  filter=self.__get_conversation_filter(conversation_id, document_filter),
+                                                  output_fields=["fingerprint"],
+                                                  consistency_level=self.consistency_level)
+            while True:
+                rows = iterator.next()
+                if not rows:
+                    iterator.close()
+                    break
+                for row in rows:
+                    fingerprints.setdefault(row["fingerprint"], []).append(row["id"])
+
+        return fingerprints
+
+
+    def delete_data(self, conversation_id: int, ids: list) -> None:
+        """
+        This function deletes rows from the collection.
+
+        :param conversation_id: ID of the conversation
+        :param ids: IDs of the rows to be deleted
+        :return: None
+        """
+
+        if not ids:
+            return
+
+        collection_name = self.__get_collection_name_by_id(conversation_id)
+        self.client.delete(collection_name, ids=ids)
+
+
+    def insert_data(self, conversation_id: int, data: list, flush: bool = True):
+        """
+        This function inserts data into the vector database.
+
+        :param conversation_id: ID of the conversation
+        :param data: Data to be inserted (list of rows)
+        :param flush: Whether to flush the collection after inserting
+        """
+
+        collection_name = self.__get_collection_name_by_id(conversation_id)
+        if self.layout == "partition_key":
+            data = ({**row, "conversation_id": conversation_id} for row in data)
+        self.__insert_batches(conversation_id, self.__split_rows_into_batches(data))
+        self.residency.invalidate_footprint(collection_name)
+
+        if flush:
+            self.__flush(collection_name)
+
+
+    def insert_columns(self, conversation_id: int, embeddings: ndarray, texts: Sequence, fingerprints: Sequence = None,
+                       flush: bool = False, document_id: str = None) -> int:
+        """
+        This function inserts columnar data into the vector database. The embedding matrix and the text column are split
+        into batches, and the rows of a batch are only created right before the batch is sent.
+        Flushing is optional, so many inserts can be followed by a single flush (unflushed data is searchable too,
+        as long as the searches use the Strong or Session consistency level).
+
+        :param conversation_id: ID of the conversation
+        :param embeddings: 2D array of embeddings
+        :param texts: Sequence of texts corresponding to the embeddings (list or Chunks)
+        :param fingerprints: Sequence of fingerprints corresponding to the embeddings (optional)
+        :param flush: Whether to flush the collection after inserting
+        :param document_id: ID of the document the rows belong to (optional)
+        :return: Number of inserted rows
+        """
+
+        if len(embeddings) != len(texts) or (fingerprints is not None and len(fingerprints) != len(texts)):
+            raise ValueError("Embeddings, texts and fingerprints must have the same length.")
+
+        collection_name = self.__get_collection_name_by_id(conversation_id)
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(texts), -1)
+
+        self.__insert_batches(conversation_id, self.__split_columns_into_batches(conversation_id, embeddings, texts,
+                                                                                 fingerprints, document_id))
+        self.residency.invalidate_footprint(collection_name)
+
+        if flush:
+            self.__flush(collection_name)
+
+        return len(texts)
+
+
+    def flush(self, conversation_id: int) -> None:
+        """
+        This function flushes the inserted data of the collection (seals the segments and persists them).
+
+        :param conversation_id: ID of the conversation
+        :return: None
+        """
+
+        collection_name = self.__get_collection_name_by_id(conversation_id)
+        self.__flush(collection_name)
+
+
+    def get_index_info(self, conversation_id: int) -> dict:
+        """
+        This function returns the index of the embedding field of the collection.
+
+        :param conversation_id: ID of the conversation
+        :return: Dictionary with the index type, the search parameters and the number of rows waiting to be indexed
+        """
+
+        collection_name = self.__get_collection_name_by_id(conversation_id)
+        index_type, search_params = self.__get_index(collection_name)
+        description = self.client.describe_index(collection_name, "embedding")
+
+        return {
+            "index_type": index_type,
+            "search_params": search_params,
+            "pending_index_rows": int(description.get("pending_index_rows", 0)),
+        }
+
+
+    def wait_for_index(self, conversation_id: int, poll_seconds: float = 0.5, timeout: float = None) -> None:
+        """
+        This function waits until all flushed rows of the collection are indexed.
+
+        :param conversation_id: ID of the conversation
+        :param poll_seconds: Time between the checks of the index state
+        :param timeout: Maximal waiting time in seconds (None to wait indefinitely)
+        :return: None
+        """
+
+        deadline = time.monotonic() + timeout if timeout is not None else None
+
+        while self.get_index_info(conversation_id)["pending_index_rows"] > 0:
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"Index of conversation {conversation_id} was not built in {timeout} seconds.")
+            time.sleep(poll_seconds)
+
+
+    def __insert_batches(self, conversation_id: int, batches: Iterator) -> None:
+        """
+        This function sends the batches of rows to the collection, with up to max_inflight_batches requests in flight.
+
+        :param conversation_id: ID of the conversation
+        :param batches: Iterator of tuples of lists of rows and 2D arrays of their full-precision embeddings
+        :return: None
+        """
+
+        collection_name = self.__get_collection_name_by_id(conversation_id)
+
+        if self.__insert_executor is None:
+            self.__insert_executor = ThreadPoolExecutor(max_workers=self.max_inflight_batches,
+                                                        thread_name_prefix="vector-database-insert")
+
+        pending = deque()
+        for rows, embeddings in batches:
+            # Wait for the oldest request before sending more than allowed
+            if len(pending) >= self.max_inflight_batches:
+                request, request_embeddings = pending.popleft()
+                self.__store_full_precision(conversation_id, request.result(), request_embeddings)
+            pending.append((self.__insert_executor.submit(self.client.insert, collection_name, data=rows), embeddings))
+
+        while pending:
+            request, request_embeddings = pending.popleft()
+            self.__store_full_precision(conversation_id, request.result(), request_embeddings)
+
+
+    async def __a_store_full_precision(self, conversation_id: int, insert_request, embeddings: ndarray) -> None:
+        """
+        This function waits for the async insert request and stores the full-precision embeddings of the inserted rows.
+
+        :param conversation_id: ID of the conversation
+        :param insert_request: Task of the insert request
+        :param embeddings: 2D array of the full-precision embeddings of the inserted rows
+        :return: None
+        """
+
+        result = await insert_request
+
+        if self.vector_quantization != "none":
+            await asyncio.to_thread(self.__store_full_precision, conversation_id, result, embeddings)
+
+
+    def __store_full_precision(self, conversation_id: int, insert_result: dict, embeddings: ndarray) -> None:
+        """
+        This function stores the full-precision embeddings of the inserted rows (if the vectors are quantized).
+
+        :param conversation_id: ID of the conversation
+        :param insert_result: Result of the insert request (with the IDs of the inserted rows)
+        :param embeddings: 2D array of the full-precision embeddings of the inserted rows
+        :return: None
+        """
+
+        if self.vector_quantization != "none":
+            self.__get_full_precision_store(conversation_id).append(insert_result["ids"], embeddings)
+
+
+    def __get_full_precision_store(self, conversation_id: int) -> FullPrecisionStore:
+        """
+        This function gets the store of the full-precision embeddings of the conversation.
+
+        :param conversation_id: ID of the conversation
+        :return: Full-precision store
+        """
+
+        directory = self.__get_full_precision_directory(conversation_id)
+        if directory not in self.__full_precision_stores:
+            dimension = self.__get_dimension(self.__get_collection_name_by_id(conversation_id))
+            self.__full_precision_stores[directory] = FullPrecisionStore(directory, dimension)
+
+        return self.__full_precision_stores[directory]
+
+
+    def __get_full_precision_directory(self, conversation_id: int) -> str:
+        """
+        This function gets the directory of the full-precision embeddings of the conversation. Every conversation has
+        its own store (also in the "partition_key" layout), so removing a conversation removes its embeddings.
+
+        :param conversation_id: ID of the conversation
+        :return: Directory of the full-precision store
+        """
+
+        collection_name = self.__get_collection_name_by_id(conversation_id)
+
+        if self.layout == "partition_key":
+            return os.path.join(self.full_precision_dir, collection_name, f"conversation_{conversation_id}")
+
+        return os.path.join(self.full_precision_dir, collection_name)
+
+
+    def __get_dimension(self, collection_name: str) -> int:
+        """
+        This function gets the dimension of the embedding field of the collection.
+
+        :param collection_name: Name of the collection
+        :return: Dimension of the embedding
+        """
+
+        description = self.client.describe_collection(collection_name)
+        for field in description["fields"]:
+            if field["name"] == "embedding":
+                return int(field["params"]["dim"])
+
+        raise ValueError(f"Collection {collection_name} has no embedding field.")
+
+
+    def __split_rows_into_batches(self, data: Iterable) -> Iterator:
+        """
+        This function splits the rows into batches of at most insert_batch_max_bytes (estimated).
+
+        :param data: Iterable of rows
+        :return: Generator of tuples of lists of rows and 2D arrays of their full-precision embeddings
+        """
+
+        batch, batch_size = [], 0
+        for row in data:
+            row_size = sum(self.__estimate_size(value) for value in row.values())
+            if batch and batch_size + row_size > self.insert_batch_max_bytes:
+                yield self.__quantize_rows(batch)
+                batch, batch_size = [], 0
+            batch.append(row)
+            batch_size += row_size
+
+        if batch:
+            yield self.__quantize_rows(batch)
+
+
+    def __quantize_rows(self, rows: list) -> tuple:
+        """
+        This function converts the embeddings of the rows to the format of the (quantized) vector field.
+
+        :param rows: List of rows
+        :return: Tuple of the list of converted rows and the 2D array of their full-precision embeddings
+        """
+
+        if self.vector_quantization == "none":
+            return rows, None
+
+        embeddings = np.asarray([row["embedding"] for row in rows], dtype=np.float32)
+        vectors = encode_vectors(self.vector_quantization, embeddings)
+        return [{**row, "embedding": vector} for row, vector in zip(rows, vectors)], embeddings
+
+
+    def __split_columns_into_batches(self, conversation_id: int, embeddings: ndarray, texts: Sequence,
+                                     fingerprints: Sequence, document_id: str = None) -> Iterator:
+        """
+        This function splits the columns into batches of rows of at most insert_batch_max_bytes (estimated).
+
+        :param conversation_id: ID of the conversation
+        :param embeddings: 2D array of embeddings
+        :param texts: Sequence of texts
+        :param fingerprints: Sequence of fingerprints (optional)
+        :param document_id: ID of the document of all rows (optional)
+        :return: Generator of tuples of lists of rows and 2D arrays of their full-precision embeddings
+        """
+
+        # Fields with the same value in every row
+        extra_fields = {"conversation_id": conversation_id} if self.layout == "partition_key" else {}
+        if document_id is not None:
+            extra_fields["document_id"] = document_id
+        row_overhead = (embeddings.shape[1] * embeddings.itemsize + (64 if fingerprints is not None else 0)
+                        + sum(self.__estimate_size(value) for value in extra_fields.values()))
+
+        start, batch_texts, batch_size = 0, [], 0
+        for text in texts:
+            row_size = row_overhead + self.__estimate_size(text)
+            if batch_texts and batch_size + row_size > self.insert_batch_max_bytes:
+                yield self.__create_rows(embeddings, batch_texts, fingerprints, start, extra_fields)
+                start, batch_texts, batch_size = start + len(batch_texts), [], 0
+            batch_texts.append(text)
+            batch_size += row_size
+
+        if batch_texts:
+            yield self.__create_rows(embeddings, batch_texts, fingerprints, start, extra_fields)
+
+
+    def __create_rows(self, embeddings: ndarray, texts: list, fingerprints: Sequence, start: int, extra_fields: dict) -> tuple:
+        """
+        This function creates the rows of a batch starting at the given position of the columns.
+
+        :param embeddings: 2D array of all embeddings
+        :param texts: List of texts of the batch
+        :param fingerprints: Sequence of all fingerprints (optional)
+        :param start: Position of the first row of the batch
+        :param extra_fields: Fields with the same value in every row (e.g. the conversation ID)
+        :return: Tuple of the list of rows and the 2D array of their full-precision embeddings
+        """
+
+        # Convert the whole block of embeddings at once
+        block = embeddings[start:start + len(texts)]
+        vectors = encode_vectors(self.vector_quantization, block)
+
+        if fingerprints is None:
+            rows = [{"embedding": vector, "text": text, **extra_fields} for vector, text in zip(vectors, texts)]
+        else:
+            rows = [
+                {"embedding": vector, "text": text, "fingerprint": fingerprint, **extra_fields}
+                for vector, text, fingerprint in zip(vectors, texts, fingerprints[start:start + len(texts)])
+            ]
+
+        return rows, block if self.vector_quantization != "none" else None
+
+
+    @staticmethod
+    def __estimate_size(value) -> int:
+        """
+        This function estimates the serialized size of a value.
+
+        :param value: Value of a field
+        :return: Estimated size in bytes
+        """
+
+        if isinstance(value, str):
+            return len(value) if value.isascii() else len(value.encode("utf-8"))
+        if isinstance(value, (list, tuple, ndarray)):
+            return 4 * len(value)
+        return 8
+
+
+    def search(self, conversation_id: int, query_embedding: list, limit: int = 5, include_embeddings: bool = False):
+        """
+        This function searches for similar data in the vector database.
+
+        :param conversation_id: ID of the conversation
+        :param query_embedding: Query embedding to search for
+        :param limit: Number of results per query
+        :param include_embeddings: Whether to return the embeddings of the hits (as entity["embedding"])
+        :return: Search results
+        """
+
+        collection_name = self.__get_collection_name_by_id(conversation_id)
+        _, index_search_params = self.__get_index(collection_name)
+        queries, request = self.__create_search_request(conversation_id, query_embedding, index_search_params, limit,
+                                                        include_embeddings)
+
+        results = self.__search_collection(collection_name, request)
+
+        return self.__rescore(conversation_id, queries, results, limit, include_embeddings)
+
+
+    async def a_search(self, conversation_id: int, query_embedding: list, limit: int = 5,
+                       include_embeddings: bool = False):
+        """
+        This function asynchronously searches for similar data in the vector database.
+
+        :param conversation_id: ID of the conversation
+        :param query_embedding: Query embedding to search for
+        :param limit: Number of results per query
+        :param include_embeddings: Whether to return the embeddings of the hits (as entity["embedding"])
+        :return: Search results
+        """
+
+        collection_name = self.__get_collection_name_by_id(conversation_id)
+        if collection_name in self.__indexes:
+            _, index_search_params = self.__indexes[collection_name]
+        else:
+            _, index_search_params = await asyncio.to_thread(self.__get_index, collection_name)
+        queries, request = self.__create_search_request(conversation_id, query_embedding, index_search_params, limit,
+                                                        include_embeddings)
+
+        results = await self.__a_search_collection(collection_name, request)
+
+        if self.vector_quantization == "none":
+            return results
+
+        # Rescoring reads the full-precision embeddings from the disk
+        return await asyncio.to_thread(self.__rescore, conversation_id, queries, results, limit, include_embeddings)
+
+
+    def search_text(self, conversation_id: int, queries: list, limit: int = 5, include_embeddings: bool = False):
+        """
+        This function searches for the fragments with the highest BM25 scores for the query texts.
+
+        :param conversation_id: ID of the conversation
+        :param queries: List of query texts to search for
+        :param limit: Number of results per query
+        :param include_embeddings: Whether to return the embeddings of the hits (as entity["embedding"])
+        :return: Search results
+        """
+
+        collection_name = self.__get_collection_name_by_id(conversation_id)
+        request = self.__create_text_search_request(conversation_id, queries, limit, include_embeddings)
+
+        results = self.__search_collection(collection_name, request)
+
+        if include_embeddings and self.vector_quantization != "none":
+            return self.__add_full_precision_embeddings(conversation_id, results)
+
+        return results
+
+
+    async def a_search_text(self, conversation_id: int, queries: list, limit: int = 5,
+                            include_embeddings: bool = False):
+        """
+        This function asynchronously searches for the fragments with the highest BM25 scores for the query texts.
+
+        :param conversation_id: ID of the conversation
+        :param queries: List of query texts to search for
+        :param limit: Number of results per query
+        :param include_embeddings: Whether to return the embeddings of the hits (as entity["embedding"])
+        :return: Search results
+        """
+
+        collection_name = self.__get_collection_name_by_id(conversation_id)
+        request = self.__create_text_search_request(conversation_id, queries, limit, include_embeddings)
+
+        results = await self.__a_search_collection(collection_name, request)
+
+        if include_embeddings and self.vector_quantization != "none":
+            return await asyncio.to_thread(self.__add_full_precision_embeddings, conversation_id, results)
+
+        return results
+
+
+    def __search_collection(self, collection_name: str, request: dict):
+        """
+        This function searches the collection, which is loaded first and pinned during the search, so the residency
+        manager doesn't release it. If another client released the collection, it is loaded again and the search
+        is retried once (other errors are raised).
+
+        :param collection_name: Name of the collection
+        :param request: Dictionary of search request parameters
+        :return: Search results
+        """
+
+        request = {**request, "consistency_level": self.consistency_level}
+
+        with self.residency.pinned(collection_name):
+            try:
+                return self.client.search(collection_name, **request)
+            except MilvusException as e:
+                if not self.__is_not_loaded_error(e):
+                    raise
+
+            # The collection was released by another client, so load it again and retry once
+            self.residency.forget(collection_name)
+            self.residency.acquire(collection_name)
+            return self.client.search(collection_name, **request)
+
+
+    async def __a_search_collection(self, collection_name: str, request: dict):
+        """
+        This function asynchronously searches the collection (see __search_collection). Loading a collection blocks,
+        so it is done in a thread (only if the collection is not loaded yet).
+
+        :param collection_name: Name of the collection
+        :param request: Dictionary of search request parameters
+        :return: Search results
+        """
+
+        if not self.residency.touch(collection_name, pin=True):
+            await asyncio.to_thread(self.residency.acquire, collection_name, True)
+
+        request = {**request, "consistency_level": self.consistency_level}
+
+        client = get_async_milvus_client(self.uri, self.token)
+        try:
+            try:
+                return await client.search(collection_name, **request)
+            except MilvusException as e:
+                if not self.__is_not_loaded_error(e):
+                    raise
+
+            # The collection was released by another client, so load it again and retry once
+            self.residency.forget(collection_name)
+            await asyncio.to_thread(self.residency.acquire, collection_name)
+            return await client.search(collection_name, **request)
+        finally:
+            self.residency.unpin(collection_name)
+
+
+    @classmethod
+    def __is_not_loaded_error(cls, error: MilvusException) -> bool:
+        """
+        This function checks if the error means the searched collection is not loaded.
+
+        :param error: Milvus error
+        :return: True if the collection is not loaded, False otherwise
+        """
+
+        return (getattr(error, "code", None) == cls.__COLLECTION_NOT_LOADED_CODE
+                or "not loaded" in str(getattr(error, "message", error)).lower())
+
+
+    def __create_text_search_request(self, conversation_id: int, queries: list, limit: int,
+                                     include_embeddings: bool = False) -> dict:
+        """
+        This function creates the parameters of the BM25 search request (Milvus analyzes the query texts itself).
+
+        :param conversation_id: ID of the conversation
+        :param queries: List of query texts to search for
+        :param limit: Number of results per query
+        :param include_embeddings: Whether to return the embeddings of the hits
+        :return: Dictionary of search request parameters
+        """
+
+        if not self.lexical_index:
+            raise ValueError("Lexical search needs the lexical index. Please create the database with lexical_index=True.")
+
+        return {
+            "anns_field": "sparse_embedding",
+            "data": list(queries),
+            "filter": self.__get_conversation_filter(conversation_id),
+            "search_params": {
+                "metric_type": "BM25",
+            },
+            "limit": limit,
+            "output_fields": self.__get_output_fields(include_embeddings),
+        }
+
+
+    def __get_output_fields(self, include_embeddings: bool) -> list:
+        """
+        This function gets the output fields of a search. Quantized embeddings are never returned, the full-precision
+        embeddings are read from the local store instead.
+
+        :param include_embeddings: Whether to return the embeddings of the hits
+        :return: List of output fields
+        """
+
+        if include_embeddings and self.vector_quantization == "none":
+            return ["text", "embedding"]
+
+        return ["text"]
+
+
+    def __add_full_precision_embeddings(self, conversation_id: int, results) -> list:
+        """
+        This function adds the full-precision embeddings to the hits (hits without a stored embedding get none).
+
+        :param conversation_id: ID of the conversation
+        :param results: Search results
+        :return: Search results with the embeddings
+        """
+
+        store = self.__get_full_precision_store(conversation_id)
+
+        results_with_embeddings = []
+        for hits in results:
+            hits = list(hits)
+            embeddings, found = store.get([hit["id"] for hit in hits])
+            results_with_embeddings.append([
+                {**hit, "entity": {**hit["entity"], "embedding": embedding}} if is_found else hit
+                for hit, embedding, is_found in zip(hits, embeddings, found)
+            ])
+
+        return results_with_embeddings
+
+
+    def __create_search_request(self, conversation_id: int, query_embedding: list, index_search_params: dict,
+                                limit: int, include_embeddings: bool = False) -> tuple:
+        """
+        This function creates the parameters of the search request. If the vectors are quantized, the query embeddings
+        are quantized the same way and more candidates are requested for rescoring.
+
+        :param conversation_id: ID of the conversation
+        :param query_embedding: Query embeddings to search for
+        :param index_search_params: Search parameters of the index
+        :param limit: Number of results per query
+        :param include_embeddings: Whether to return the embeddings of the hits
+        :return: Tuple of the 2D float32 array of query embeddings and the dictionary of search request parameters
+        """
+
+        if self.vector_quantization == "none":
+            queries, data, candidate_limit = None, query_embedding, limit
+        else:
+            queries = np.asarray(query_embedding, dtype=np.float32)
+            queries = queries.reshape(-1, queries.shape[-1])
+            data = encode_vectors(self.vector_quantization, queries)
+            candidate_limit = limit * max(1, self.rescore_factor)
+
+        _, _, _, metric_type = get_quantized_index(self.vector_quantization, self.index_type, {}, {}, self.metric_type)
+
+        return queries, {
+            "anns_field": "embedding",
+            "data": data,
+            "filter": self.__get_conversation_filter(conversation_id),
+            "search_params": {
+                "metric_type": metric_type,
+                "params": index_search_params,
+            },
+            "limit": candidate_limit,
+            "output_fields": self.__get_output_fields(include_embeddings),
+        }
+
+
+    def __rescore(self, conversation_id: int, queries: ndarray, results, limit: int, include_embeddings: bool = False) -> list:
+        """
+        This function re-ranks the candidates found with the quantized vectors by the exact similarity of the
+        full-precision embeddings. Candidates without full-precision embeddings (e.g. inserted by another host) are
+        ranked after the rescored ones in the first pass order.
+
+        :param conversation_id: ID of the conversation
+        :param queries: 2D float32 array of query embeddings
+        :param results: Results of the first pass search
+        :param limit: Number of results per query
+        :param include_embeddings: Whether to add the full-precision embeddings to the hits
+        :return: Search results
+        """
+
+        if self.vector_quantization == "none":
+            return results
+
+        store = self.__get_full_precision_store(conversation_id)
+
+        rescored = []
+        for query, hits in zip(queries, results):
+            hits = list(hits)
+            if not hits:
+                rescored.append([])
+                continue
+
+            embeddings, found = store.get([hit["id"] for hit in hits])
+
+            match self.metric_type:
+                case "L2":
+                    similarities = -np.sum((embeddings - query) ** 2, axis=1)
+                case "IP":
+                    similarities = embeddings @ query
+                case _:
+                    norms = np.maximum(np.linalg.norm(embeddings, axis=1) * np.linalg.norm(query), 1e-12)
+                    similarities = (embeddings @ query) / norms
+
+            similarities = np.where(found, similarities, -np.inf)
+            order = np.argsort(-similarities, kind="stable")[:limit]
+
+            rescored.append([
+                {
+                    "id": hits[i]["id"],
+                    # Distances are reported like Milvus does (squared distance for L2, similarity otherwise)
+                    "distance": float(-similarities[i] if self.metric_type == "L2" else similarities[i])
+                                if found[i] else hits[i]["distance"],
+                    "entity": {**hits[i]["entity"], "embedding": embeddings[i]}
+                              if include_embeddings and found[i] else hits[i]["entity"],
+                }
+                for i in order.tolist()
+            ])
+
+        return rescored
+
+
+    async def a_insert_columns(self, conversation_id: int, embeddings: ndarray, texts: Sequence,
+                               fingerprints: Sequence = None, flush: bool = False, document_id: str = None) -> int:
+        """
+        This function asynchronously inserts columnar data into the vector database, with up to max_inflight_batches
+        insert requests in flight.
+
+        :param conversation_id: ID of the conversation
+        :param embeddings: 2D array of embeddings
+        :param texts: Sequence of texts corresponding to the embeddings (list or Chunks)
+        :param fingerprints: Sequence of fingerprints corresponding to the embeddings (optional)
+        :param flush: Whether to flush the collection after inserting
+        :param document_id: ID of the document the rows belong to (optional)
+        :return: Number of inserted rows
+        """
+
+        if len(embeddings) != len(texts) or (fingerprints is not None and len(fingerprints) != len(texts)):
+            raise ValueError("Embeddings, texts and fingerprints must have the same length.")
+
+        collection_name = self.__get_collection_name_by_id(conversation_id)
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(texts), -1)
+        client = get_async_milvus_client(self.uri, self.token)
+
+        pending = deque()
+        try:
+            for rows, full_embeddings in self.__split_columns_into_batches(conversation_id, embeddings, texts, fingerprints,
+                                                                           document_id):
+                # Wait for the oldest request before sending more than allowed
+                if len(pending) >= self.max_inflight_batches:
+                    await self.__a_store_full_precision(conversation_id, *pending.popleft())
+                pending.append((asyncio.ensure_future(client.insert(collection_name, data=rows)), full_embeddings))
+
+            while pending:
+                await self.__a_store_full_precision(conversation_id, *pending.popleft())
+        finally:
+            # Cancel the requests still in flight if one of them failed
+            for task, _ in pending:
+                task.cancel()
+
+        self.residency.invalidate_footprint(collection_name)
+
+        if flush:
+            await asyncio.to_thread(self.__flush, collection_name)
+
+        return len(texts)
+
+
+    def get_residency_stats(self) -> dict:
+        """
+        This function returns the statistics of the collections kept loaded between searches.
+
+        :return: Dictionary with hits, misses, evictions, load times and estimated memory usage
+        """
+
+        return self.residency.get_stats()
+
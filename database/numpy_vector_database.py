@@ -0,0 +1,560 @@
+from database.__vector_database_template import VectorDatabaseTemplate
+from database.lexical_index import LexicalIndex
+from typing import Sequence
+from numpy import ndarray
+import numpy as np
+import json
+import os
+import shutil
+import threading
+
+
+class NumpyCollection:
+    """
+    Collection of the NumPy vector database. Embeddings are stored in a contiguous float32 matrix (memory-mapped
+    if the collection is persistent), which grows by doubling its capacity. The ID of a row is its position in the matrix,
+    and deleted rows are only marked as deleted.
+    Embeddings are normalized on insert if the metric is cosine similarity, so a search is a single matrix product.
+    The texts can also be indexed by an in-process BM25 index for lexical search (it is not persisted, but rebuilt
+    from the texts when the collection is opened).
+
+    :param dimension: Dimension of the embedding
+    :param metric_type: Similarity metric ("COSINE", "IP" or "L2")
+    :param directory: Directory where the collection is persisted (None to keep it in memory only)
+    :param initial_capacity: Initial number of rows of the embedding matrix
+    :param lexical_index: Whether to index the texts for lexical search
+    """
+
+    def __init__(self, dimension: int, metric_type: str = "COSINE", directory: str = None, initial_capacity: int = 1024,
+                 lexical_index: bool = False) -> None:
+        self.dimension = dimension
+        self.metric_type = metric_type
+        self.directory = directory
+        self.size = 0
+        self.texts = []
+        self.fingerprints = []
+        self.document_ids = []
+        self.deleted_count = 0
+        self.embeddings = self.__allocate(max(1, initial_capacity))
+        self.squared_norms = np.zeros(len(self.embeddings), dtype=np.float32)
+        self.deleted = np.zeros(len(self.embeddings), dtype=bool)
+        self.lexical_index = LexicalIndex() if lexical_index else None
+
+
+    @classmethod
+    def open(cls, directory: str, lexical_index: bool = False) -> "NumpyCollection":
+        """
+        Open a collection persisted in the directory.
+
+        :param directory: Directory of the collection
+        :param lexical_index: Whether to index the texts for lexical search
+        :return: Collection
+        """
+
+        with open(os.path.join(directory, "rows.json"), "r", encoding="utf-8") as file:
+            rows = json.load(file)
+
+        collection = cls.__new__(cls)
+        collection.dimension = rows["dimension"]
+        collection.metric_type = rows["metric_type"]
+        collection.directory = directory
+        collection.size = len(rows["texts"])
+        collection.texts = rows["texts"]
+        collection.fingerprints = rows["fingerprints"]
+        collection.document_ids = rows.get("document_ids", [None] * collection.size)  # Collections persisted without them
+        collection.deleted_count = len(rows["deleted"])
+
+        path = os.path.join(directory, "embeddings.f32")
+        capacity = os.path.getsize(path) // (collection.dimension * np.dtype(np.float32).itemsize)
+        collection.embeddings = np.memmap(path, dtype=np.float32, mode="r+", shape=(capacity, collection.dimension))
+
+        collection.squared_norms = np.zeros(capacity, dtype=np.float32)
+        collection.squared_norms[:collection.size] = np.einsum("ij,ij->i", collection.embeddings[:collection.size],
+                                                               collection.embeddings[:collection.size])
+        collection.deleted = np.zeros(capacity, dtype=bool)
+        collection.deleted[rows["deleted"]] = True
+
+        collection.lexical_index = None
+        if lexical_index:
+            collection.lexical_index = LexicalIndex()
+            collection.lexical_index.add(collection.texts)
+
+        return collection
+
+
+    def append(self, embeddings: ndarray, texts: Sequence, fingerprints: Sequence = None, document_ids: Sequence = None) -> None:
+        """
+        Append rows to the collection.
+
+        :param embeddings: 2D array of embeddings
+        :param texts: Sequence of texts corresponding to the embeddings
+        :param fingerprints: Sequence of fingerprints corresponding to the embeddings (optional)
+        :param document_ids: Sequence of the IDs of the documents of the rows (optional)
+        :return: None
+        """
+
+        count = len(texts)
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(count, -1)
+        if embeddings.shape[1] != self.dimension:
+            raise ValueError(f"Embedding dimension {embeddings.shape[1]} does not match the collection dimension {self.dimension}.")
+
+        if self.size + count > len(self.embeddings):
+            self.__grow(self.size + count)
+
+        block = self.embeddings[self.size:self.size + count]
+        block[:] = embeddings
+        if self.metric_type == "COSINE":
+            norms = np.linalg.norm(block, axis=1, keepdims=True)
+            np.divide(block, norms, out=block, where=norms > 0)
+
+        self.squared_norms[self.size:self.size + count] = np.einsum("ij,ij->i", block, block)
+        self.texts.extend(texts)
+        self.fingerprints.extend(fingerprints if fingerprints is not None else [None] * count)
+        self.document_ids.extend(document_ids if document_ids is not None else [None] * count)
+        self.size += count
+
+        if self.lexical_index is not None:
+            self.lexical_index.add(texts)
+
+
+    def delete(self, ids: list) -> None:
+        """
+        Mark the rows as deleted.
+
+        :param ids: IDs of the rows
+        :return: None
+        """
+
+        ids = np.asarray(ids, dtype=np.int64)
+        ids = ids[(ids >= 0) & (ids < self.size)]
+        self.deleted[ids] = True
+        self.deleted_count = int(self.deleted[:self.size].sum())
+
+
+    def search(self, query_embeddings: ndarray, limit: int, include_embeddings: bool = False) -> list:
+        """
+        Find the most similar rows to the query embeddings.
+
+        :param query_embeddings: 2D array of query embeddings
+        :param limit: Number of results per query
+        :param include_embeddings: Whether to return the embeddings of the hits
+        :return: List (one item per query) of lists of hits
+        """
+
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(-1, self.dimension)
+        embeddings = self.embeddings[:self.size]
+        deleted = self.deleted[:self.size]
+
+        # Scores are ordered descending (similarity) and distances are reported like Milvus does
+        if self.metric_type == "L2":
+            scores = 2 * (queries @ embeddings.T) - self.squared_norms[:self.size]
+        else:
+            if self.metric_type == "COSINE":
+                queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+            scores = queries @ embeddings.T
+
+        if self.deleted_count:
+            scores[:, deleted] = -np.inf
+
+        limit = min(limit, self.size - self.deleted_count)
+        if limit <= 0:
+            return [[] for _ in range(len(queries))]
+
+        # Partial selection of the top results, then sorting only them
+        if limit < self.size:
+            top = np.argpartition(-scores, limit - 1, axis=1)[:, :limit]
+        else:
+            top = np.broadcast_to(np.arange(self.size), scores.shape)
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        if self.metric_type == "L2":
+            top_scores = np.einsum("ij,ij->i", queries, queries)[:, None] - top_scores
+
+        results = []
+        for rows, distances in zip(top.tolist(), top_scores.tolist()):
+            results.append([
+                {"id": row, "distance": distance, "entity": self.__get_entity(row, include_embeddings)}
+                for row, distance in zip(rows, distances) if not deleted[row]
+            ])
+
+        return results
+
+
+    def search_text(self, queries: Sequence, limit: int, include_embeddings: bool = False) -> list:
+        """
+        Find the rows with the highest BM25 scores for the query texts.
+
+        :param queries: Sequence of query texts
+        :param limit: Number of results per query
+        :param include_embeddings: Whether to return the embeddings of the hits
+        :return: List (one item per query) of lists of hits
+        """
+
+        if self.lexical_index is None:
+            raise ValueError("The collection has no lexical index. Please create the database with lexical_index=True.")
+
+        results = []
+        for rows, scores in self.lexical_index.search(queries, limit, self.deleted):
+            results.append([
+                {"id": row, "distance": score, "entity": self.__get_entity(row, include_embeddings)}
+                for row, score in zip(rows.tolist(), scores.tolist())
+            ])
+
+        return results
+
+
+    def __get_entity(self, row: int, include_embedding: bool) -> dict:
+        """
+        Get the output fields of a row.
+
+        :param row: ID of the row
+        :param include_embedding: Whether to include the embedding (normalized if the metric is cosine similarity)
+        :return: Dictionary of the output fields
+        """
+
+        if include_embedding:
+            return {"text": self.texts[row], "embedding": np.array(self.embeddings[row])}
+
+        return {"text": self.texts[row]}
+
+
+    def flush(self) -> None:
+        """
+        Persist the collection (if it has a directory).
+
+        :return: None
+        """
+
+        if self.directory is None:
+            return
+
+        self.embeddings.flush()
+
+        rows = {
+            "dimension": self.dimension,
+            "metric_type": self.metric_type,
+            "texts": self.texts,
+            "fingerprints": self.fingerprints,
+            "document_ids": self.document_ids,
+            "deleted": np.flatnonzero(self.deleted[:self.size]).tolist(),
+        }
+
+        # Write atomically, so a crash never leaves a partial file
+        path = os.path.join(self.directory, "rows.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as file:
+            json.dump(rows, file)
+        os.replace(path + ".tmp", path)
+
+
+    def __allocate(self, capacity: int) -> ndarray:
+        """
+        Allocate the embedding matrix (a memory-mapped file if the collection is persistent).
+
+        :param capacity: Number of rows
+        :return: Embedding matrix
+        """
+
+        if self.directory is None:
+            return np.zeros((capacity, self.dimension), dtype=np.float32)
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, "embeddings.f32")
+        with open(path, "ab") as file:
+            file.truncate(capacity * self.dimension * np.dtype(np.float32).itemsize)
+
+        return np.memmap(path, dtype=np.float32, mode="r+", shape=(capacity, self.dimension))
+
+
+    def __grow(self, required_capacity: int) -> None:
+        """
+        Grow the embedding matrix to at least the required capacity (at least doubling it).
+
+        :param required_capacity: Required number of rows
+        :return: None
+        """
+
+        capacity = max(required_capacity, 2 * len(self.embeddings))
+
+        if self.directory is None:
+            embeddings = self.__allocate(capacity)
+            embeddings[:self.size] = self.embeddings[:self.size]
+        else:
+            # The file is extended in place, so the rows stay where they are
+            self.embeddings.flush()
+            del self.embeddings
+            embeddings = self.__allocate(capacity)
+
+        self.embeddings = embeddings
+        self.squared_norms = np.concatenate([self.squared_norms, np.zeros(capacity - len(self.squared_norms), dtype=np.float32)])
+        self.deleted = np.concatenate([self.deleted, np.zeros(capacity - len(self.deleted), dtype=bool)])
+
+
+class NumpyVectorDatabase(VectorDatabaseTemplate):
+    """
+    Embedded vector database keeping the collections in the memory of the process. Every collection is a contiguous
+    float32 matrix searched exactly by a matrix product with partial top-k selection, so small collections are searched
+    in well under a millisecond without any network round trips or external server.
+    If storage_dir is set, collections are memory-mapped files persisted on flush and opened again lazily.
+    With lexical_index, the texts of every collection are also indexed by an in-process BM25 index
+    (database.lexical_index) for lexical search.
+
+    :param backend_name: Name of the vector database backend
+    :param storage_dir: Directory where the collections are persisted (None to keep them in memory only)
+    :param metric_type: Similarity metric ("COSINE", "IP" or "L2")
+    :param initial_capacity: Initial number of rows of a collection
+    :param lexical_index: Whether to index the texts for lexical search
+    :param kwargs: Other database parameters (not used by this backend, e.g. the Milvus connection parameters)
+    """
+
+    # Fields of every collection
+    __FIELDS = ("id", "embedding", "text", "fingerprint", "document_id")
+
+
+    def __init__(self, backend_name: str, storage_dir: str = None, metric_type: str = "COSINE", initial_capacity: int = 1024,
+                 lexical_index: bool = False, **kwargs) -> None:
+        super().__init__(backend_name)
+        self.storage_dir = storage_dir
+        self.metric_type = metric_type.upper()
+        self.initial_capacity = initial_capacity
+        self.lexical_index = lexical_index
+
+        if self.metric_type not in ("COSINE", "IP", "L2"):
+            raise ValueError(f"Unsupported metric type: {metric_type}. Please use COSINE, IP or L2.")
+
+        self.__collections = {}
+        self.__lock = threading.RLock()
+
+
+    def create_collection(self, conversation_id: int, dimension: int) -> None:
+        """
+        Create a collection for the conversation. If the collection already exists, it is removed first.
+
+        :param conversation_id: ID of the conversation
+        :param dimension: Dimension of the embedding
+        :return: None
+        """
+
+        with self.__lock:
+            self.remove_collection(conversation_id)
+            self.__collections[conversation_id] = NumpyCollection(dimension, self.metric_type,
+                                                                  self.__get_directory(conversation_id),
+                                                                  self.initial_capacity, self.lexical_index)
+            self.__collections[conversation_id].flush()
+
+
+    def remove_collection(self, conversation_id: int) -> None:
+        """
+        Remove the collection of the conversation (and its files, if it is persisted).
+
+        :param conversation_id: ID of the conversation
+        :return: None
+        """
+
+        with self.__lock:
+            self.__collections.pop(conversation_id, None)
+
+            directory = self.__get_directory(conversation_id)
+            if directory is not None and os.path.isdir(directory):
+                shutil.rmtree(directory)
+
+
+    def has_collection(self, conversation_id: int) -> bool:
+        """
+        Check if the collection of the conversation exists (in memory or on the disk).
+
+        :param conversation_id: ID of the conversation
+        :return: True if the collection exists, False otherwise
+        """
+
+        with self.__lock:
+            return self.__get_collection(conversation_id) is not None
+
+
+    def has_field(self, conversation_id: int, field_name: str) -> bool:
+        """
+        Check if the collection has a field (all collections of this backend have the same fields, and the lexical index
+        is reported as the sparse_embedding field like in the Milvus backend).
+
+        :param conversation_id: ID of the conversation
+        :param field_name: Name of the field
+        :return: True if the collection has the field, False otherwise
+        """
+
+        fields = self.__FIELDS + (("sparse_embedding",) if self.lexical_index else ())
+        return self.has_collection(conversation_id) and field_name in fields
+
+
+    def get_fingerprints(self, conversation_id: int, document_id: str) -> dict:
+        """
+        Get the fingerprints of the fragments of a document stored in the collection.
+
+        :param conversation_id: ID of the conversation
+        :param document_id: ID of the document
+        :return: Dictionary mapping fingerprints to the lists of IDs of the rows having them
+        """
+
+        with self.__lock:
+            collection = self.__get_existing_collection(conversation_id)
+
+            fingerprints = {}
+            for row, (fingerprint, row_document_id) in enumerate(zip(collection.fingerprints, collection.document_ids)):
+                if fingerprint is not None and row_document_id == document_id and not collection.deleted[row]:
+                    fingerprints.setdefault(fingerprint, []).append(row)
+
+            return fingerprints
+
+
+    def delete_data(self, conversation_id: int, ids: list) -> None:
+        """
+        Delete rows from the collection.
+
+        :param conversation_id: ID of the conversation
+        :param ids: IDs of the rows to be deleted
+        :return: None
+        """
+
+        if not ids:
+            return
+
+        with self.__lock:
+            self.__get_existing_collection(conversation_id).delete(ids)
+
+
+    def insert_data(self, conversation_id: int, data: list, flush: bool = True):
+        """
+        Insert rows into the collection.
+
+        :param conversation_id: ID of the conversation
+        :param data: Data to be inserted (list of rows)
+        :param flush: Whether to persist the collection after inserting
+        """
+
+        embeddings = np.asarray([row["embedding"] for row in data], dtype=np.float32)
+        texts = [row["text"] for row in data]
+        fingerprints = [row.get("fingerprint") for row in data]
+        document_ids = [row.get("document_id") for row in data]
+
+        with self.__lock:
+            collection = self.__get_existing_collection(conversation_id)
+            collection.append(embeddings, texts, fingerprints, document_ids)
+
+            if flush:
+                collection.flush()
+
+
+    def insert_columns(self, conversation_id: int, embeddings: ndarray, texts: Sequence, fingerprints: Sequence = None,
+                       flush: bool = False, document_id: str = None) -> int:
+        """
+        Insert columnar data into the collection. The embeddings are copied into the matrix of the collection at once.
+
+        :param conversation_id: ID of the conversation
+        :param embeddings: 2D array of embeddings
+        :param texts: Sequence of texts corresponding to the embeddings (list or Chunks)
+        :param fingerprints: Sequence of fingerprints corresponding to the embeddings (optional)
+        :param flush: Whether to persist the collection after inserting
+        :param document_id: ID of the document the rows belong to (optional)
+        :return: Number of inserted rows
+        """
+
+        if len(embeddings) != len(texts) or (fingerprints is not None and len(fingerprints) != len(texts)):
+            raise ValueError("Embeddings, texts and fingerprints must have the same length.")
+
+        with self.__lock:
+            collection = self.__get_existing_collection(conversation_id)
+            collection.append(embeddings, texts, fingerprints, [document_id] * len(texts) if document_id is not None else None)
+
+            if flush:
+                collection.flush()
+
+        return len(texts)
+
+
+    def flush(self, conversation_id: int) -> None:
+        """
+        Persist the collection (if the collections are persisted).
+
+        :param conversation_id: ID of the conversation
+        :return: None
+        """
+
+        with self.__lock:
+            self.__get_existing_collection(conversation_id).flush()
+
+
+    def search(self, conversation_id: int, query_embedding: list, limit: int = 5, include_embeddings: bool = False):
+        """
+        Search for the fragments most similar to the query embeddings.
+
+        :param conversation_id: ID of the conversation
+        :param query_embedding: List of query embeddings to search for
+        :param limit: Number of results per query
+        :param include_embeddings: Whether to return the embeddings of the hits (as entity["embedding"])
+        :return: Search results
+        """
+
+        with self.__lock:
+            return self.__get_existing_collection(conversation_id).search(query_embedding, limit, include_embeddings)
+
+
+    def search_text(self, conversation_id: int, queries: list, limit: int = 5, include_embeddings: bool = False):
+        """
+        Search for the fragments with the highest BM25 scores for the query texts.
+
+        :param conversation_id: ID of the conversation
+        :param queries: List of query texts to search for
+        :param limit: Number of results per query
+        :param include_embeddings: Whether to return the embeddings of the hits (as entity["embedding"])
+        :return: Search results
+        """
+
+        with self.__lock:
+            return self.__get_existing_collection(conversation_id).search_text(queries, limit, include_embeddings)
+
+
+    def __get_directory(self, conversation_id: int) -> str | None:
+        """
+        Get the directory of the persisted collection.
+
+        :param conversation_id: ID of the conversation
+        :return: Directory or None if the collections are not persisted
+        """
+
+        if self.storage_dir is None:
+            return None
+
+        return os.path.join(self.storage_dir, f"conversation_{conversation_id}")
+
+
+    def __get_collection(self, conversation_id: int) -> NumpyCollection | None:
+        """
+        Get the collection of the conversation, opening it from the disk if it is persisted but not open yet.
+
+        :param conversation_id: ID of the conversation
+        :return: Collection or None if it does not exist
+        """
+
+        if conversation_id not in self.__collections:
+            directory = self.__get_directory(conversation_id)
+            if directory is None or not os.path.isfile(os.path.join(directory, "rows.json")):
+                return None
+            self.__collections[conversation_id] = NumpyCollection.open(directory, self.lexical_index)
+
+        return self.__collections[conversation_id]
+
+
+    def __get_existing_collection(self, conversation_id: int) -> NumpyCollection:
+        """
+        Get the collection of the conversation, raising an error if it does not exist.
+
+        :param conversation_id: ID of the conversation
+        :return: Collection
+        """
+
+        collection = self.__get_collection(conversation_id)
+        if collection is None:
+            raise ValueError(f"Collection of conversation {conversation_id} does not exist.")
+
+        return collection
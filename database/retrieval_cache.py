@@ -0,0 +1,218 @@
+from collections import OrderedDict
+from numpy import ndarray
+import numpy as np
+import hashlib
+import threading
+import time
+import unicodedata
+
+
+class RetrievalCache:
+    """
+    In-memory cache of retrieval results of the conversations with least recently used eviction and expiration.
+    Entries are keyed by the conversation and a hash of the normalized query text (or of the quantized query embedding),
+    together with the retrieval parameters.
+    Every write to a conversation invalidates all its entries. Every invalidation also increments the generation
+    of the conversation, and results are stored only if the generation did not change since the search started,
+    so a search running concurrently with a write never stores results missing the written rows.
+    The generations are shared by all caches of the process (every entry remembers the generation it was stored in),
+    so a write through any vector database of the process invalidates the results cached by the others. Writes done by
+    other processes are only reflected after ttl_seconds.
+
+    :param max_entries: Maximal number of cached results
+    :param ttl_seconds: Time after which a cached result expires (None to never expire)
+    :param embedding_step: Quantization step of the query embeddings used as keys of the vector database searches
+                           (None to cache only the results looked up by the query text)
+    """
+
+    # Generations of the conversations shared by all caches of the process
+    __generations = {}
+    __generations_lock = threading.Lock()
+
+    def __init__(self, max_entries: int = 10_000, ttl_seconds: float = 300, embedding_step: float = None) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.embedding_step = embedding_step
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        # Entries ordered from the least to the most recently used, mapped to their expiration times, values
+        # and generations of the conversations
+        self.__entries = OrderedDict()
+        self.__keys_by_conversation = {}
+        self.__epoch = 0
+        self.__lock = threading.Lock()
+
+
+    @staticmethod
+    def get_text_key(query: str, *params) -> str:
+        """
+        Get the key of the query text. The text is normalized (Unicode normalization, case, whitespace and trailing
+        punctuation), so trivially different forms of the same question share the key.
+
+        :param query: Query text
+        :param params: Retrieval parameters the results depend on
+        :return: Key
+        """
+
+        normalized = " ".join(unicodedata.normalize("NFKC", query).casefold().split()).rstrip("?!.")
+        return hashlib.sha256(f"text\0{normalized}\0{params!r}".encode("utf-8")).hexdigest()
+
+
+    def get_embedding_key(self, embedding: ndarray, *params) -> str:
+        """
+        Get the key of the query embedding quantized by embedding_step, so numerically almost identical embeddings
+        share the key.
+
+        :param embedding: Query embedding
+        :param params: Retrieval parameters the results depend on
+        :return: Key
+        """
+
+        quantized = np.round(np.asarray(embedding, dtype=np.float32).ravel() / self.embedding_step).astype(np.int32)
+        return hashlib.sha256(b"embedding\0" + quantized.tobytes() + repr(params).encode("utf-8")).hexdigest()
+
+
+    def get_generation(self, conversation_id: int) -> tuple:
+        """
+        Get the generation of the conversation (it has to be taken before the search whose results are stored).
+
+        :param conversation_id: ID of the conversation
+        :return: Generation
+        """
+
+        with self.__lock:
+            return self.__epoch, self.__get_conversation_generation(conversation_id)
+
+
+    def get(self, conversation_id: int, key: str):
+        """
+        Get the cached result and mark it as the most recently used.
+
+        :param conversation_id: ID of the conversation
+        :param key: Key of the result
+        :return: Cached result or None if it is not cached (or expired)
+        """
+
+        with self.__lock:
+            entry = self.__entries.get((conversation_id, key))
+            if (entry is None or (entry[0] is not None and entry[0] < time.monotonic())
+                    or entry[2] != self.__get_conversation_generation(conversation_id)):
+                if entry is not None:
+                    self.__remove((conversation_id, key))
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.__entries.move_to_end((conversation_id, key))
+            return entry[1]
+
+
+    def put(self, conversation_id: int, key: str, value, generation: tuple) -> None:
+        """
+        Store the result (unless the conversation was written since the generation was taken). The least recently used
+        results are evicted if the cache is full.
+
+        :param conversation_id: ID of the conversation
+        :param key: Key of the result
+        :param value: Result
+        :param generation: Generation of the conversation taken before the search
+        :return: None
+        """
+
+        expiration = time.monotonic() + self.ttl_seconds if self.ttl_seconds is not None else None
+
+        with self.__lock:
+            if (self.__epoch, self.__get_conversation_generation(conversation_id)) != generation:
+                return
+
+            self.__entries[(conversation_id, key)] = (expiration, value, generation[1])
+            self.__entries.move_to_end((conversation_id, key))
+            self.__keys_by_conversation.setdefault(conversation_id, set()).add(key)
+
+            while len(self.__entries) > self.max_entries:
+                self.__remove(next(iter(self.__entries)))
+                self.evictions += 1
+
+
+    def invalidate(self, conversation_id: int) -> None:
+        """
+        Remove all cached results of the conversation and start its new generation (the results cached by the other
+        caches of the process are not returned anymore either).
+
+        :param conversation_id: ID of the conversation
+        :return: None
+        """
+
+        with RetrievalCache.__generations_lock:
+            RetrievalCache.__generations[conversation_id] = RetrievalCache.__generations.get(conversation_id, 0) + 1
+
+        with self.__lock:
+            for key in self.__keys_by_conversation.pop(conversation_id, ()):
+                self.__entries.pop((conversation_id, key), None)
+            self.invalidations += 1
+
+
+    def clear(self) -> None:
+        """
+        Remove all cached results (e.g. when the vector database backend changes).
+
+        :return: None
+        """
+
+        with self.__lock:
+            self.__epoch += 1
+            self.__entries.clear()
+            self.__keys_by_conversation.clear()
+
+
+    def get_stats(self) -> dict:
+        """
+        Get the cache statistics.
+
+        :return: Dictionary with the number of entries, hits, misses, evictions, invalidations and hit rate
+        """
+
+        with self.__lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self.__entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+    @classmethod
+    def __get_conversation_generation(cls, conversation_id: int) -> int:
+        """
+        Get the process-wide generation of the conversation.
+
+        :param conversation_id: ID of the conversation
+        :return: Generation
+        """
+
+        with cls.__generations_lock:
+            return cls.__generations.get(conversation_id, 0)
+
+
+    def __remove(self, entry_key: tuple) -> None:
+        """
+        Remove a cached result.
+
+        :param entry_key: Tuple of the conversation ID and the key of the result
+        :return: None
+        """
+
+        conversation_id, key = entry_key
+        self.__entries.pop(entry_key, None)
+
+        keys = self.__keys_by_conversation.get(conversation_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.__keys_by_conversation[conversation_id]
@@ -1,142 +1,418 @@
-from pymilvus import MilvusClient, DataType, CollectionSchema
+# ============================ Backends import =========================
+from database.milvus_vector_database import MilvusVectorDatabase
+from database.numpy_vector_database import NumpyVectorDatabase
+# ======================================================================
+
+from database.__vector_database_template import VectorDatabaseTemplate
+from database.retrieval_cache import RetrievalCache
+from typing import Sequence
+from numpy import ndarray
+import logging
+
+
+class VectorDatabase(VectorDatabaseTemplate):
+    """
+    Factory class for creating vector databases. This class allows you to set the vector database backend by calling
+    the set_backend method with the desired backend name ("milvus" or "numpy"). Then, you can use the collection,
+    insert and search methods of the backend. You have to pass an existing backend name and its parameters to the constructor.
+    If the "retrieval_cache" parameter is passed (dictionary of RetrievalCache parameters), retrieval results can be
+    cached (see get_retrieval_cache), and every write to a conversation invalidates its cached results (also those
+    cached by the other vector databases of the process). With embedding_step, the search results are cached by
+    the quantized query embeddings as well.
+
+    :param backend: Name of the vector database backend to be set
+    :param retrieval_cache: Parameters of the retrieval cache (None to disable it)
+    :param kwargs: Additional parameters for the vector database backend
+    """
+
+    def __init__(self, backend: str = "milvus", retrieval_cache: dict = None, **kwargs):
+        super().__init__(backend)
+        self.__database = None
+        self.__retrieval_cache = RetrievalCache(**retrieval_cache) if retrieval_cache is not None else None
+        self.set_backend(backend, **kwargs)
+
+
+    def set_backend(self, backend: str, **kwargs) -> None:
+        """
+        Set the backend name and change the vector database backend.
+        (If the new backend name is different from the current one, change the backend)
+
+        :param backend: Name of the vector database backend to be set
+        :return: None
+        """
+
+        # If the new backend name is different from the current one, change the backend
+        if self.backend_name != backend or self.__database is None:
+            self.__change_backend(backend, **kwargs)
+
+
+    def __change_backend(self, backend: str, **kwargs) -> None:
+        """
+        Change the vector database backend according to the specified name.
+
+        :param backend: Name of the vector database backend to be set
+        :return: None
+        """
+
+        # Set the backend name
+        self.backend_name = backend
+
+        # Results of the previous backend are not valid anymore
+        if self.__retrieval_cache is not None:
+            self.__retrieval_cache.clear()
+
+        # ============================= Switch between backends ===========================
+        match backend:
+            case "milvus":
+                self.__database = MilvusVectorDatabase(backend, **kwargs)
+            case "numpy":
+                self.__database = NumpyVectorDatabase(backend, **kwargs)
+            case _:
+                raise ValueError(f"Unsupported vector database backend: {backend}. Please use a valid backend name.")
+        # =================================================================================
+
+        logging.info(f"Vector database: using the {backend} backend.")
+
+
+    def get_vector_database(self) -> VectorDatabaseTemplate:
+        """
+        Get the vector database backend.
+
+        :return: Vector database backend
+        """
+
+        return self.__database
+
+
+    def get_retrieval_cache(self) -> RetrievalCache | None:
+        """
+        Get the retrieval cache (invalidated by the writes to the conversations).
+
+        :return: Retrieval cache or None if it is disabled
+        """
+
+        return self.__retrieval_cache
 
 
-class VectorDatabase:
-    def __init__(self):
-        self.client = MilvusClient(
-            uri="http://localhost:19530",
-            token="root:Milvus"
-        )
+    def get_retrieval_cache_stats(self) -> dict:
+        """
+        Get the statistics of the retrieval cache.
+
+        :return: Dictionary of statistics (empty if the cache is disabled)
+        """
 
+        return self.__retrieval_cache.get_stats() if self.__retrieval_cache is not None else {}
 
-    def create_collection(self, conversation_d: int, dimension: int) -> None:
+
+    def create_collection(self, conversation_id: int, dimension: int) -> None:
         """
-        This function creates a collection in the vector database. If the collection already exists, it removes it first.
+        Create a collection for the conversation. If the collection already exists, it is removed first.
 
-        :param conversation_d: ID of the conversation
+        :param conversation_id: ID of the conversation
         :param dimension: Dimension of the embedding
         :return: None
         """
 
-        collection_name = self.__get_collection_name_by_id(conversation_d)
+        try:
+            self.__database.create_collection(conversation_id, dimension)
+        finally:
+            self.__invalidate(conversation_id)
 
-        # Remove the collection if it already exists
-        if self.client.has_collection(collection_name):
-            self.remove_collection(conversation_d)
 
-        self.client.create_collection(collection_name, dimension, schema=self.__create_schema(dimension))
-        self.client.create_index(collection_name, index_params=self.__create_index())
+    def remove_collection(self, conversation_id: int) -> None:
+        """
+        Remove the collection of the conversation (if it exists).
 
+        :param conversation_id: ID of the conversation
+        :return: None
+        """
 
-    def __get_collection_name_by_id(self, conversation_id: int) -> str:
+        try:
+            self.__database.remove_collection(conversation_id)
+        finally:
+            self.__invalidate(conversation_id)
+
+
+    def has_collection(self, conversation_id: int) -> bool:
         """
-        This function generates a collection name based on the conversation ID.
+        Check if the collection of the conversation exists.
 
         :param conversation_id: ID of the conversation
-        :return: Collection name
+        :return: True if the collection exists, False otherwise
         """
 
-        return f"conversation_{conversation_id}"
+        return self.__database.has_collection(conversation_id)
 
 
-    def __create_schema(self, dimension: int) -> CollectionSchema:
+    def has_field(self, conversation_id: int, field_name: str) -> bool:
         """
-        This function creates a schema for the collection.
+        Check if the collection has a field (collections created by older versions may lack some fields).
 
-        :param dimension: Dimension of the embedding
-        :return: Collection schema
+        :param conversation_id: ID of the conversation
+        :param field_name: Name of the field
+        :return: True if the collection has the field, False otherwise
         """
 
-        schema = MilvusClient.create_schema()
+        return self.__database.has_field(conversation_id, field_name)
 
-        # Add fields to the schema
-        schema.add_field("id", datatype=DataType.INT64, is_primary=True, auto_id=True)
-        schema.add_field("embedding", datatype=DataType.FLOAT_VECTOR, dim=dimension)
-        schema.add_field("text", datatype=DataType.VARCHAR, max_length=65535)
 
-        return schema
+    def get_fingerprints(self, conversation_id: int, document_id: str) -> dict:
+        """
+        Get the fingerprints of the fragments of a document stored in the collection.
 
+        :param conversation_id: ID of the conversation
+        :param document_id: ID of the document
+        :return: Dictionary mapping fingerprints to the lists of IDs of the rows having them
+        """
 
-    def __create_index(self):
+        return self.__database.get_fingerprints(conversation_id, document_id)
+
+
+    def delete_data(self, conversation_id: int, ids: list) -> None:
         """
-        This function creates an index for the embedding field in the collection.
+        Delete rows from the collection.
 
-        :return: Index parameters for the embedding field
+        :param conversation_id: ID of the conversation
+        :param ids: IDs of the rows to be deleted
+        :return: None
         """
 
-        # Create an index for the embedding field
-        index_params = self.client.prepare_index_params()
-        index_params.add_index(
-            field_name="embedding",
-            index_type="FLAT",  # or "HNSW"
-            metric_type="COSINE",
-        )
+        try:
+            self.__database.delete_data(conversation_id, ids)
+        finally:
+            self.__invalidate(conversation_id)
 
-        return index_params
 
+    def insert_data(self, conversation_id: int, data: list, flush: bool = True):
+        """
+        Insert rows into the collection.
 
-    def remove_collection(self, conversation_id: int) -> None:
+        :param conversation_id: ID of the conversation
+        :param data: Data to be inserted (list of rows)
+        :param flush: Whether to flush the collection after inserting
         """
-        This function removes a collection from the vector database.
+
+        try:
+            return self.__database.insert_data(conversation_id, data, flush=flush)
+        finally:
+            self.__invalidate(conversation_id)
+
+
+    def insert_columns(self, conversation_id: int, embeddings: ndarray, texts: Sequence, fingerprints: Sequence = None,
+                       flush: bool = False, document_id: str = None) -> int:
+        """
+        Insert columnar data into the collection.
+
+        :param conversation_id: ID of the conversation
+        :param embeddings: 2D array of embeddings
+        :param texts: Sequence of texts corresponding to the embeddings (list or Chunks)
+        :param fingerprints: Sequence of fingerprints corresponding to the embeddings (optional)
+        :param flush: Whether to flush the collection after inserting
+        :param document_id: ID of the document the rows belong to (optional)
+        :return: Number of inserted rows
+        """
+
+        try:
+            return self.__database.insert_columns(conversation_id, embeddings, texts, fingerprints, flush=flush,
+                                                  document_id=document_id)
+        finally:
+            self.__invalidate(conversation_id)
+
+
+    def flush(self, conversation_id: int) -> None:
+        """
+        Persist the inserted data of the collection.
 
         :param conversation_id: ID of the conversation
         :return: None
         """
 
-        collection_name = self.__get_collection_name_by_id(conversation_id)
+        self.__database.flush(conversation_id)
 
-        if self.client.has_collection(collection_name):
-            self.client.drop_collection(collection_name)
-        else:
-            return
 
+    def search(self, conversation_id: int, query_embedding: list, limit: int = 5, include_embeddings: bool = False):
+        """
+        Search for the fragments most similar to the query embeddings.
 
-    def has_collection(self, conversation_id: int) -> bool:
+        :param conversation_id: ID of the conversation
+        :param query_embedding: List of query embeddings to search for
+        :param limit: Number of results per query
+        :param include_embeddings: Whether to return the embeddings of the hits (as entity["embedding"])
+        :return: Search results
+        """
+
+        if self.__retrieval_cache is None or self.__retrieval_cache.embedding_step is None:
+            return self.__database.search(conversation_id, query_embedding, limit=limit,
+                                          include_embeddings=include_embeddings)
+
+        results, keys, generation = self.__lookup_search_results(conversation_id, query_embedding, limit, include_embeddings)
+        missing = [i for i, hits in enumerate(results) if hits is None]
+        if missing:
+            missing_results = self.__database.search(conversation_id, [query_embedding[i] for i in missing], limit=limit,
+                                                     include_embeddings=include_embeddings)
+            self.__store_search_results(conversation_id, results, keys, generation, missing, missing_results)
+
+        return results
+
+
+    async def a_search(self, conversation_id: int, query_embedding: list, limit: int = 5,
+                       include_embeddings: bool = False):
         """
-        This function checks if a collection exists in the vector database.
+        Asynchronously search for the fragments most similar to the query embeddings.
 
         :param conversation_id: ID of the conversation
-        :return: True if the collection exists, False otherwise
+        :param query_embedding: List of query embeddings to search for
+        :param limit: Number of results per query
+        :param include_embeddings: Whether to return the embeddings of the hits (as entity["embedding"])
+        :return: Search results
+        """
+
+        if self.__retrieval_cache is None or self.__retrieval_cache.embedding_step is None:
+            return await self.__database.a_search(conversation_id, query_embedding, limit=limit,
+                                                  include_embeddings=include_embeddings)
+
+        results, keys, generation = self.__lookup_search_results(conversation_id, query_embedding, limit, include_embeddings)
+        missing = [i for i, hits in enumerate(results) if hits is None]
+        if missing:
+            missing_results = await self.__database.a_search(conversation_id, [query_embedding[i] for i in missing],
+                                                             limit=limit, include_embeddings=include_embeddings)
+            self.__store_search_results(conversation_id, results, keys, generation, missing, missing_results)
+
+        return results
+
+
+    def __lookup_search_results(self, conversation_id: int, query_embedding: list, limit: int,
+                                include_embeddings: bool) -> tuple:
+        """
+        Look up the cached search results of the query embeddings.
+
+        :param conversation_id: ID of the conversation
+        :param query_embedding: List of query embeddings
+        :param limit: Number of results per query
+        :param include_embeddings: Whether the embeddings of the hits are returned
+        :return: Tuple of the list of results (None for the queries missing from the cache), the list of their keys
+                 and the generation of the conversation
+        """
+
+        generation = self.__retrieval_cache.get_generation(conversation_id)
+        keys = [self.__retrieval_cache.get_embedding_key(embedding, "search", limit, include_embeddings)
+                for embedding in query_embedding]
+        results = [self.__retrieval_cache.get(conversation_id, key) for key in keys]
+
+        return results, keys, generation
+
+
+    def __store_search_results(self, conversation_id: int, results: list, keys: list, generation: tuple, missing: list,
+                               missing_results) -> None:
+        """
+        Fill the search results of the queries missing from the cache in and store them in the cache.
+
+        :param conversation_id: ID of the conversation
+        :param results: List of results (None for the queries missing from the cache)
+        :param keys: List of the keys of the queries
+        :param generation: Generation of the conversation taken before the search
+        :param missing: Indices of the queries missing from the cache
+        :param missing_results: Search results of the missing queries
+        :return: None
         """
 
-        collection_name = self.__get_collection_name_by_id(conversation_id)
-        return self.client.has_collection(collection_name)
+        for i, hits in zip(missing, missing_results):
+            results[i] = list(hits)
+            self.__retrieval_cache.put(conversation_id, keys[i], results[i], generation)
 
 
-    def insert_data(self, conversation_id: int, data: list):
+    def search_text(self, conversation_id: int, queries: list, limit: int = 5, include_embeddings: bool = False):
         """
-        This function inserts data into the vector database.
+        Search for the fragments with the highest lexical (BM25) scores for the query texts.
 
         :param conversation_id: ID of the conversation
-        :param data: Data to be inserted
+        :param queries: List of query texts to search for
+        :param limit: Number of results per query
+        :param include_embeddings: Whether to return the embeddings of the hits (as entity["embedding"])
+        :return: Search results
         """
 
-        collection_name = self.__get_collection_name_by_id(conversation_id)
-        self.client.insert(collection_name, data=data)
-        self.client.flush(collection_name)
+        return self.__database.search_text(conversation_id, queries, limit=limit, include_embeddings=include_embeddings)
 
 
-    def search(self, conversation_id: int, query_embedding: list):
+    async def a_search_text(self, conversation_id: int, queries: list, limit: int = 5,
+                            include_embeddings: bool = False):
         """
-        This function searches for similar data in the vector database.
+        Asynchronously search for the fragments with the highest lexical (BM25) scores for the query texts.
 
         :param conversation_id: ID of the conversation
-        :param query_embedding: Query embedding to search for
+        :param queries: List of query texts to search for
+        :param limit: Number of results per query
+        :param include_embeddings: Whether to return the embeddings of the hits (as entity["embedding"])
         :return: Search results
         """
 
-        collection_name = self.__get_collection_name_by_id(conversation_id)
-        self.client.load_collection(collection_name)
-        search_params = {
-            "metric_type": "COSINE",
-        }
+        return await self.__database.a_search_text(conversation_id, queries, limit=limit,
+                                                   include_embeddings=include_embeddings)
+
+
+    async def a_insert_columns(self, conversation_id: int, embeddings: ndarray, texts: Sequence,
+                               fingerprints: Sequence = None, flush: bool = False, document_id: str = None) -> int:
+        """
+        Asynchronously insert columnar data into the collection.
+
+        :param conversation_id: ID of the conversation
+        :param embeddings: 2D array of embeddings
+        :param texts: Sequence of texts corresponding to the embeddings (list or Chunks)
+        :param fingerprints: Sequence of fingerprints corresponding to the embeddings (optional)
+        :param flush: Whether to flush the collection after inserting
+        :param document_id: ID of the document the rows belong to (optional)
+        :return: Number of inserted rows
+        """
 
         try:
-            results = self.client.search(collection_name, anns_field="embedding", data=query_embedding,
-                                         search_params=search_params,
-                                         limit=5, output_fields=["text"])
+            return await self.__database.a_insert_columns(conversation_id, embeddings, texts, fingerprints, flush=flush,
+                                                          document_id=document_id)
         finally:
-            self.client.release_collection(collection_name)
+            self.__invalidate(conversation_id)
 
-        return results
 
+    def get_index_info(self, conversation_id: int) -> dict:
+        """
+        Get the index of the embedding field of the collection.
+
+        :param conversation_id: ID of the conversation
+        :return: Dictionary with the index type, the search parameters and the number of rows waiting to be indexed
+        """
+
+        return self.__database.get_index_info(conversation_id)
+
+
+    def wait_for_index(self, conversation_id: int, poll_seconds: float = 0.5, timeout: float = None) -> None:
+        """
+        Wait until all flushed rows of the collection are indexed.
+
+        :param conversation_id: ID of the conversation
+        :param poll_seconds: Time between the checks of the index state
+        :param timeout: Maximal waiting time in seconds (None to wait indefinitely)
+        :return: None
+        """
+
+        self.__database.wait_for_index(conversation_id, poll_seconds=poll_seconds, timeout=timeout)
+
+
+    def get_residency_stats(self) -> dict:
+        """
+        Get the statistics of the collections kept in memory between searches.
+
+        :return: Dictionary of statistics
+        """
+
+        return self.__database.get_residency_stats()
+
+
+    def __invalidate(self, conversation_id: int) -> None:
+        """
+        Invalidate the cached retrieval results of the conversation (after a write to it).
+
+        :param conversation_id: ID of the conversation
+        :return: None
+        """
+
+        if self.__retrieval_cache is not None:
+            self.__retrieval_cache.invalidate(conversation_id)
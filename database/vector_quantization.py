@@ -0,0 +1,117 @@
+from pymilvus import DataType
+from database.index_selection import get_index_params
+from numpy import ndarray
+import importlib.util
+import numpy as np
+
+
+# Supported quantizations of the vectors searched in the first pass
+QUANTIZATIONS = ("none", "float16", "bfloat16", "int8", "binary")
+
+# Size of a single dimension of the quantized vector in the query node memory (in bytes)
+__BYTES_PER_DIMENSION = {
+    "none": 4,
+    "float16": 2,
+    "bfloat16": 2,
+    "int8": 1,
+    "binary": 1 / 8,
+}
+
+
+def check_quantization(quantization: str) -> None:
+    """
+    Check if the quantization is supported (and its dependencies are installed).
+
+    :param quantization: Quantization of the vectors
+    :return: None
+    """
+
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unsupported vector quantization: {quantization}. Please use one of {list(QUANTIZATIONS)}.")
+
+    # NumPy has no bfloat16 type, the vectors are converted by ml_dtypes (fail before the first insert, not during it)
+    if quantization == "bfloat16" and importlib.util.find_spec("ml_dtypes") is None:
+        raise ValueError("The bfloat16 vector quantization needs the ml_dtypes package (see requirements.txt).")
+
+
+def get_vector_field_type(quantization: str) -> DataType:
+    """
+    Get the Milvus data type of the vector field storing the quantized vectors. Int8 vectors are stored as float vectors
+    and quantized by the IVF_SQ8 index.
+
+    :param quantization: Quantization of the vectors
+    :return: Data type of the vector field
+    """
+
+    match quantization:
+        case "float16":
+            return DataType.FLOAT16_VECTOR
+        case "bfloat16":
+            return DataType.BFLOAT16_VECTOR
+        case "binary":
+            return DataType.BINARY_VECTOR
+        case _:
+            return DataType.FLOAT_VECTOR
+
+
+def get_quantized_index(quantization: str, index_type: str, build_params: dict, search_params: dict,
+                        metric_type: str) -> tuple:
+    """
+    Adapt the index to the quantization. Int8 vectors need a scalar quantization index (IVF_SQ8) and binary vectors
+    need a binary index (BIN_FLAT or BIN_IVF_FLAT) with the Hamming distance. Float16 and bfloat16 vectors use
+    the index as it is.
+
+    :param quantization: Quantization of the vectors
+    :param index_type: Type of the index
+    :param build_params: Build parameters of the index
+    :param search_params: Search parameters of the index
+    :param metric_type: Similarity metric of the full-precision vectors
+    :return: Tuple of the index type, the build parameters, the search parameters and the metric type
+    """
+
+    match quantization:
+        case "int8":
+            if index_type != "IVF_SQ8":
+                build_params, search_params = get_index_params("IVF_SQ8")
+            return "IVF_SQ8", build_params, search_params, metric_type
+        case "binary":
+            binary_index_type = "BIN_FLAT" if index_type in ("FLAT", "BIN_FLAT") else "BIN_IVF_FLAT"
+            if binary_index_type != index_type:
+                build_params, search_params = get_index_params(binary_index_type)
+            return binary_index_type, build_params, search_params, "HAMMING"
+        case _:
+            return index_type, build_params, search_params, metric_type
+
+
+def encode_vectors(quantization: str, embeddings: ndarray) -> list:
+    """
+    Convert the float32 embeddings to the values of the quantized vector field (also used for the query vectors).
+    Binary vectors keep the signs of the dimensions, packed into bytes.
+
+    :param quantization: Quantization of the vectors
+    :param embeddings: 2D float32 array of embeddings
+    :return: List of vectors in the format expected by Milvus
+    """
+
+    match quantization:
+        case "float16":
+            return list(embeddings.astype(np.float16))
+        case "bfloat16":
+            from ml_dtypes import bfloat16
+            return list(embeddings.astype(bfloat16))
+        case "binary":
+            return [row.tobytes() for row in np.packbits(embeddings > 0, axis=1)]
+        case _:
+            return embeddings.tolist()
+
+
+def get_vector_size(quantization: str, dimension: int) -> float:
+    """
+    Get the size of a single quantized vector in the query node memory.
+
+    :param quantization: Quantization of the vectors
+    :param dimension: Dimension of the embedding
+    :return: Size in bytes
+    """
+
+    return __BYTES_PER_DIMENSION[quantization] * dimension
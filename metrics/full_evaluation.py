@@ -3,6 +3,32 @@ from deepeval import evaluate
 from deepeval.test_case import LLMTestCase
 from deepeval.metrics import AnswerRelevancyMetric, FaithfulnessMetric, ContextualPrecisionMetric, ContextualRecallMetric, HallucinationMetric
 from rag.llms.llm_factory import LLMFactory
+import threading
+
+
+# Evaluation LLMs are created once per process (keyed by the LLM name and its parameters) and reused for every row
+__evaluation_llms = {}
+__evaluation_llms_lock = threading.Lock()
+
+
+def get_evaluation_llm(evaluation_llm_name: str, llm_kwargs: dict) -> LLMFactory:
+    """
+    Get the evaluation LLM with the given parameters (created on the first call).
+
+    Args:
+        evaluation_llm_name (str): The name of the evaluation LLM.
+        llm_kwargs (dict): The parameters of the evaluation LLM.
+
+    Returns:
+        LLMFactory: The evaluation LLM.
+    """
+    key = (evaluation_llm_name, repr(sorted(llm_kwargs.items())))
+
+    with __evaluation_llms_lock:
+        if key not in __evaluation_llms:
+            __evaluation_llms[key] = LLMFactory(evaluation_llm_name, **llm_kwargs)
+
+        return __evaluation_llms[key]
 
 
 def full_evaluate(
@@ -27,8 +53,7 @@ def full_evaluate(
     Returns:
         tuple[float, float, float, float, float]: A tuple containing the accuracy, faithfulness, context recall, and context precision, hallucination.
     """
-    llm_name = evaluation_llm_name
-    llm = LLMFactory(llm_name, **llm_kwargs)
+    llm = get_evaluation_llm(evaluation_llm_name, llm_kwargs)
                      
     # Define the metrics
     metrics = [
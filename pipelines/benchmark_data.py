@@ -0,0 +1,50 @@
+import numpy as np
+
+
+def generate_clustered_vectors(rng: np.random.Generator, centers: np.ndarray, count: int) -> np.ndarray:
+    """
+    Generate normalized vectors scattered around the cluster centers (similar to embeddings of related fragments).
+
+    :param rng: Random number generator
+    :param centers: Cluster centers
+    :param count: Number of vectors
+    :return: 2D float32 array of normalized vectors
+    """
+
+    assignments = rng.integers(0, len(centers), size=count)
+    vectors = centers[assignments] + rng.normal(scale=0.5, size=(count, centers.shape[1])).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    return vectors
+
+
+def get_exact_neighbours(data: np.ndarray, queries: np.ndarray, k: int, batch_size: int = 256) -> np.ndarray:
+    """
+    Find the exact k nearest neighbours (by cosine similarity) of the queries.
+
+    :param data: Normalized data vectors
+    :param queries: Normalized query vectors
+    :param k: Number of neighbours
+    :param batch_size: Number of queries compared with the data at once
+    :return: 2D array of the row indices of the neighbours of every query
+    """
+
+    neighbours = []
+    for start in range(0, len(queries), batch_size):
+        similarities = queries[start:start + batch_size] @ data.T
+        neighbours.append(np.argpartition(-similarities, k - 1, axis=1)[:, :k])
+
+    return np.concatenate(neighbours)
+
+
+def get_recall(found: list, expected: np.ndarray, k: int) -> float:
+    """
+    Compute the mean recall@k of the search results.
+
+    :param found: List of sets of the row indices found for every query
+    :param expected: 2D array of the exact neighbours of every query
+    :param k: Number of neighbours
+    :return: Mean recall@k
+    """
+
+    return float(np.mean([len(rows & set(neighbours.tolist())) / k for rows, neighbours in zip(found, expected)]))
@@ -0,0 +1,90 @@
+from database.vector_database import VectorDatabase
+from database.index_selection import estimate_index_memory, get_index_params, select_index
+from pipelines.benchmark_data import generate_clustered_vectors, get_exact_neighbours, get_recall
+import numpy as np
+import time
+
+
+def index_benchmark_pipeline(database_kwargs: dict, index_types: list = None, row_count: int = 100_000,
+                             dimension: int = 384, query_count: int = 1000, k: int = 10, seed: int = 0) -> list[dict]:
+    """
+    Benchmark the index types of the vector database on synthetic clustered data. For every index type it reports
+    the insert and index build time, the estimated index memory, the query throughput and latency, and recall@k
+    against the exact (FLAT) search. Every index type is benchmarked in a temporary collection.
+
+    :param database_kwargs: Keyword arguments of the vector database (the index options are overridden)
+    :param index_types: Index types to benchmark (by default FLAT, HNSW, IVF_FLAT and the one selected in AUTO mode)
+    :param row_count: Number of vectors in the collection
+    :param dimension: Dimension of the vectors
+    :param query_count: Number of queries
+    :param k: Number of neighbours searched for
+    :param seed: Seed of the random data
+    :return: List of results (one dictionary per index type)
+    """
+
+    if index_types is None:
+        index_types = ["FLAT", "HNSW", "IVF_FLAT", "AUTO"]
+
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(16, row_count // 1000), dimension)).astype(np.float32)
+    data = generate_clustered_vectors(rng, centers, row_count)
+    queries = generate_clustered_vectors(rng, centers, query_count)
+    texts = [str(i) for i in range(row_count)]
+    ground_truth = get_exact_neighbours(data, queries, k)
+
+    results = []
+    for i, index_type in enumerate(index_types):
+        vector_database = VectorDatabase(**{**database_kwargs, "index_type": index_type, "embedding_dimension": dimension})
+        conversation_id = 2_000_000_000 + i
+        vector_database.remove_collection(conversation_id)
+        vector_database.create_collection(conversation_id, dimension)
+
+        try:
+            # Insert the data and wait until it is indexed
+            start = time.perf_counter()
+            vector_database.insert_columns(conversation_id, data, texts, flush=True)
+            vector_database.wait_for_index(conversation_id)
+            build_seconds = time.perf_counter() - start
+
+            # Load the collection before measuring the queries
+            vector_database.search(conversation_id, queries[:1].tolist(), limit=k)
+
+            latencies = []
+            found = []
+            for query in queries:
+                start = time.perf_counter()
+                hits = vector_database.search(conversation_id, [query.tolist()], limit=k)[0]
+                latencies.append(time.perf_counter() - start)
+                found.append({int(hit["entity"]["text"]) for hit in hits})
+
+            recall = get_recall(found, ground_truth, k)
+
+            index_info = vector_database.get_index_info(conversation_id)
+            if index_type == "AUTO":
+                _, build_params, _ = select_index(row_count)
+            else:
+                build_params, _ = get_index_params(index_type, database_kwargs.get("index_build_params"))
+
+            results.append({
+                "index_type": index_type,
+                "built_index_type": index_info["index_type"],
+                "search_params": index_info["search_params"],
+                "build_seconds": build_seconds,
+                "estimated_memory_bytes": estimate_index_memory(index_info["index_type"], row_count, dimension, build_params),
+                "qps": len(latencies) / sum(latencies),
+                "p50_latency_ms": float(np.percentile(latencies, 50)) * 1000,
+                "p99_latency_ms": float(np.percentile(latencies, 99)) * 1000,
+                f"recall@{k}": float(recall),
+            })
+        finally:
+            vector_database.remove_collection(conversation_id)
+
+    for result in results:
+        print(f"{result['index_type']:>8} ({result['built_index_type']}): "
+              f"build {result['build_seconds']:.2f} s, "
+              f"memory {result['estimated_memory_bytes'] / 1024 ** 2:.1f} MiB, "
+              f"{result['qps']:.1f} QPS, "
+              f"p50 {result['p50_latency_ms']:.2f} ms, p99 {result['p99_latency_ms']:.2f} ms, "
+              f"recall@{k} {result[f'recall@{k}']:.4f}")
+
+    return results
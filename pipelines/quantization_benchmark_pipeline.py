@@ -0,0 +1,88 @@
+from database.vector_database import VectorDatabase
+from database.vector_quantization import get_vector_size
+from pipelines.benchmark_data import generate_clustered_vectors, get_exact_neighbours, get_recall
+import numpy as np
+import tempfile
+
+
+def quantization_benchmark_pipeline(database_kwargs: dict, quantizations: list = None, embeddings: np.ndarray = None,
+                                    row_count: int = 100_000, dimension: int = 384, query_count: int = 1000,
+                                    k: int = 10, rescore_factor: int = 4, seed: int = 0) -> list[dict]:
+    """
+    Benchmark the quantizations of the stored vectors. For every quantization it reports the memory of the searched
+    vectors (compared with float32 vectors) and recall@k against the exact search, both for the first pass alone
+    and after rescoring rescore_factor * k candidates with the full-precision embeddings.
+    The embeddings of our corpus can be passed (e.g. encoded fragments of the evaluation documents), otherwise synthetic
+    clustered embeddings are generated. Queries are a random sample of the embeddings, slightly perturbed.
+
+    :param database_kwargs: Keyword arguments of the vector database (the quantization options are overridden)
+    :param quantizations: Quantizations to benchmark (by default all of them)
+    :param embeddings: 2D array of embeddings to store (None to generate synthetic ones)
+    :param row_count: Number of synthetic embeddings
+    :param dimension: Dimension of the synthetic embeddings
+    :param query_count: Number of queries
+    :param k: Number of neighbours searched for
+    :param rescore_factor: Number of first-pass candidates per result rescored with full-precision embeddings
+    :param seed: Seed of the random data
+    :return: List of results (one dictionary per quantization)
+    """
+
+    if quantizations is None:
+        quantizations = ["none", "float16", "bfloat16", "int8", "binary"]
+
+    rng = np.random.default_rng(seed)
+    if embeddings is None:
+        centers = rng.normal(size=(max(16, row_count // 1000), dimension)).astype(np.float32)
+        data = generate_clustered_vectors(rng, centers, row_count)
+    else:
+        data = np.asarray(embeddings, dtype=np.float32)
+        data = data / np.maximum(np.linalg.norm(data, axis=1, keepdims=True), 1e-12)
+
+    row_count, dimension = data.shape
+    queries = data[rng.integers(0, row_count, size=query_count)]
+    queries = queries + rng.normal(scale=0.05, size=queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    texts = [str(i) for i in range(row_count)]
+    ground_truth = get_exact_neighbours(data, queries, k)
+
+    results = []
+    with tempfile.TemporaryDirectory() as full_precision_dir:
+        for i, quantization in enumerate(quantizations):
+            vector_database = VectorDatabase(**{**database_kwargs, "vector_quantization": quantization,
+                                                "rescore_factor": rescore_factor, "full_precision_dir": full_precision_dir,
+                                                "embedding_dimension": dimension})
+            backend = vector_database.get_vector_database()
+            conversation_id = 2_000_000_100 + i
+            vector_database.remove_collection(conversation_id)
+            vector_database.create_collection(conversation_id, dimension)
+
+            try:
+                vector_database.insert_columns(conversation_id, data, texts, flush=True)
+                vector_database.wait_for_index(conversation_id)
+
+                recalls = {}
+                for name, factor in (("first_pass", 1), ("rescored", rescore_factor)):
+                    # Rescoring only k candidates keeps the first pass results
+                    backend.rescore_factor = factor
+                    hits = vector_database.search(conversation_id, queries.tolist(), limit=k)
+                    recalls[name] = get_recall([{int(hit["entity"]["text"]) for hit in query_hits} for query_hits in hits],
+                                               ground_truth, k)
+
+                results.append({
+                    "quantization": quantization,
+                    "vector_memory_bytes": int(get_vector_size(quantization, dimension) * row_count),
+                    "memory_saved": 1 - get_vector_size(quantization, dimension) / get_vector_size("none", dimension),
+                    f"first_pass_recall@{k}": recalls["first_pass"],
+                    f"rescored_recall@{k}": recalls["rescored"],
+                })
+            finally:
+                vector_database.remove_collection(conversation_id)
+
+    for result in results:
+        print(f"{result['quantization']:>8}: "
+              f"vectors {result['vector_memory_bytes'] / 1024 ** 2:.1f} MiB ({result['memory_saved']:.0%} saved), "
+              f"recall@{k} {result[f'first_pass_recall@{k}']:.4f} first pass, "
+              f"{result[f'rescored_recall@{k}']:.4f} rescored ({rescore_factor}x candidates)")
+
+    return results
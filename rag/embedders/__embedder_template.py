@@ -23,4 +23,26 @@ class EmbedderTemplate(ABC):
         :return: 2D numpy array of embeddings or 1D numpy array of embedding (if only one fragment is passed)
         """
 
-        pass
\ No newline at end of file
+        pass
+
+
+    def get_tokenizer(self):
+        """
+        Get the HuggingFace tokenizer used by the embedding model. Embedders which don't use such a tokenizer
+        don't have to override this method.
+
+        :return: Tokenizer or None if not available
+        """
+
+        return None
+
+
+    def get_max_sequence_length(self) -> int | None:
+        """
+        Get the maximal number of tokens (including special tokens) the embedding model encodes. Longer fragments are
+        truncated. Embedders without such a limit don't have to override this method.
+
+        :return: Maximal sequence length or None if not available
+        """
+
+        return None
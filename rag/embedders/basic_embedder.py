@@ -27,4 +27,29 @@ class BasicEmbedder(EmbedderTemplate):
         :return: 2D numpy array of embeddings or 1D numpy array of embedding (if only one fragment is passed)
         """
 
-        return self.__embedder.encode(fragments, show_progress_bar=show_progress_bar)
\ No newline at end of file
+        # Materialize lazy sequences of fragments (e.g. Chunks) only now, when the strings are needed
+        # (a single fragment string is passed as it is, so it is encoded into a 1D embedding)
+        if not isinstance(fragments, (list, str)):
+            fragments = list(fragments)
+
+        return self.__embedder.encode(fragments, show_progress_bar=show_progress_bar)
+
+
+    def get_tokenizer(self):
+        """
+        Get the HuggingFace tokenizer used by the SentenceTransformer.
+
+        :return: Tokenizer
+        """
+
+        return self.__embedder.tokenizer
+
+
+    def get_max_sequence_length(self) -> int | None:
+        """
+        Get the maximal number of tokens (including special tokens) the SentenceTransformer encodes.
+
+        :return: Maximal sequence length
+        """
+
+        return self.__embedder.max_seq_length
@@ -4,8 +4,12 @@ from rag.embedders.basic_embedder import BasicEmbedder
 
 
 from rag.embedders.__embedder_template import EmbedderTemplate
+from rag.embedders.embedding_cache import EmbeddingCache
+from rag.utils.metrics_sink import get_metrics_sink
 from numpy import ndarray
+import numpy as np
 import logging
+import time
 
 
 class EmbedderFactory(EmbedderTemplate):
@@ -13,6 +17,8 @@ class EmbedderFactory(EmbedderTemplate):
     Factory class for creating embedding models. This class allows you to set the embedding model by calling the
     set_embedder method with the desired embedder name. Then, you can use the encode method to convert list of texts into
     embeddings. You have to pass an existing embedding model and its parameters to the constructor.
+    If the "cache" parameter is passed (dictionary with cache_dir and optionally max_entries), embeddings are cached
+    on disk and only the fragments missing from the cache are encoded by the embedding model.
 
     :param embedder_name: Name of the embedding model to be set
     :param kwargs: Additional parameters for the embedding model
@@ -21,6 +27,7 @@ class EmbedderFactory(EmbedderTemplate):
     def __init__(self, embedder_name: str, **kwargs):
         super().__init__(embedder_name)
         self.__embedder = None
+        self.__cache = None
         self.set_embedder(embedder_name, **kwargs)
 
 
@@ -49,6 +56,14 @@ class EmbedderFactory(EmbedderTemplate):
         # Set the embedder name
         self.embedder_name = embedder_name
 
+        # Create the embedding cache of the model (keyed by the embedder name and its parameters)
+        cache_kwargs = kwargs.pop("cache", None)
+        if cache_kwargs is not None:
+            model_name = "-".join([embedder_name] + [str(value) for key, value in sorted(kwargs.items()) if key != "device"])
+            self.__cache = EmbeddingCache(model_name=model_name, **cache_kwargs)
+        else:
+            self.__cache = None
+
         # ============================= Switch between models =============================
         match embedder_name:
             case "basic-embedder":
@@ -62,18 +77,90 @@ class EmbedderFactory(EmbedderTemplate):
         """
         Encode a list of text fragments into embeddings.
 
-        :param fragments: List of text fragments to encode
+        :param fragments: List of text fragments to encode (or a single fragment string)
         :param show_progress_bar: Whether to show a progress bar
         :return: 2D numpy array of embeddings or 1D numpy array of embedding (if only one fragment is passed)
         """
 
-        logging.info(f"Embedder: {self.embedder_name} - Encoding {len(fragments)} fragments.")
+        fragment_count = 1 if isinstance(fragments, str) else len(fragments)
+        logging.info("Embedder: %s - Encoding %d fragments.", self.embedder_name, fragment_count)
 
         if self.__embedder is None:
             raise ValueError("Embedder not set. Please set an embedder before encoding.")
 
-        embeddings = self.__embedder.encode(fragments, show_progress_bar=show_progress_bar)
-
-        logging.info(f"Embedder: {self.embedder_name} - Finished encoding {len(fragments)} fragments.")
+        start = time.perf_counter()
+        if self.__cache is None or len(fragments) == 0:
+            embeddings = self.__embedder.encode(fragments, show_progress_bar=show_progress_bar)
+            cache_hits = None
+        elif isinstance(fragments, str):
+            # A single fragment is encoded into a 1D embedding, as by the embedding model
+            embeddings, cache_hits = self.__encode_with_cache([fragments], show_progress_bar=show_progress_bar)
+            embeddings = embeddings[0]
+        else:
+            embeddings, cache_hits = self.__encode_with_cache(fragments, show_progress_bar=show_progress_bar)
+
+        logging.info("Embedder: %s - Finished encoding %d fragments.", self.embedder_name, fragment_count)
+
+        # Record the call in the metrics sink (if the metrics are enabled)
+        sink = get_metrics_sink()
+        if sink is not None:
+            sink.record("embedder_call", {
+                "latency_seconds": time.perf_counter() - start,
+                "fragments": fragment_count,
+                "cache_hits": cache_hits,
+            }, {"embedder": self.embedder_name, "cache": "on" if self.__cache is not None else "off"})
 
         return embeddings
+
+
+    def get_tokenizer(self):
+        """
+        Get the HuggingFace tokenizer used by the embedding model.
+
+        :return: Tokenizer or None if not available
+        """
+
+        return self.__embedder.get_tokenizer() if self.__embedder is not None else None
+
+
+    def get_max_sequence_length(self) -> int | None:
+        """
+        Get the maximal number of tokens (including special tokens) the embedding model encodes.
+
+        :return: Maximal sequence length or None if not available
+        """
+
+        return self.__embedder.get_max_sequence_length() if self.__embedder is not None else None
+
+
+    def __encode_with_cache(self, fragments: list, show_progress_bar: bool = False) -> tuple:
+        """
+        Encode the fragments, taking the cached embeddings from the cache. Fragments missing from the cache are encoded
+        by the embedding model in a single batch and stored in the cache.
+
+        :param fragments: List of text fragments to encode
+        :param show_progress_bar: Whether to show a progress bar
+        :return: Tuple of the 2D numpy array of embeddings and the number of fragments found in the cache
+        """
+
+        embeddings, found = self.__cache.lookup(fragments)
+        if found.all():
+            return embeddings, len(fragments)
+
+        # Encode every missing fragment only once
+        missing_fragments = list(dict.fromkeys(fragment for fragment, is_found in zip(fragments, found) if not is_found))
+        missing_embeddings = np.asarray(self.__embedder.encode(missing_fragments, show_progress_bar=show_progress_bar),
+                                        dtype=np.float32).reshape(len(missing_fragments), -1)
+        self.__cache.store(missing_fragments, missing_embeddings)
+
+        if embeddings is None:
+            embeddings = np.empty((len(fragments), missing_embeddings.shape[1]), dtype=np.float32)
+
+        rows = {fragment: row for row, fragment in enumerate(missing_fragments)}
+        missing_indices = np.flatnonzero(~found)
+        embeddings[missing_indices] = missing_embeddings[[rows[fragments[i]] for i in missing_indices]]
+
+        cache_hits = len(fragments) - len(missing_indices)
+        logging.info("Embedder: %s - %d fragments found in the cache.", self.embedder_name, cache_hits)
+
+        return embeddings, cache_hits
@@ -0,0 +1,264 @@
+from contextlib import contextmanager
+from numpy import ndarray
+import numpy as np
+import fcntl
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+
+class EmbeddingCache:
+    """
+    Persistent cache of embeddings computed by a single model. Embeddings are stored in a memory-mapped float32 matrix
+    file with a fixed number of rows, and the SHA-256 of every cached text is mapped to its row by an SQLite index.
+    When the matrix is full, the least recently used rows are reused. The cache can be shared by many processes:
+    reads take a shared file lock and writes take an exclusive one.
+
+    :param cache_dir: Directory where the caches of all models are stored
+    :param model_name: Name of the model (every model has its own cache)
+    :param max_entries: Maximal number of cached embeddings
+    """
+
+    # Maximal number of parameters in a single SQLite query
+    __QUERY_BATCH_SIZE = 900
+
+    # Minimal number of seconds between two updates of the last use of an embedding (lookups of recently used
+    # embeddings don't write to the index)
+    __TOUCH_INTERVAL = 60.0
+
+
+    def __init__(self, cache_dir: str, model_name: str, max_entries: int = 200_000) -> None:
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.__directory = os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", model_name))
+        os.makedirs(self.__directory, exist_ok=True)
+
+        self.__lock = threading.RLock()
+        self.__lock_file = open(os.path.join(self.__directory, "cache.lock"), "a+")
+        self.__matrix = None
+
+        self.__connection = sqlite3.connect(os.path.join(self.__directory, "index.sqlite"), timeout=60,
+                                            isolation_level=None, check_same_thread=False)
+
+        with self.__file_lock(exclusive=True):
+            self.__connection.execute("PRAGMA journal_mode=WAL")
+            self.__connection.execute("CREATE TABLE IF NOT EXISTS entries "
+                                      "(key BLOB PRIMARY KEY, row INTEGER NOT NULL, last_used REAL NOT NULL)")
+            self.__connection.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+            self.__connection.execute("CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+
+    def lookup(self, texts: list) -> tuple:
+        """
+        Look up the embeddings of the texts. The found rows are copied from the memory-mapped matrix into the result
+        (views of the matrix are not returned, as their rows may be reused by an eviction in another process).
+
+        :param texts: List of texts
+        :return: Tuple of a 2D float32 array of embeddings (rows of missing texts are zeros; None if the cache is empty)
+                 and a boolean array marking the texts found in the cache
+        """
+
+        keys = [self.__hash(text) for text in texts]
+        found = np.zeros(len(texts), dtype=bool)
+        embeddings = None
+        stale_keys = []
+
+        with self.__file_lock(exclusive=False):
+            matrix = self.__get_matrix()
+
+            if matrix is not None:
+                entries = self.__get_entries(set(keys))
+                found_indices = [i for i, key in enumerate(keys) if key in entries]
+                found_rows = [entries[keys[i]][0] for i in found_indices]
+
+                if len(found_indices) == len(texts):
+                    # All texts found: copy the rows straight into the result
+                    embeddings = np.empty((len(texts), matrix.shape[1]), dtype=np.float32)
+                    np.take(matrix, found_rows, axis=0, out=embeddings)
+                else:
+                    embeddings = np.zeros((len(texts), matrix.shape[1]), dtype=np.float32)
+                    if found_indices:
+                        embeddings[found_indices] = matrix[found_rows]
+                found[found_indices] = True
+
+                stale_before = time.time() - self.__TOUCH_INTERVAL
+                stale_keys = [key for key, (_, last_used) in entries.items() if last_used < stale_before]
+
+        # Mark the found embeddings as recently used (in a single transaction, only if not marked recently)
+        if stale_keys:
+            now = time.time()
+            with self.__file_lock(exclusive=True):
+                self.__connection.execute("BEGIN IMMEDIATE")
+                try:
+                    self.__connection.executemany("UPDATE entries SET last_used = ? WHERE key = ?",
+                                                  [(now, key) for key in stale_keys])
+                    self.__connection.execute("COMMIT")
+                except BaseException:
+                    self.__connection.execute("ROLLBACK")
+                    raise
+
+        with self.__lock:
+            self.hits += int(found.sum())
+            self.misses += len(texts) - int(found.sum())
+
+        return embeddings, found
+
+
+    def store(self, texts: list, embeddings: ndarray) -> None:
+        """
+        Store the embeddings of the texts, evicting the least recently used ones if the cache is full.
+
+        :param texts: List of texts
+        :param embeddings: 2D array of embeddings of the texts
+        :return: None
+        """
+
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(texts), -1)
+
+        # Deduplicate the texts
+        indices_by_key = {}
+        for i, text in enumerate(texts):
+            indices_by_key[self.__hash(text)] = i
+
+        with self.__file_lock(exclusive=True):
+            matrix = self.__get_matrix(dimension=embeddings.shape[1])
+            if matrix.shape[1] != embeddings.shape[1]:
+                raise ValueError(f"Embedding dimension {embeddings.shape[1]} does not match the cache dimension "
+                                 f"{matrix.shape[1]} of model {self.model_name}.")
+
+            existing_entries = self.__get_entries(set(indices_by_key))
+            new_keys = [key for key in indices_by_key if key not in existing_entries][:matrix.shape[0]]
+            if not new_keys:
+                return
+
+            now = time.time()
+            self.__connection.execute("BEGIN IMMEDIATE")
+            try:
+                # Rows 0..count-1 are always occupied, so free rows follow them
+                count = self.__connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+                rows = list(range(count, min(count + len(new_keys), matrix.shape[0])))
+
+                # Reuse the rows of the least recently used embeddings
+                evicted_count = len(new_keys) - len(rows)
+                if evicted_count > 0:
+                    evicted = self.__connection.execute("SELECT key, row FROM entries ORDER BY last_used LIMIT ?",
+                                                        (evicted_count,)).fetchall()
+                    self.__connection.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in evicted])
+                    rows.extend(row for _, row in evicted)
+
+                    with self.__lock:
+                        self.evictions += len(evicted)
+
+                matrix[rows] = embeddings[[indices_by_key[key] for key in new_keys]]
+                self.__connection.executemany("INSERT INTO entries (key, row, last_used) VALUES (?, ?, ?)",
+                                              [(key, row, now) for key, row in zip(new_keys, rows)])
+                self.__connection.execute("COMMIT")
+            except BaseException:
+                self.__connection.execute("ROLLBACK")
+                raise
+
+
+    def get_stats(self) -> dict:
+        """
+        Get the cache statistics.
+
+        :return: Dictionary with hits, misses, evictions and hit rate
+        """
+
+        with self.__lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+    @contextmanager
+    def __file_lock(self, exclusive: bool):
+        """
+        Lock the cache for the other threads and processes.
+
+        :param exclusive: Whether to take an exclusive (write) lock instead of a shared (read) lock
+        """
+
+        with self.__lock:
+            fcntl.flock(self.__lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(self.__lock_file, fcntl.LOCK_UN)
+
+
+    def __get_matrix(self, dimension: int = None):
+        """
+        Get the memory-mapped embedding matrix. If the cache is empty, it is created with the given dimension
+        (this requires the exclusive lock).
+
+        :param dimension: Embedding dimension used to create the matrix (None to only open an existing one)
+        :return: Memory-mapped matrix or None if the cache is empty and no dimension was given
+        """
+
+        if self.__matrix is not None:
+            return self.__matrix
+
+        metadata = dict(self.__connection.execute("SELECT name, value FROM metadata").fetchall())
+        path = os.path.join(self.__directory, "embeddings.f32")
+
+        if "dimension" not in metadata:
+            if dimension is None:
+                return None
+
+            metadata = {"dimension": dimension, "capacity": self.max_entries}
+            self.__connection.executemany("INSERT INTO metadata (name, value) VALUES (?, ?)", metadata.items())
+            with open(path, "wb") as file:
+                file.truncate(metadata["capacity"] * dimension * np.dtype(np.float32).itemsize)  # Sparse file
+
+        if metadata["capacity"] != self.max_entries:
+            logging.info(f"Embedding cache: {self.model_name} was created with {metadata['capacity']} entries, "
+                         f"using it instead of {self.max_entries}.")
+
+        self.__matrix = np.memmap(path, dtype=np.float32, mode="r+", shape=(metadata["capacity"], metadata["dimension"]))
+
+        return self.__matrix
+
+
+    def __get_entries(self, keys: set) -> dict:
+        """
+        Get the matrix rows and the last use times of the cached keys.
+
+        :param keys: Set of keys
+        :return: Dictionary mapping the cached keys to tuples of their row and last use time
+        """
+
+        keys = list(keys)
+        entries = {}
+
+        for i in range(0, len(keys), self.__QUERY_BATCH_SIZE):
+            batch = keys[i:i + self.__QUERY_BATCH_SIZE]
+            placeholders = ", ".join("?" * len(batch))
+            entries.update((key, (row, last_used)) for key, row, last_used in self.__connection.execute(
+                f"SELECT key, row, last_used FROM entries WHERE key IN ({placeholders})", batch))
+
+        return entries
+
+
+    @staticmethod
+    def __hash(text: str) -> bytes:
+        """
+        Hash the text (the key of its embedding).
+
+        :param text: Text to be hashed
+        :return: SHA-256 digest of the text
+        """
+
+        return hashlib.sha256(text.encode("utf-8")).digest()
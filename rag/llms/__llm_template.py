@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from typing import AsyncIterator, Iterator
 from deepeval.models import DeepEvalBaseLLM
 
 
@@ -56,4 +57,38 @@ class LLMTemplate(DeepEvalBaseLLM):
         :param prompt: The prompt to generate a response for
         :return: The generated response
         """
-        pass
\ No newline at end of file
+        pass
+
+
+    def stream(self, prompt: str, usage: dict = None) -> Iterator[str]:
+        """
+        Generate a response as a stream of text deltas. LLMs without streaming support don't have to override this
+        method (the whole response is yielded as a single delta). Errors are raised instead of being returned.
+
+        :param prompt: The prompt to generate a response for
+        :param usage: Dictionary filled with the usage ("input_tokens", "output_tokens", "retries") if the API reports it (optional)
+        :return: Iterator of text deltas
+        """
+
+        response = self.generate(prompt)
+        if isinstance(response, BaseException):
+            raise response
+
+        yield response
+
+
+    async def a_stream(self, prompt: str, usage: dict = None) -> AsyncIterator[str]:
+        """
+        Asynchronously generate a response as a stream of text deltas. LLMs without streaming support don't have to
+        override this method (the whole response is yielded as a single delta). Errors are raised instead of being returned.
+
+        :param prompt: The prompt to generate a response for
+        :param usage: Dictionary filled with the usage ("input_tokens", "output_tokens", "retries") if the API reports it (optional)
+        :return: Async iterator of text deltas
+        """
+
+        response = await self.a_generate(prompt)
+        if isinstance(response, BaseException):
+            raise response
+
+        yield response
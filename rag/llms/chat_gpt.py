@@ -1,5 +1,6 @@
 from rag.llms.__llm_template import LLMTemplate
-from openai import OpenAI, AsyncOpenAI
+from rag.llms.llm_dispatcher import dispatch, a_dispatch, set_rate_limit
+from typing import AsyncIterator, Iterator
 
 
 class ChatGPT(LLMTemplate):
@@ -7,19 +8,28 @@ class ChatGPT(LLMTemplate):
     ChatGPT class for generating text using the OpenAI API.
     This class is a wrapper around the OpenAI API for generating text.
     It uses the OpenAI API to generate text based on the provided prompt.
+    Requests go through the process-wide LLM dispatcher (rag.llms.llm_dispatcher), which shares the HTTP clients,
+    enforces the rate limit of the model and retries transient errors. Errors which can't be retried are raised.
     It inherits from the LLMTemplate class (DeepEvalBaseLLM).
 
     :param llm_name: Name of the LLM
     :param initial_prompt: Initial prompt for the LLM
     :param api_key: API key for the OpenAI API
+    :param model_name: Name of the model
+    :param rate_limit: Rate limit and retry settings of the model (see rag.llms.llm_dispatcher.set_rate_limit, optional)
+    :param base_url: Base URL of an OpenAI-compatible API (None for the OpenAI API)
     """
 
-    def __init__(self, llm_name: str, initial_prompt: str, api_key: str, model_name: str) -> None:
+    def __init__(self, llm_name: str, initial_prompt: str, api_key: str, model_name: str, rate_limit: dict = None,
+                 base_url: str = None) -> None:
         super().__init__(llm_name)
         self.initial_prompt = initial_prompt
-        self.client = OpenAI(api_key=api_key)
-        self.async_client = AsyncOpenAI(api_key=api_key)
+        self.api_key = api_key
         self.model = model_name
+        self.base_url = base_url
+
+        if rate_limit is not None:
+            set_rate_limit(self.base_url, self.api_key, self.model, **rate_limit)
 
 
     def get_model_name(self):
@@ -49,18 +59,14 @@ class ChatGPT(LLMTemplate):
         :return: Generated response
         """
 
-        try:
-            # Generate a response using the OpenAI API
-            response = self.client.responses.create(
-                model = self.model,
-                instructions = self.initial_prompt,
-                input = prompt,
-            )
-            response = response.output_text
-        except Exception as e: # Return error
-            response = e
+        # Generate a response using the OpenAI API
+        response = dispatch(self.base_url, self.api_key, self.model, lambda client: client.responses.create(
+            model = self.model,
+            instructions = self.initial_prompt,
+            input = prompt,
+        ), input_text=self.initial_prompt + prompt)
 
-        return response
+        return response.output_text
 
 
     async def a_generate(self, prompt: str) -> str:
@@ -71,14 +77,77 @@ class ChatGPT(LLMTemplate):
         :return: generated response
         """
 
-        try:
-            response = await self.async_client.responses.create(
-                model = self.model,
-                instructions=self.initial_prompt,
-                input = prompt,
-            )
-            response = response.output_text
-        except Exception as e: # Return error
-            response = e
-
-        return response
\ No newline at end of file
+        response = await a_dispatch(self.base_url, self.api_key, self.model, lambda client: client.responses.create(
+            model = self.model,
+            instructions = self.initial_prompt,
+            input = prompt,
+        ), input_text=self.initial_prompt + prompt)
+
+        return response.output_text
+
+
+    def stream(self, prompt: str, usage: dict = None) -> Iterator[str]:
+        """
+        Generate a response as a stream of text deltas using the streaming OpenAI Responses API.
+
+        :param prompt: The input prompt for the LLM
+        :param usage: Dictionary filled with the usage ("input_tokens", "output_tokens", "retries") (optional)
+        :return: Iterator of text deltas
+        """
+
+        events = dispatch(self.base_url, self.api_key, self.model, lambda client: client.responses.create(
+            model = self.model,
+            instructions = self.initial_prompt,
+            input = prompt,
+            stream = True,
+        ), input_text=self.initial_prompt + prompt, usage=usage)
+
+        for event in events:
+            delta = self.__handle_event(event, usage)
+            if delta:
+                yield delta
+
+
+    async def a_stream(self, prompt: str, usage: dict = None) -> AsyncIterator[str]:
+        """
+        Asynchronously generate a response as a stream of text deltas using the streaming OpenAI Responses API.
+
+        :param prompt: The input prompt for the LLM
+        :param usage: Dictionary filled with the usage ("input_tokens", "output_tokens", "retries") (optional)
+        :return: Async iterator of text deltas
+        """
+
+        events = await a_dispatch(self.base_url, self.api_key, self.model, lambda client: client.responses.create(
+            model = self.model,
+            instructions = self.initial_prompt,
+            input = prompt,
+            stream = True,
+        ), input_text=self.initial_prompt + prompt, usage=usage)
+
+        async for event in events:
+            delta = self.__handle_event(event, usage)
+            if delta:
+                yield delta
+
+
+    @staticmethod
+    def __handle_event(event, usage: dict | None) -> str | None:
+        """
+        Handle a streaming event of the Responses API.
+
+        :param event: Streaming event
+        :param usage: Dictionary filled with the usage (optional)
+        :return: Text delta or None if the event carries no text
+        """
+
+        match event.type:
+            case "response.output_text.delta":
+                return event.delta
+            case "response.completed":
+                if usage is not None and event.response.usage is not None:
+                    usage["input_tokens"] = event.response.usage.input_tokens
+                    usage["output_tokens"] = event.response.usage.output_tokens
+            case "response.failed" | "error":
+                raise RuntimeError(f"Streaming response failed: {getattr(event, 'message', None) or event.response.error}")
+
+        return None
@@ -0,0 +1,437 @@
+from openai import OpenAI, AsyncOpenAI, APIConnectionError
+from typing import Awaitable, Callable
+from contextlib import contextmanager
+import asyncio
+import contextvars
+import atexit
+import logging
+import random
+import threading
+import time
+import weakref
+
+
+class LLMProviderError(Exception):
+    """
+    Error reported in the body of a response instead of its HTTP status (e.g. by OpenRouter when the upstream provider
+    fails). It is retried like the HTTP errors with the same status code.
+
+    :param message: Message of the error
+    :param status_code: Status code of the error (None if it is unknown)
+    """
+
+    def __init__(self, message: str, status_code: int = None) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class RateLimiter:
+    """
+    Token bucket limiting the requests per minute and the tokens per minute sent to a model. Every request reserves
+    one request and its estimated tokens, and waits until both budgets allow it. The budgets may go negative,
+    so concurrent requests queue up behind each other instead of polling. Once the actual token usage is known,
+    the estimate is corrected by adjust.
+
+    :param requests_per_minute: Maximal number of requests per minute (None for no limit)
+    :param tokens_per_minute: Maximal number of tokens per minute (None for no limit)
+    :param burst_seconds: Number of seconds of the budgets which can be spent at once
+    """
+
+    def __init__(self, requests_per_minute: float = None, tokens_per_minute: float = None, burst_seconds: float = 1.0) -> None:
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.burst_seconds = burst_seconds
+
+        # Both buckets start full
+        self.__requests = self.__get_capacity(requests_per_minute)
+        self.__tokens = self.__get_capacity(tokens_per_minute)
+        self.__updated = time.monotonic()
+        self.__lock = threading.Lock()
+
+
+    def reserve(self, tokens: int) -> float:
+        """
+        Reserve a request with the given number of tokens.
+
+        :param tokens: Estimated number of tokens of the request
+        :return: Number of seconds to wait before sending the request
+        """
+
+        with self.__lock:
+            self.__refill()
+
+            self.__requests -= 1
+            self.__tokens -= tokens
+
+            return max(self.__get_wait(self.__requests, self.requests_per_minute),
+                       self.__get_wait(self.__tokens, self.tokens_per_minute))
+
+
+    def adjust(self, tokens: int) -> None:
+        """
+        Correct the tokens of a sent request (e.g. by the difference of the actual and the estimated usage).
+
+        :param tokens: Number of tokens to be taken from the budget (negative to return them)
+        :return: None
+        """
+
+        with self.__lock:
+            self.__refill()
+            self.__tokens -= tokens
+
+
+    def __refill(self) -> None:
+        """
+        Refill the buckets by the budgets of the time elapsed since the last refill.
+
+        :return: None
+        """
+
+        now = time.monotonic()
+        elapsed = now - self.__updated
+        self.__updated = now
+
+        if self.requests_per_minute is not None:
+            self.__requests = min(self.__get_capacity(self.requests_per_minute),
+                                  self.__requests + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute is not None:
+            self.__tokens = min(self.__get_capacity(self.tokens_per_minute),
+                                self.__tokens + elapsed * self.tokens_per_minute / 60)
+
+
+    def __get_capacity(self, per_minute: float | None) -> float:
+        """
+        Get the capacity of a bucket (at least one request or one token, so every request can pass eventually).
+
+        :param per_minute: Budget per minute (None for no limit)
+        :return: Capacity of the bucket
+        """
+
+        if per_minute is None:
+            return float("inf")
+
+        return max(1.0, per_minute * self.burst_seconds / 60)
+
+
+    @staticmethod
+    def __get_wait(level: float, per_minute: float | None) -> float:
+        """
+        Get the time until the bucket is refilled to zero.
+
+        :param level: Current level of the bucket
+        :param per_minute: Budget per minute (None for no limit)
+        :return: Number of seconds to wait
+        """
+
+        if per_minute is None or level >= 0:
+            return 0.0
+
+        return -level * 60 / per_minute
+
+
+# Process-wide OpenAI clients shared by all LLMs, keyed by the base URL and the API key (every client keeps its own
+# HTTP connection pool)
+__clients = {}
+
+# Async clients are bound to the event loop they were created in, so they are kept per event loop
+__async_clients = weakref.WeakKeyDictionary()
+
+# Rate limits and retry settings of the models, keyed by the base URL, the API key and the model name
+__routes = {}
+
+__lock = threading.Lock()
+
+# Usage dictionary of the LLM call running in the current context (see track_usage)
+__current_usage = contextvars.ContextVar("llm_call_usage", default=None)
+
+# Default retry settings (exponential backoff with full jitter)
+__DEFAULT_ROUTE = {
+    "rate_limiter": None,
+    "expected_output_tokens": 256,
+    "max_retries": 5,
+    "initial_backoff": 1.0,
+    "max_backoff": 60.0,
+}
+
+
+def get_openai_client(base_url: str | None, api_key: str) -> OpenAI:
+    """
+    Get the OpenAI client of the API. The client is created once per process and shared by all LLMs using the same API
+    and key. (Retries are done by the dispatcher, so the client doesn't retry by itself.)
+
+    :param base_url: Base URL of the API (None for the OpenAI API)
+    :param api_key: API key
+    :return: OpenAI client
+    """
+
+    with __lock:
+        if (base_url, api_key) not in __clients:
+            __clients[(base_url, api_key)] = OpenAI(base_url=base_url, api_key=api_key, max_retries=0)
+
+        return __clients[(base_url, api_key)]
+
+
+def get_async_openai_client(base_url: str | None, api_key: str) -> AsyncOpenAI:
+    """
+    Get the async OpenAI client of the API. The client is created once per event loop and shared by all LLMs using
+    the same API and key. It must be called from a coroutine.
+
+    :param base_url: Base URL of the API (None for the OpenAI API)
+    :param api_key: API key
+    :return: Async OpenAI client
+    """
+
+    loop = asyncio.get_running_loop()
+
+    with __lock:
+        clients = __async_clients.setdefault(loop, {})
+        if (base_url, api_key) not in clients:
+            clients[(base_url, api_key)] = AsyncOpenAI(base_url=base_url, api_key=api_key, max_retries=0)
+
+        return clients[(base_url, api_key)]
+
+
+def set_rate_limit(base_url: str | None, api_key: str, model_name: str, requests_per_minute: float = None,
+                   tokens_per_minute: float = None, burst_seconds: float = 1.0, expected_output_tokens: int = 256,
+                   max_retries: int = 5, initial_backoff: float = 1.0, max_backoff: float = 60.0) -> None:
+    """
+    Set the rate limit and the retry settings of the model. All LLMs of the process calling the same model with the same
+    key share them (the last settings win).
+
+    :param base_url: Base URL of the API (None for the OpenAI API)
+    :param api_key: API key
+    :param model_name: Name of the model
+    :param requests_per_minute: Maximal number of requests per minute (None for no limit)
+    :param tokens_per_minute: Maximal number of tokens per minute (None for no limit)
+    :param burst_seconds: Number of seconds of the budgets which can be spent at once
+    :param expected_output_tokens: Number of output tokens reserved for every request before its usage is known
+    :param max_retries: Maximal number of retries of a failed request
+    :param initial_backoff: Maximal wait before the first retry in seconds (doubled by every retry)
+    :param max_backoff: Maximal wait between the retries in seconds
+    :return: None
+    """
+
+    with __lock:
+        # The bucket is kept if the limits didn't change (e.g. when an LLM is created again), so it isn't refilled
+        rate_limiter = __routes.get((base_url, api_key, model_name), __DEFAULT_ROUTE)["rate_limiter"]
+        if requests_per_minute is None and tokens_per_minute is None:
+            rate_limiter = None
+        elif (rate_limiter is None or (rate_limiter.requests_per_minute, rate_limiter.tokens_per_minute,
+                                       rate_limiter.burst_seconds) != (requests_per_minute, tokens_per_minute, burst_seconds)):
+            rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute, burst_seconds)
+
+        __routes[(base_url, api_key, model_name)] = {
+            "rate_limiter": rate_limiter,
+            "expected_output_tokens": expected_output_tokens,
+            "max_retries": max_retries,
+            "initial_backoff": initial_backoff,
+            "max_backoff": max_backoff,
+        }
+
+
+def dispatch(base_url: str | None, api_key: str, model_name: str, request: Callable[[OpenAI], object], input_text: str = "",
+             usage: dict = None):
+    """
+    Send the request to the model, respecting its rate limit. Rate limit errors (429), server errors (5xx) and connection
+    errors are retried with jittered exponential backoff (or after the time the server asks for). It can be called
+    from many threads at once.
+
+    :param base_url: Base URL of the API (None for the OpenAI API)
+    :param api_key: API key
+    :param model_name: Name of the model
+    :param request: Function sending the request with the given client and returning the response
+    :param input_text: Text sent to the model (used to estimate the tokens of the request)
+    :param usage: Dictionary filled with the number of retries and the reported input and output tokens
+                  (None to fill the dictionary of track_usage, if any)
+    :return: Response
+    """
+
+    route = __get_route(base_url, api_key, model_name)
+    client = get_openai_client(base_url, api_key)
+    estimated_tokens = __estimate_tokens(input_text, route)
+
+    usage = usage if usage is not None else __current_usage.get()
+
+    for attempt in range(route["max_retries"] + 1):
+        if usage is not None:
+            usage["retries"] = attempt
+
+        if route["rate_limiter"] is not None:
+            time.sleep(route["rate_limiter"].reserve(estimated_tokens))
+
+        try:
+            response = request(client)
+        except Exception as e:
+            time.sleep(__get_backoff(e, attempt, route, model_name))
+            continue
+
+        __adjust_usage(response, estimated_tokens, route, usage)
+        return response
+
+
+async def a_dispatch(base_url: str | None, api_key: str, model_name: str,
+                     request: Callable[[AsyncOpenAI], Awaitable], input_text: str = "", usage: dict = None):
+    """
+    Asynchronously send the request to the model, respecting its rate limit (the same as dispatch). Many requests can be
+    awaited concurrently, the rate limit is shared with the synchronous requests.
+
+    :param base_url: Base URL of the API (None for the OpenAI API)
+    :param api_key: API key
+    :param model_name: Name of the model
+    :param request: Coroutine function sending the request with the given async client and returning the response
+    :param input_text: Text sent to the model (used to estimate the tokens of the request)
+    :param usage: Dictionary filled with the number of retries and the reported input and output tokens
+                  (None to fill the dictionary of track_usage, if any)
+    :return: Response
+    """
+
+    route = __get_route(base_url, api_key, model_name)
+    client = get_async_openai_client(base_url, api_key)
+    estimated_tokens = __estimate_tokens(input_text, route)
+
+    usage = usage if usage is not None else __current_usage.get()
+
+    for attempt in range(route["max_retries"] + 1):
+        if usage is not None:
+            usage["retries"] = attempt
+
+        if route["rate_limiter"] is not None:
+            await asyncio.sleep(route["rate_limiter"].reserve(estimated_tokens))
+
+        try:
+            response = await request(client)
+        except Exception as e:
+            await asyncio.sleep(__get_backoff(e, attempt, route, model_name))
+            continue
+
+        __adjust_usage(response, estimated_tokens, route, usage)
+        return response
+
+
+@contextmanager
+def track_usage(usage: dict):
+    """
+    Fill the usage dictionary by the requests dispatched in the current context (thread or async task) within the block
+    (the number of retries and the reported input and output tokens of the last request).
+
+    :param usage: Usage dictionary
+    """
+
+    token = __current_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        __current_usage.reset(token)
+
+
+def close_clients() -> None:
+    """
+    Close all synchronous OpenAI clients of the process (async clients are closed with their event loops).
+
+    :return: None
+    """
+
+    with __lock:
+        clients = list(__clients.values())
+        __clients.clear()
+
+    for client in clients:
+        try:
+            client.close()
+        except Exception as e:
+            logging.info(f"Closing OpenAI client failed: {e}")
+
+
+def __get_route(base_url: str | None, api_key: str, model_name: str) -> dict:
+    """
+    Get the rate limit and the retry settings of the model.
+
+    :param base_url: Base URL of the API (None for the OpenAI API)
+    :param api_key: API key
+    :param model_name: Name of the model
+    :return: Dictionary of the settings (the defaults if they were not set)
+    """
+
+    with __lock:
+        return __routes.get((base_url, api_key, model_name), __DEFAULT_ROUTE)
+
+
+def __estimate_tokens(input_text: str, route: dict) -> int:
+    """
+    Estimate the tokens of a request before its usage is known (about 4 characters per input token plus the expected
+    output tokens).
+
+    :param input_text: Text sent to the model
+    :param route: Settings of the model
+    :return: Estimated number of tokens
+    """
+
+    return len(input_text) // 4 + route["expected_output_tokens"]
+
+
+def __adjust_usage(response, estimated_tokens: int, route: dict, usage: dict | None) -> None:
+    """
+    Correct the reserved tokens by the usage reported in the response and fill the usage dictionary
+    (streamed responses report the usage only at the end, so their estimate is kept).
+
+    :param response: Response of the model
+    :param estimated_tokens: Estimated number of tokens of the request
+    :param route: Settings of the model
+    :param usage: Usage dictionary to be filled (optional)
+    :return: None
+    """
+
+    reported = getattr(response, "usage", None)
+    total_tokens = getattr(reported, "total_tokens", None)
+    if route["rate_limiter"] is not None and isinstance(total_tokens, int):
+        route["rate_limiter"].adjust(total_tokens - estimated_tokens)
+
+    # The Responses API reports input/output tokens, the chat completions report prompt/completion tokens
+    if usage is not None and reported is not None:
+        for name, reported_names in (("input_tokens", ("input_tokens", "prompt_tokens")),
+                                     ("output_tokens", ("output_tokens", "completion_tokens"))):
+            for reported_name in reported_names:
+                value = getattr(reported, reported_name, None)
+                if isinstance(value, int):
+                    usage[name] = value
+                    break
+
+
+def __get_backoff(error: Exception, attempt: int, route: dict, model_name: str) -> float:
+    """
+    Get the wait before retrying a failed request, or raise the error if it can't be retried.
+
+    :param error: Error of the request
+    :param attempt: Number of the failed attempt (starting from 0)
+    :param route: Settings of the model
+    :param model_name: Name of the model
+    :return: Number of seconds to wait
+    """
+
+    status_code = getattr(error, "status_code", None)
+
+    # Timeouts, conflicts, rate limits and server errors are transient (exhausted quota is not)
+    if status_code is not None:
+        retryable = status_code in (408, 409, 429) or status_code >= 500
+        retryable = retryable and getattr(error, "code", None) != "insufficient_quota"
+    else:
+        retryable = isinstance(error, APIConnectionError)
+
+    if not retryable or attempt >= route["max_retries"]:
+        raise error
+
+    # Full jitter spreads the retries of concurrent requests, but never retry sooner than the server asks for
+    backoff = random.uniform(0, min(route["max_backoff"], route["initial_backoff"] * 2 ** attempt))
+    try:
+        response = getattr(error, "response", None)
+        backoff = max(backoff, float(response.headers.get("retry-after", 0)))
+    except (AttributeError, TypeError, ValueError):
+        pass
+
+    logging.info("LLM: %s - request failed (%s, status %s), retry %d/%d in %.2f s.", model_name,
+                 error.__class__.__name__, status_code, attempt + 1, route["max_retries"], backoff)
+
+    return backoff
+
+
+atexit.register(close_clients)
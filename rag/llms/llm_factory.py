@@ -1,10 +1,18 @@
 # ============================ Models import ===========================
 from rag.llms.chat_gpt import ChatGPT
 from rag.llms.open_router import OpenRouter
+from rag.llms.local_stub import LocalStub
 # ======================================================================
 
 from rag.llms.__llm_template import LLMTemplate
+from rag.llms.response_cache import LLMResponseCache
+from rag.llms.llm_dispatcher import track_usage
+from rag.utils.metrics_sink import get_metrics_sink
+from typing import AsyncIterator, Iterator
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import logging
+import time
 
 
 class LLMFactory(LLMTemplate):
@@ -12,6 +20,12 @@ class LLMFactory(LLMTemplate):
     Factory class for creating LLMs. This class allows you to set the LLM model by calling the set_llm method
     with the desired LLM name. Then, you can use the generate_response method to generate text.
     You have to pass an existing LLM model and its parameters to the constructor.
+    If the "cache" parameter is passed (dictionary with cache_dir and optionally ttl_seconds and max_entries), responses
+    are cached on disk and identical prompts (for the same backend, model and instructions) are answered from the cache.
+    The stream and a_stream methods yield the response as text deltas and record the time to the first token
+    and the generation speed of every call. Many prompts can be submitted at once by generate_many and a_generate_many
+    (the rate limit of the model is enforced by the LLM dispatcher, see rag.llms.llm_dispatcher).
+    Every call is recorded in the metrics sink (latency, tokens, retries and cache status, see rag.utils.metrics_sink).
 
     :param llm_name: Name of the LLM to be set
     :param kwargs: Additional parameters for the LLM model
@@ -20,6 +34,9 @@ class LLMFactory(LLMTemplate):
     def __init__(self, llm_name: str, **kwargs) -> None:
         super().__init__(llm_name)
         self.__llm = None
+        self.__cache = None
+        self.__cache_key_parts = ()
+        self.__model_name = None
         self.set_llm(llm_name, **kwargs)
 
 
@@ -45,8 +62,17 @@ class LLMFactory(LLMTemplate):
         :return: None
         """
 
-        # Set the LLM name
+        # Set the LLM name (the model name labels the metrics of the calls, "default" if the backend default is used)
         self.llm_name = llm_name
+        self.__model_name = kwargs.get("model_name")
+
+        # Create the response cache (responses are keyed by the backend, model name, instructions and prompt)
+        cache_kwargs = kwargs.pop("cache", None)
+        if cache_kwargs is not None:
+            self.__cache = LLMResponseCache(**cache_kwargs)
+            self.__cache_key_parts = (llm_name, kwargs.get("model_name"), kwargs.get("initial_prompt"))
+        else:
+            self.__cache = None
 
         # ============================= Switch between models =============================
         match llm_name:
@@ -54,10 +80,23 @@ class LLMFactory(LLMTemplate):
                 self.__llm = ChatGPT(llm_name, **kwargs)
             case "open-router":
                 self.__llm = OpenRouter(llm_name, **kwargs)
+            case "local-stub":
+                self.__llm = LocalStub(llm_name, **kwargs)
             case _:
                 raise ValueError(f"Unsupported LLM name: {llm_name}. Please use a valid LLM name.")
         # ============================= Switch between models =============================
 
+
+    def get_cache_stats(self) -> dict:
+        """
+        Get the statistics of the response cache.
+
+        :return: Dictionary with hits, misses, evictions and hit rate (empty if the cache is disabled)
+        """
+
+        return self.__cache.get_stats() if self.__cache is not None else {}
+
+
     def get_model_name(self):
         """
         Returns the name of the model. Function needed by the DeepEvalBaseLLM class.
@@ -84,12 +123,34 @@ class LLMFactory(LLMTemplate):
         :return: Generated response
         """
 
-        logging.info(f"Generating response for: \n{prompt}")
+        logging.info("Generating response for: \n%s", prompt)
+        start = time.perf_counter()
+
+        # Look up the response in the cache
+        if self.__cache is not None:
+            key = LLMResponseCache.get_key(*self.__cache_key_parts, prompt)
+            response = self.__cache.get(key)
+            if response is not None:
+                logging.info("Cached response: \n%s", response)
+                self.__record_call("generate", start, {}, "hit", "ok")
+                return response
 
-        # Generate response using the LLM
-        response = self.__llm.generate(prompt)
+        # Generate response using the LLM (the LLM dispatcher fills the usage of the call)
+        usage = {}
+        cache = "miss" if self.__cache is not None else "off"
+        try:
+            with track_usage(usage):
+                response = self.__llm.generate(prompt)
+        except Exception:
+            self.__record_call("generate", start, usage, cache, "error")
+            raise
 
-        logging.info(f"Generated response: \n{response}")
+        logging.info("Generated response: \n%s", response)
+        self.__record_call("generate", start, usage, cache, "ok" if isinstance(response, str) else "error")
+
+        # Only successful responses are cached (errors are returned as exceptions)
+        if self.__cache is not None and isinstance(response, str):
+            self.__cache.put(key, response)
 
         return response
     
@@ -102,11 +163,248 @@ class LLMFactory(LLMTemplate):
         :return: Generated response
         """
 
-        logging.info(f"Generating async response for: \n{prompt}")
+        logging.info("Generating async response for: \n%s", prompt)
+        start = time.perf_counter()
+
+        # Look up the response in the cache (SQLite calls run in a worker thread, so the event loop is not blocked)
+        if self.__cache is not None:
+            key = LLMResponseCache.get_key(*self.__cache_key_parts, prompt)
+            response = await asyncio.to_thread(self.__cache.get, key)
+            if response is not None:
+                logging.info("Cached async response: \n%s", response)
+                self.__record_call("a_generate", start, {}, "hit", "ok")
+                return response
+
+        # Generate async response using the LLM (the usage is tracked in the context of the current task)
+        usage = {}
+        cache = "miss" if self.__cache is not None else "off"
+        try:
+            with track_usage(usage):
+                response = await self.__llm.a_generate(prompt)
+        except Exception:
+            self.__record_call("a_generate", start, usage, cache, "error")
+            raise
+
+        logging.info("Generated async response: \n%s", response)
+        self.__record_call("a_generate", start, usage, cache, "ok" if isinstance(response, str) else "error")
+
+        # Only successful responses are cached (errors are returned as exceptions)
+        if self.__cache is not None and isinstance(response, str):
+            await asyncio.to_thread(self.__cache.put, key, response)
+
+        return response
+
+
+    def generate_many(self, prompts: list, max_concurrency: int = 8) -> list:
+        """
+        Generate responses to many prompts concurrently (at most max_concurrency requests at a time).
+        A failed prompt doesn't stop the others, the exception it raised is returned in place of its response.
+
+        :param prompts: List of input prompts for the LLM
+        :param max_concurrency: Maximal number of concurrent requests
+        :return: List of generated responses or exceptions (in the order of the prompts)
+        """
+
+        if not prompts:
+            return []
+
+        def generate(prompt: str) -> str | Exception:
+            try:
+                return self.generate(prompt)
+            except Exception as e:
+                return e
+
+        # map keeps the order of the prompts
+        with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(prompts))), thread_name_prefix="llm") as executor:
+            return list(executor.map(generate, prompts))
+
+
+    async def a_generate_many(self, prompts: list, max_concurrency: int = 8) -> list:
+        """
+        Asynchronously generate responses to many prompts concurrently (at most max_concurrency requests at a time).
+        A failed prompt doesn't stop the others, the exception it raised is returned in place of its response.
+
+        :param prompts: List of input prompts for the LLM
+        :param max_concurrency: Maximal number of concurrent requests
+        :return: List of generated responses or exceptions (in the order of the prompts)
+        """
+
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def generate(prompt: str) -> str | Exception:
+            async with semaphore:
+                try:
+                    return await self.a_generate(prompt)
+                except Exception as e:
+                    return e
+
+        return list(await asyncio.gather(*(generate(prompt) for prompt in prompts)))
+
+
+    def stream(self, prompt: str, stats: dict = None) -> Iterator[str]:
+        """
+        Generate a response based on the provided prompt as a stream of text deltas.
+        A cached response is yielded as a single delta, and a fully streamed response is stored in the cache.
+
+        :param prompt: The input prompt for the LLM
+        :param stats: Dictionary filled with the statistics of the call when the stream ends (optional)
+        :return: Iterator of text deltas
+        """
+
+        logging.info("Streaming response for: \n%s", prompt)
+        start = time.perf_counter()
+
+        # Look up the response in the cache
+        if self.__cache is not None:
+            key = LLMResponseCache.get_key(*self.__cache_key_parts, prompt)
+            response = self.__cache.get(key)
+            if response is not None:
+                first_token_time = time.perf_counter()
+                yield response
+                self.__record_stream_stats(stats, "stream", start, first_token_time, 1, {}, "hit")
+                logging.info("Cached streamed response: \n%s", response)
+                return
+
+        # Stream the response using the LLM (the usage is passed explicitly, as the consumer runs between the deltas)
+        usage = {}
+        cache = "miss" if self.__cache is not None else "off"
+        deltas = []
+        first_token_time = None
+        try:
+            for delta in self.__llm.stream(prompt, usage):
+                if first_token_time is None:
+                    first_token_time = time.perf_counter()
+                deltas.append(delta)
+                yield delta
+        except Exception:
+            self.__record_call("stream", start, usage, cache, "error")
+            raise
+
+        response = "".join(deltas)
+        self.__record_stream_stats(stats, "stream", start, first_token_time, usage.get("output_tokens", len(deltas)), usage, cache)
+        logging.info("Streamed response: \n%s", response)
+
+        # Only fully streamed responses get here (the stream may be closed by the consumer before)
+        if self.__cache is not None:
+            self.__cache.put(key, response)
+
+
+    async def a_stream(self, prompt: str, stats: dict = None) -> AsyncIterator[str]:
+        """
+        Asynchronously generate a response based on the provided prompt as a stream of text deltas.
+        A cached response is yielded as a single delta, and a fully streamed response is stored in the cache.
+
+        :param prompt: The input prompt for the LLM
+        :param stats: Dictionary filled with the statistics of the call when the stream ends (optional)
+        :return: Async iterator of text deltas
+        """
+
+        logging.info("Streaming async response for: \n%s", prompt)
+        start = time.perf_counter()
+
+        # Look up the response in the cache (SQLite calls run in a worker thread, so the event loop is not blocked)
+        if self.__cache is not None:
+            key = LLMResponseCache.get_key(*self.__cache_key_parts, prompt)
+            response = await asyncio.to_thread(self.__cache.get, key)
+            if response is not None:
+                first_token_time = time.perf_counter()
+                yield response
+                self.__record_stream_stats(stats, "a_stream", start, first_token_time, 1, {}, "hit")
+                logging.info("Cached streamed async response: \n%s", response)
+                return
+
+        # Stream the response using the LLM
+        usage = {}
+        cache = "miss" if self.__cache is not None else "off"
+        deltas = []
+        first_token_time = None
+        try:
+            async for delta in self.__llm.a_stream(prompt, usage):
+                if first_token_time is None:
+                    first_token_time = time.perf_counter()
+                deltas.append(delta)
+                yield delta
+        except Exception:
+            self.__record_call("a_stream", start, usage, cache, "error")
+            raise
+
+        response = "".join(deltas)
+        self.__record_stream_stats(stats, "a_stream", start, first_token_time, usage.get("output_tokens", len(deltas)), usage, cache)
+        logging.info("Streamed async response: \n%s", response)
+
+        # Only fully streamed responses get here (the stream may be closed by the consumer before)
+        if self.__cache is not None:
+            await asyncio.to_thread(self.__cache.put, key, response)
+
+
+    def __record_call(self, mode: str, start: float, usage: dict, cache: str, status: str,
+                      time_to_first_token: float = None) -> None:
+        """
+        Record the "llm_call" event of a call in the metrics sink: latency, input and output tokens and retries,
+        labelled by the LLM, model, mode, cache status and call status. Nothing is done if the metrics are disabled.
+
+        :param mode: Mode of the call ("generate", "a_generate", "stream" or "a_stream")
+        :param start: Time the call started (perf_counter)
+        :param usage: Usage of the call filled by the LLM dispatcher (empty for cached responses)
+        :param cache: Cache status ("hit", "miss" or "off")
+        :param status: Status of the call ("ok" or "error")
+        :param time_to_first_token: Time to the first token of a streamed call in seconds (optional)
+        :return: None
+        """
+
+        sink = get_metrics_sink()
+        if sink is None:
+            return
+
+        sink.record("llm_call", {
+            "latency_seconds": time.perf_counter() - start,
+            "time_to_first_token_seconds": time_to_first_token,
+            "input_tokens": usage.get("input_tokens"),
+            "output_tokens": usage.get("output_tokens"),
+            "retries": usage.get("retries"),
+        }, {
+            "llm": self.llm_name,
+            "model": self.__model_name or "default",
+            "mode": mode,
+            "cache": cache,
+            "status": status,
+        })
+
+
+    def __record_stream_stats(self, stats: dict | None, mode: str, start: float, first_token_time: float | None,
+                              output_tokens: int, usage: dict, cache: str) -> None:
+        """
+        Record the statistics of a streamed call: time to the first token, total time, number of output tokens
+        and generation speed (output tokens per second after the first token). The call is also recorded
+        in the metrics sink.
+
+        :param stats: Dictionary filled with the statistics (None to only log them)
+        :param mode: Mode of the call ("stream" or "a_stream")
+        :param start: Time the call started (perf_counter)
+        :param first_token_time: Time the first delta arrived (None if the response is empty)
+        :param output_tokens: Number of output tokens (the number of deltas if the API doesn't report it)
+        :param usage: Usage of the call filled by the LLM (empty for cached responses)
+        :param cache: Cache status ("hit", "miss" or "off")
+        :return: None
+        """
+
+        end = time.perf_counter()
+        first_token_time = first_token_time if first_token_time is not None else end
+
+        # Responses delivered in a single delta have no generation phase, so the speed is measured over the whole call
+        generation_time = end - first_token_time if end - first_token_time > 0 else end - start
+        call_stats = {
+            "time_to_first_token": first_token_time - start,
+            "total_time": end - start,
+            "output_tokens": output_tokens,
+            "tokens_per_second": output_tokens / generation_time if generation_time > 0 else 0.0,
+            "cached": cache == "hit",
+        }
 
-        # Generate async response using the LLM
-        response = await self.__llm.a_generate(prompt)
+        logging.info("LLM: %s - time to first token %.3f s, %.1f tokens/s (%d tokens, cached: %s)", self.llm_name,
+                     call_stats["time_to_first_token"], call_stats["tokens_per_second"], output_tokens, call_stats["cached"])
 
-        logging.info(f"Generated async response: \n{response}")
+        self.__record_call(mode, start, usage, cache, "ok", time_to_first_token=call_stats["time_to_first_token"])
 
-        return response
\ No newline at end of file
+        if stats is not None:
+            stats.update(call_stats)
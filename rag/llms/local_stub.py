@@ -0,0 +1,104 @@
+from rag.llms.__llm_template import LLMTemplate
+from rag.llms.chat_gpt import ChatGPT
+from rag.llms.open_router import OpenRouter
+from rag.llms.local_stub_server import LocalStubServer
+from typing import AsyncIterator, Iterator
+
+
+class LocalStub(LLMTemplate):
+    """
+    Offline stand-in LLM answering from the local OpenAI-compatible stub server (rag.llms.local_stub_server).
+    Requests are sent by the same clients as the real LLMs: the Responses API client of ChatGPT or the chat completions
+    client of OpenRouter, so the whole path (LLM dispatcher, rate limits, retries, streaming) is exercised and only
+    the network and the model are replaced by deterministic synthetic answers with configurable latencies and errors.
+    The server can be started in this process (server parameters) or run separately (base_url), e.g. by
+    python -m rag.llms.local_stub_server --port 8000.
+    It inherits from the LLMTemplate class (DeepEvalBaseLLM).
+
+    :param llm_name: Name of the LLM
+    :param initial_prompt: Initial prompt for the LLM
+    :param model_name: Name of the model sent to the server
+    :param api: API used to call the server: "chat-completions" or "responses"
+    :param base_url: Base URL of a running stub server (ignored if server is given)
+    :param server: Parameters of a stub server started in this process (see LocalStubServer, port 0 picks a free port)
+    :param rate_limit: Rate limit and retry settings of the model (see rag.llms.llm_dispatcher.set_rate_limit, optional)
+    """
+
+    def __init__(self, llm_name: str, initial_prompt: str, model_name: str = "local-stub", api: str = "chat-completions",
+                 base_url: str = "http://127.0.0.1:8000/v1", server: dict = None, rate_limit: dict = None) -> None:
+        super().__init__(llm_name)
+        self.server = None
+
+        if server is not None:
+            self.server = LocalStubServer(**{"port": 0, **server})
+            base_url = self.server.start()
+
+        # The stub server doesn't check the API key
+        match api:
+            case "chat-completions":
+                self.__llm = OpenRouter(llm_name, initial_prompt, "local-stub", model_name, rate_limit, base_url=base_url)
+            case "responses":
+                self.__llm = ChatGPT(llm_name, initial_prompt, "local-stub", model_name, rate_limit, base_url=base_url)
+            case _:
+                raise ValueError(f"Unsupported API: {api}. Please use chat-completions or responses.")
+
+
+    def get_model_name(self):
+        """
+        Returns the name of the model. Function needed by the DeepEvalBaseLLM class.
+
+        :return: Name of the model
+        """
+        return super().get_model_name()
+
+
+    def load_model(self):
+        """
+        Load the model. In this case, it is not necessary to load anything as the stub server is used.
+        Function needed by the DeepEvalBaseLLM class.
+
+        :return: None
+        """
+        return super().load_model()
+
+
+    def generate(self, prompt: str) -> str:
+        """
+        Generate a response based on the provided prompt using the stub server.
+
+        :param prompt: The input prompt for the LLM
+        :return: Generated response
+        """
+        return self.__llm.generate(prompt)
+
+
+    async def a_generate(self, prompt: str) -> str:
+        """
+        Generate an async response based on the provided prompt using the stub server.
+
+        :param prompt: The input prompt for the LLM
+        :return: Generated response
+        """
+        return await self.__llm.a_generate(prompt)
+
+
+    def stream(self, prompt: str, usage: dict = None) -> Iterator[str]:
+        """
+        Generate a response as a stream of text deltas using the stub server.
+
+        :param prompt: The input prompt for the LLM
+        :param usage: Dictionary filled with the usage ("input_tokens", "output_tokens", "retries") (optional)
+        :return: Iterator of text deltas
+        """
+        return self.__llm.stream(prompt, usage)
+
+
+    def a_stream(self, prompt: str, usage: dict = None) -> AsyncIterator[str]:
+        """
+        Asynchronously generate a response as a stream of text deltas using the stub server.
+
+        :param prompt: The input prompt for the LLM
+        :param usage: Dictionary filled with the usage ("input_tokens", "output_tokens", "retries") (optional)
+        :return: Async iterator of text deltas
+        """
+        return self.__llm.a_stream(prompt, usage)
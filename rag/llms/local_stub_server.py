@@ -0,0 +1,453 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import hashlib
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+import uuid
+
+
+def sample_latency(rng: random.Random, latency: dict | None) -> float:
+    """
+    Sample a latency from the distribution.
+
+    :param rng: Random number generator
+    :param latency: Distribution of the latency in seconds, one of {"distribution": "constant", "value"},
+                    {"distribution": "uniform", "low", "high"}, {"distribution": "normal", "mean", "std"},
+                    {"distribution": "lognormal", "median", "sigma"} or {"distribution": "exponential", "mean"}
+                    (None for no latency)
+    :return: Latency in seconds (never negative)
+    """
+
+    if latency is None:
+        return 0.0
+
+    match latency["distribution"]:
+        case "constant":
+            value = latency["value"]
+        case "uniform":
+            value = rng.uniform(latency["low"], latency["high"])
+        case "normal":
+            value = rng.gauss(latency["mean"], latency["std"])
+        case "lognormal":
+            value = rng.lognormvariate(math.log(latency["median"]), latency["sigma"])
+        case "exponential":
+            value = rng.expovariate(1 / latency["mean"])
+        case _:
+            raise ValueError(f"Unsupported latency distribution: {latency['distribution']}.")
+
+    return max(0.0, value)
+
+
+class LocalStubServer:
+    """
+    Local HTTP server speaking the subset of the OpenAI API used by the LLMs of this project: chat completions
+    (POST /v1/chat/completions) and responses (POST /v1/responses), both with and without streaming.
+    Answers are synthetic and deterministic: they depend only on the model, instructions and prompt (words of the prompt
+    picked by a generator seeded by their hash), so the same request always gets the same answer.
+    The time to the first token and the time between the streamed tokens are sampled from configurable distributions,
+    and a fraction of the requests can fail with 429 (with a Retry-After header) or 500 errors, so the latency,
+    concurrency and retry behaviour of the pipeline can be measured without network access.
+    Latencies and errors are drawn from a single generator seeded by seed, so a run with the same order of requests
+    is reproducible.
+
+    :param host: Host the server listens on
+    :param port: Port the server listens on (0 to pick a free port)
+    :param seed: Seed of the latencies and of the injected errors
+    :param answer_tokens: Number of tokens (words) of every answer
+    :param latency: Distribution of the time to the first token (see sample_latency, None for no latency)
+    :param token_latency: Distribution of the time between the tokens (see sample_latency, None for no latency)
+    :param rate_limit_error_rate: Fraction of the requests failing with 429
+    :param server_error_rate: Fraction of the requests failing with 500
+    :param retry_after: Retry-After of the 429 errors in seconds
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8000, seed: int = 0, answer_tokens: int = 64,
+                 latency: dict = None, token_latency: dict = None, rate_limit_error_rate: float = 0.0,
+                 server_error_rate: float = 0.0, retry_after: float = 1.0) -> None:
+        self.answer_tokens = answer_tokens
+        self.latency = latency
+        self.token_latency = token_latency
+        self.rate_limit_error_rate = rate_limit_error_rate
+        self.server_error_rate = server_error_rate
+        self.retry_after = retry_after
+        self.requests = 0
+        self.errors = 0
+
+        self.__rng = random.Random(seed)
+        self.__lock = threading.Lock()
+        self.__thread = None
+
+        self.__server = ThreadingHTTPServer((host, port), _StubRequestHandler)
+        self.__server.daemon_threads = True
+        self.__server.stub = self
+
+
+    @property
+    def base_url(self) -> str:
+        """
+        Base URL of the API served by the server (to be passed to the OpenAI client).
+        """
+
+        host, port = self.__server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+    def start(self) -> str:
+        """
+        Start serving in a background thread.
+
+        :return: Base URL of the API
+        """
+
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self.__server.serve_forever, name="llm-stub-server", daemon=True)
+            self.__thread.start()
+            logging.info(f"LLM stub server: listening on {self.base_url}")
+
+        return self.base_url
+
+
+    def stop(self) -> None:
+        """
+        Stop the server.
+
+        :return: None
+        """
+
+        if self.__thread is not None:
+            self.__server.shutdown()
+            self.__thread.join()
+            self.__thread = None
+        self.__server.server_close()
+
+
+    def serve_forever(self) -> None:
+        """
+        Serve in the current thread until interrupted.
+
+        :return: None
+        """
+
+        logging.info(f"LLM stub server: listening on {self.base_url}")
+        try:
+            self.__server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.__server.server_close()
+
+
+    def draw_request(self) -> tuple:
+        """
+        Draw the outcome of a request: the injected error (if any), the time to the first token and the times between
+        the tokens.
+
+        :return: Tuple of the status code of the injected error (None for a successful request), the time to the first
+                 token and the list of times between the tokens
+        """
+
+        with self.__lock:
+            self.requests += 1
+
+            draw = self.__rng.random()
+            if draw < self.rate_limit_error_rate:
+                self.errors += 1
+                return 429, 0.0, []
+            if draw < self.rate_limit_error_rate + self.server_error_rate:
+                self.errors += 1
+                return 500, 0.0, []
+
+            first_token_latency = sample_latency(self.__rng, self.latency)
+            token_latencies = [sample_latency(self.__rng, self.token_latency) for _ in range(self.answer_tokens - 1)]
+
+        return None, first_token_latency, token_latencies
+
+
+    def get_answer_tokens(self, model: str, instructions: str, prompt: str) -> list:
+        """
+        Get the deterministic synthetic answer to the request as a list of tokens (words followed by a space).
+
+        :param model: Name of the model
+        :param instructions: Instructions (system prompt)
+        :param prompt: Prompt
+        :return: List of tokens
+        """
+
+        seed = hashlib.sha256("\0".join((model, instructions, prompt)).encode("utf-8")).digest()
+        rng = random.Random(seed)
+        words = re.findall(r"\w+", prompt) or ["lorem", "ipsum", "dolor", "sit", "amet"]
+
+        return [rng.choice(words) + " " for _ in range(self.answer_tokens)]
+
+
+class _StubRequestHandler(BaseHTTPRequestHandler):
+    """
+    Request handler of the local stub server (the server is available as self.server.stub).
+    """
+
+    # Keep-alive, so the pooled connections of the clients are reused
+    protocol_version = "HTTP/1.1"
+
+
+    def do_POST(self) -> None:
+        """
+        Handle a chat completions or responses request.
+
+        :return: None
+        """
+
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        stub = self.server.stub
+
+        if self.path.rstrip("/") not in ("/v1/chat/completions", "/v1/responses"):
+            self.__send_json(404, {"error": {"message": f"Unknown endpoint {self.path}.", "type": "invalid_request_error"}})
+            return
+
+        error, first_token_latency, token_latencies = stub.draw_request()
+        if error == 429:
+            self.__send_json(429, {"error": {"message": "Rate limit reached (injected by the stub server).",
+                                             "type": "requests", "code": "rate_limit_exceeded"}},
+                             {"Retry-After": str(stub.retry_after)})
+            return
+        if error == 500:
+            self.__send_json(500, {"error": {"message": "Internal server error (injected by the stub server).",
+                                             "type": "server_error"}})
+            return
+
+        if self.path.rstrip("/") == "/v1/chat/completions":
+            messages = body.get("messages", [])
+            instructions = "\n".join(str(message.get("content", "")) for message in messages if message.get("role") == "system")
+            prompt = "\n".join(str(message.get("content", "")) for message in messages if message.get("role") != "system")
+        else:
+            instructions = body.get("instructions") or ""
+            prompt = body.get("input") if isinstance(body.get("input"), str) else json.dumps(body.get("input"))
+
+        model = body.get("model", "")
+        tokens = stub.get_answer_tokens(model, instructions, prompt)
+        usage = (math.ceil(len(instructions + prompt) / 4), len(tokens))
+
+        time.sleep(first_token_latency)
+
+        match (self.path.rstrip("/"), bool(body.get("stream"))):
+            case ("/v1/chat/completions", False):
+                time.sleep(sum(token_latencies))
+                self.__send_json(200, self.__create_chat_completion(model, "".join(tokens), usage))
+            case ("/v1/chat/completions", True):
+                include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+                self.__stream_chat_completion(model, tokens, token_latencies, usage if include_usage else None)
+            case ("/v1/responses", False):
+                time.sleep(sum(token_latencies))
+                self.__send_json(200, self.__create_response(model, instructions, "".join(tokens), usage))
+            case ("/v1/responses", True):
+                self.__stream_response(model, instructions, tokens, token_latencies, usage)
+
+
+    def log_message(self, format: str, *args) -> None:
+        """
+        Log the requests at the debug level (instead of printing them to stderr).
+
+        :param format: Format of the message
+        :param args: Arguments of the message
+        :return: None
+        """
+
+        logging.debug("LLM stub server: " + format, *args)
+
+
+    def __send_json(self, status: int, payload: dict, headers: dict = None) -> None:
+        """
+        Send a JSON response.
+
+        :param status: Status code
+        :param payload: JSON payload
+        :param headers: Additional headers (optional)
+        :return: None
+        """
+
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+    def __start_event_stream(self) -> None:
+        """
+        Start a server-sent events response (the connection is closed at its end).
+
+        :return: None
+        """
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+
+    def __send_event(self, payload: dict | str, event: str = None) -> None:
+        """
+        Send a server-sent event.
+
+        :param payload: JSON payload of the event (or a raw string)
+        :param event: Name of the event (optional)
+        :return: None
+        """
+
+        data = payload if isinstance(payload, str) else json.dumps(payload)
+        message = (f"event: {event}\n" if event is not None else "") + f"data: {data}\n\n"
+        self.wfile.write(message.encode("utf-8"))
+        self.wfile.flush()
+
+
+    @staticmethod
+    def __create_chat_completion(model: str, answer: str, usage: tuple) -> dict:
+        """
+        Create the chat completion of the answer.
+
+        :param model: Name of the model
+        :param answer: Answer
+        :param usage: Tuple of the number of prompt tokens and completion tokens
+        :return: Chat completion
+        """
+
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": usage[0], "completion_tokens": usage[1], "total_tokens": sum(usage)},
+        }
+
+
+    def __stream_chat_completion(self, model: str, tokens: list, token_latencies: list, usage: tuple | None) -> None:
+        """
+        Stream the chat completion chunks of the answer.
+
+        :param model: Name of the model
+        :param tokens: Tokens of the answer
+        :param token_latencies: Times between the tokens
+        :param usage: Tuple of the number of prompt tokens and completion tokens (None to not send the usage)
+        :return: None
+        """
+
+        chunk = {"id": f"chatcmpl-{uuid.uuid4().hex}", "object": "chat.completion.chunk", "created": int(time.time()),
+                 "model": model}
+
+        self.__start_event_stream()
+        for i, token in enumerate(tokens):
+            if i > 0:
+                time.sleep(token_latencies[i - 1])
+            delta = {"role": "assistant", "content": token} if i == 0 else {"content": token}
+            self.__send_event({**chunk, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+
+        self.__send_event({**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if usage is not None:
+            self.__send_event({**chunk, "choices": [], "usage": {"prompt_tokens": usage[0], "completion_tokens": usage[1],
+                                                                 "total_tokens": sum(usage)}})
+        self.__send_event("[DONE]")
+
+
+    @staticmethod
+    def __create_response(model: str, instructions: str, answer: str, usage: tuple, response_id: str = None,
+                          status: str = "completed") -> dict:
+        """
+        Create the response object of the Responses API.
+
+        :param model: Name of the model
+        :param instructions: Instructions
+        :param answer: Answer (empty for an in-progress response)
+        :param usage: Tuple of the number of input tokens and output tokens (None for an in-progress response)
+        :param response_id: ID of the response (None to generate one)
+        :param status: Status of the response
+        :return: Response object
+        """
+
+        output = []
+        if status == "completed":
+            output = [{
+                "type": "message",
+                "id": "msg_stub",
+                "status": "completed",
+                "role": "assistant",
+                "content": [{"type": "output_text", "text": answer, "annotations": []}],
+            }]
+
+        return {
+            "id": response_id or f"resp_{uuid.uuid4().hex}",
+            "object": "response",
+            "created_at": int(time.time()),
+            "status": status,
+            "model": model,
+            "instructions": instructions,
+            "output": output,
+            "parallel_tool_calls": True,
+            "tool_choice": "auto",
+            "tools": [],
+            "usage": {"input_tokens": usage[0], "output_tokens": usage[1], "total_tokens": sum(usage),
+                      "input_tokens_details": {"cached_tokens": 0},
+                      "output_tokens_details": {"reasoning_tokens": 0}} if usage is not None else None,
+        }
+
+
+    def __stream_response(self, model: str, instructions: str, tokens: list, token_latencies: list, usage: tuple) -> None:
+        """
+        Stream the events of the Responses API for the answer.
+
+        :param model: Name of the model
+        :param instructions: Instructions
+        :param tokens: Tokens of the answer
+        :param token_latencies: Times between the tokens
+        :param usage: Tuple of the number of input tokens and output tokens
+        :return: None
+        """
+
+        response_id = f"resp_{uuid.uuid4().hex}"
+        sequence_number = 0
+
+        self.__start_event_stream()
+        self.__send_event({"type": "response.created", "sequence_number": sequence_number,
+                           "response": self.__create_response(model, instructions, "", None, response_id, "in_progress")},
+                          "response.created")
+
+        for i, token in enumerate(tokens):
+            if i > 0:
+                time.sleep(token_latencies[i - 1])
+            sequence_number += 1
+            self.__send_event({"type": "response.output_text.delta", "sequence_number": sequence_number,
+                               "item_id": "msg_stub", "output_index": 0, "content_index": 0, "delta": token},
+                              "response.output_text.delta")
+
+        sequence_number += 1
+        self.__send_event({"type": "response.completed", "sequence_number": sequence_number,
+                           "response": self.__create_response(model, instructions, "".join(tokens), usage, response_id)},
+                          "response.completed")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stub server for offline benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--answer-tokens", type=int, default=64)
+    parser.add_argument("--latency", type=json.loads, default=None,
+                        help='Time to the first token, e.g. \'{"distribution": "lognormal", "median": 0.4, "sigma": 0.5}\'')
+    parser.add_argument("--token-latency", type=json.loads, default=None,
+                        help='Time between the tokens, e.g. \'{"distribution": "constant", "value": 0.01}\'')
+    parser.add_argument("--rate-limit-error-rate", type=float, default=0.0)
+    parser.add_argument("--server-error-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    arguments = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    LocalStubServer(**{key: value for key, value in vars(arguments).items()}).serve_forever()
@@ -1,24 +1,35 @@
 from rag.llms.__llm_template import LLMTemplate
-from openai import OpenAI, AsyncOpenAI
+from rag.llms.llm_dispatcher import dispatch, a_dispatch, set_rate_limit, LLMProviderError
+from typing import AsyncIterator, Iterator
 
 
 class OpenRouter(LLMTemplate):
     """
     OpenRouter class for generating text using the OpenRouter API (it uses OpenAI API SDK).
     It uses the OpenRouter API to generate text based on the provided prompt.
+    Requests go through the process-wide LLM dispatcher (rag.llms.llm_dispatcher), which shares the HTTP clients,
+    enforces the rate limit of the model and retries transient errors (including the errors OpenRouter reports
+    in the response body). Errors which can't be retried are raised.
     It inherits from the LLMTemplate class (DeepEvalBaseLLM).
 
     :param llm_name: Name of the LLM
     :param initial_prompt: Initial prompt for the LLM
     :param api_key: API key for the OpenAI API
+    :param model_name: Name of the model
+    :param rate_limit: Rate limit and retry settings of the model (see rag.llms.llm_dispatcher.set_rate_limit, optional)
+    :param base_url: Base URL of the API (the OpenRouter API by default, or another chat completions API)
     """
 
-    def __init__(self, llm_name: str, initial_prompt: str, api_key: str, model_name: str) -> None:
+    def __init__(self, llm_name: str, initial_prompt: str, api_key: str, model_name: str, rate_limit: dict = None,
+                 base_url: str = "https://openrouter.ai/api/v1") -> None:
         super().__init__(llm_name)
         self.initial_prompt = initial_prompt
-        self.client = OpenAI(base_url="https://openrouter.ai/api/v1", api_key=api_key)
-        self.async_client = AsyncOpenAI(base_url="https://openrouter.ai/api/v1", api_key=api_key)
+        self.api_key = api_key
         self.model = model_name
+        self.base_url = base_url
+
+        if rate_limit is not None:
+            set_rate_limit(self.base_url, self.api_key, self.model, **rate_limit)
 
 
     def get_model_name(self):
@@ -49,27 +60,13 @@ class OpenRouter(LLMTemplate):
         """
 
         # Generate a response using the OpenRouter API
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages= [
-                {
-                    "role": "system",
-                    "content": self.initial_prompt
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ]
-        )
-
-         # Check if any error occurred
-        if hasattr(response, "error") and response.error:
-            response = response.error
-        else:
-            response = response.choices[0].message.content
+        response = dispatch(self.base_url, self.api_key, self.model,
+                            lambda client: self.__check_error(client.chat.completions.create(
+                                model=self.model,
+                                messages=self.__get_messages(prompt),
+                            )), input_text=self.initial_prompt + prompt)
 
-        return response
+        return response.choices[0].message.content
 
 
     async def a_generate(self, prompt: str) -> str:
@@ -81,24 +78,118 @@ class OpenRouter(LLMTemplate):
         """
 
         # Generate a response using the OpenRouter API
-        response = await self.async_client.chat.completions.create(
+        async def request(client):
+            return self.__check_error(await client.chat.completions.create(
+                model=self.model,
+                messages=self.__get_messages(prompt),
+            ))
+
+        response = await a_dispatch(self.base_url, self.api_key, self.model, request, input_text=self.initial_prompt + prompt)
+
+        return response.choices[0].message.content
+
+
+    def stream(self, prompt: str, usage: dict = None) -> Iterator[str]:
+        """
+        Generate a response as a stream of text deltas using the streaming chat completions of the OpenRouter API.
+
+        :param prompt: The input prompt for the LLM
+        :param usage: Dictionary filled with the usage ("input_tokens", "output_tokens", "retries") (optional)
+        :return: Iterator of text deltas
+        """
+
+        chunks = dispatch(self.base_url, self.api_key, self.model, lambda client: client.chat.completions.create(
             model=self.model,
-            messages= [
-                {
-                    "role": "system",
-                    "content": self.initial_prompt
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ]
-        )
+            messages=self.__get_messages(prompt),
+            stream=True,
+            stream_options={"include_usage": True},
+        ), input_text=self.initial_prompt + prompt, usage=usage)
+
+        for chunk in chunks:
+            delta = self.__handle_chunk(chunk, usage)
+            if delta:
+                yield delta
+
+
+    async def a_stream(self, prompt: str, usage: dict = None) -> AsyncIterator[str]:
+        """
+        Asynchronously generate a response as a stream of text deltas using the streaming chat completions
+        of the OpenRouter API.
+
+        :param prompt: The input prompt for the LLM
+        :param usage: Dictionary filled with the usage ("input_tokens", "output_tokens", "retries") (optional)
+        :return: Async iterator of text deltas
+        """
+
+        chunks = await a_dispatch(self.base_url, self.api_key, self.model, lambda client: client.chat.completions.create(
+            model=self.model,
+            messages=self.__get_messages(prompt),
+            stream=True,
+            stream_options={"include_usage": True},
+        ), input_text=self.initial_prompt + prompt, usage=usage)
+
+        async for chunk in chunks:
+            delta = self.__handle_chunk(chunk, usage)
+            if delta:
+                yield delta
+
+
+    def __get_messages(self, prompt: str) -> list:
+        """
+        Get the chat messages of the prompt.
+
+        :param prompt: The input prompt for the LLM
+        :return: List of messages
+        """
+
+        return [
+            {
+                "role": "system",
+                "content": self.initial_prompt
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+
+
+    @staticmethod
+    def __check_error(response):
+        """
+        Raise the error reported in the body of the response (if any).
+
+        :param response: Response or streaming chunk of the chat completions
+        :return: The response
+        """
+
+        error = getattr(response, "error", None)
+        if error:
+            status_code = error.get("code") if isinstance(error, dict) else None
+            raise LLMProviderError(f"OpenRouter error: {error}", status_code if isinstance(status_code, int) else None)
+
+        return response
+
+
+    @staticmethod
+    def __handle_chunk(chunk, usage: dict | None) -> str | None:
+        """
+        Handle a streaming chunk of the chat completions.
+
+        :param chunk: Streaming chunk
+        :param usage: Dictionary filled with the usage (optional)
+        :return: Text delta or None if the chunk carries no text
+        """
 
         # Check if any error occurred
-        if hasattr(response, "error") and response.error:
-            response = response.error
-        else:
-            response = response.choices[0].message.content
+        OpenRouter.__check_error(chunk)
+
+        # The usage is sent in the last chunk (without choices)
+        if usage is not None and getattr(chunk, "usage", None) is not None:
+            usage["input_tokens"] = chunk.usage.prompt_tokens
+            usage["output_tokens"] = chunk.usage.completion_tokens
+
+        if not chunk.choices:
+            return None
 
-        return response
\ No newline at end of file
+        return chunk.choices[0].delta.content
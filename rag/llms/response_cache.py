@@ -0,0 +1,148 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+class LLMResponseCache:
+    """
+    Persistent cache of LLM responses stored in an SQLite database in WAL mode, so it can be shared by many processes
+    (readers never block, writers are serialized by SQLite). Responses are keyed by the SHA-256 of the backend, model name,
+    instructions and prompt. Every response expires ttl_seconds after it was stored (the expiration is stored with it,
+    so caches with different TTLs can share the directory). Every eviction_interval stored responses, the expired
+    responses are removed, and when the cache holds more than max_entries responses, the least recently used ones
+    are evicted (so the cache can temporarily exceed max_entries by the responses stored between the evictions).
+
+    :param cache_dir: Directory where the cache database is stored
+    :param ttl_seconds: Time after which a cached response expires (None to never expire)
+    :param max_entries: Maximal number of cached responses
+    :param eviction_interval: Number of responses stored by the process between the evictions
+    """
+
+    def __init__(self, cache_dir: str, ttl_seconds: float = None, max_entries: int = 100_000,
+                 eviction_interval: int = 100) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.eviction_interval = eviction_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.__puts_since_eviction = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # The connection is shared by the threads of the process (e.g. asyncio.to_thread workers)
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(os.path.join(cache_dir, "responses.sqlite"), timeout=60,
+                                            isolation_level=None, check_same_thread=False)
+
+        with self.__lock:
+            self.__connection.execute("PRAGMA journal_mode=WAL")
+            self.__connection.execute("CREATE TABLE IF NOT EXISTS responses (key BLOB PRIMARY KEY, response TEXT NOT NULL, "
+                                      "expires REAL, last_used REAL NOT NULL)")
+            self.__connection.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+            self.__connection.execute("CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires)")
+
+
+    @staticmethod
+    def get_key(backend: str, model_name: str, instructions: str, prompt: str) -> bytes:
+        """
+        Get the key of the response.
+
+        :param backend: Name of the LLM backend
+        :param model_name: Name of the model
+        :param instructions: Instructions (initial prompt) of the model
+        :param prompt: Prompt
+        :return: SHA-256 digest of the key parts
+        """
+
+        # Every part is prefixed by its length, so the parts can't be shifted into each other
+        parts = [str(part if part is not None else "").encode("utf-8") for part in (backend, model_name, instructions, prompt)]
+        return hashlib.sha256(b"".join(len(part).to_bytes(8, "big") + part for part in parts)).digest()
+
+
+    def get(self, key: bytes) -> str | None:
+        """
+        Get the cached response and mark it as recently used.
+
+        :param key: Key of the response
+        :return: Cached response or None if it is not cached (or expired)
+        """
+
+        now = time.time()
+
+        with self.__lock:
+            row = self.__connection.execute("SELECT response, expires FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or (row[1] is not None and row[1] < now):
+                self.misses += 1
+                return None
+
+            self.__connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+
+    def put(self, key: bytes, response: str) -> None:
+        """
+        Store the response (every eviction_interval stored responses, the cache is also cleaned up).
+
+        :param key: Key of the response
+        :param response: Response
+        :return: None
+        """
+
+        now = time.time()
+        expires = now + self.ttl_seconds if self.ttl_seconds is not None else None
+
+        with self.__lock:
+            self.__connection.execute("INSERT OR REPLACE INTO responses (key, response, expires, last_used) "
+                                      "VALUES (?, ?, ?, ?)", (key, response, expires, now))
+
+            self.__puts_since_eviction += 1
+            if self.__puts_since_eviction >= self.eviction_interval:
+                self.__puts_since_eviction = 0
+                self.__evict(now)
+
+
+    def get_stats(self) -> dict:
+        """
+        Get the cache statistics.
+
+        :return: Dictionary with hits, misses, evictions and hit rate
+        """
+
+        with self.__lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+    def __evict(self, now: float) -> None:
+        """
+        Remove the expired responses and evict the least recently used ones if the cache is full
+        (the caller holds the lock).
+
+        :param now: Current time
+        :return: None
+        """
+
+        self.__connection.execute("BEGIN IMMEDIATE")
+        try:
+            self.__connection.execute("DELETE FROM responses WHERE expires < ?", (now,))
+
+            count = self.__connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if count > self.max_entries:
+                self.__connection.execute("DELETE FROM responses WHERE key IN "
+                                          "(SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                                          (count - self.max_entries,))
+                self.evictions += count - self.max_entries
+
+            self.__connection.execute("COMMIT")
+        except BaseException:
+            self.__connection.execute("ROLLBACK")
+            raise
@@ -1,5 +1,7 @@
 from abc import ABC, abstractmethod
 from pymupdf import Document
+from typing import AsyncIterator, Iterator
+import asyncio
 
 
 class RAGArchitectureTemplate(ABC):
@@ -16,13 +18,15 @@ class RAGArchitectureTemplate(ABC):
 
 
     @abstractmethod
-    def process_document(self, conversation_id: int, document: Document) -> None:
+    def process_document(self, conversation_id: int, document: Document, document_id: str = None) -> None:
         """
         Process the document to extract relevant information and store it in the vector database.
         Conversation ID is used to identify the conversation and store the document in the correct vector database collection.
 
         :param conversation_id: ID of the conversation
         :param document: Document to be processed
+        :param document_id: ID identifying the revisions of the document in the conversation (by default the path
+                            of the document file, used by incremental ingestion)
         :return: None
         """
         pass
@@ -41,6 +45,78 @@ class RAGArchitectureTemplate(ABC):
         pass
 
 
+    def process_queries(self, conversation_id: int, queries: list) -> list:
+        """
+        Process many queries against the same conversation. Returns the responses in the order of the queries.
+        Architectures which can't batch the queries don't have to override this method (queries are processed one by one).
+
+        :param conversation_id: ID of the conversation
+        :param queries: List of queries to be processed
+        :return: List of responses to the queries
+        """
+        return [self.process_query(conversation_id, query) for query in queries]
+
+
+    async def a_process_document(self, conversation_id: int, document: Document, document_id: str = None) -> None:
+        """
+        Asynchronously process the document and store it in the vector database.
+        Architectures without an async path don't have to override this method (the document is processed in a worker thread).
+
+        :param conversation_id: ID of the conversation
+        :param document: Document to be processed
+        :param document_id: ID identifying the revisions of the document in the conversation (by default the path
+                            of the document file, used by incremental ingestion)
+        :return: None
+        """
+        return await asyncio.to_thread(self.process_document, conversation_id, document, document_id)
+
+
+    async def a_process_query(self, conversation_id: int, query: str) -> dict:
+        """
+        Asynchronously process the query. Returns the answer to the query based on the processed document.
+        Architectures without an async path don't have to override this method (the query is processed in a worker thread).
+
+        :param conversation_id: ID of the conversation
+        :param query: Query to be processed
+        :return: Response to the query
+        """
+        return await asyncio.to_thread(self.process_query, conversation_id, query)
+
+
+    def stream_query(self, conversation_id: int, query: str) -> Iterator[dict]:
+        """
+        Process the query and stream the response as events: first {"event": "contexts", "query", "contexts"},
+        then {"event": "delta", "text"} for every part of the answer and finally
+        {"event": "done", "answer", "stats", "prompt_stats"}.
+        Architectures without streaming don't have to override this method (the whole answer is a single delta).
+
+        :param conversation_id: ID of the conversation
+        :param query: Query to be processed
+        :return: Iterator of response events
+        """
+
+        response = self.process_query(conversation_id, query)
+        yield {"event": "contexts", "query": query, "contexts": response["contexts"]}
+        yield {"event": "delta", "text": response["answer"]}
+        yield {"event": "done", "answer": response["answer"], "stats": {}, "prompt_stats": response.get("prompt_stats", {})}
+
+
+    async def a_stream_query(self, conversation_id: int, query: str) -> AsyncIterator[dict]:
+        """
+        Asynchronously process the query and stream the response as events (the same as stream_query).
+        Architectures without streaming don't have to override this method (the whole answer is a single delta).
+
+        :param conversation_id: ID of the conversation
+        :param query: Query to be processed
+        :return: Async iterator of response events
+        """
+
+        response = await self.a_process_query(conversation_id, query)
+        yield {"event": "contexts", "query": query, "contexts": response["contexts"]}
+        yield {"event": "delta", "text": response["answer"]}
+        yield {"event": "done", "answer": response["answer"], "stats": {}, "prompt_stats": response.get("prompt_stats", {})}
+
+
     @abstractmethod
     def remove_conversation(self, conversation_id: int) -> None:
         """
@@ -50,3 +126,13 @@ class RAGArchitectureTemplate(ABC):
         :return: None
         """
         pass
+
+
+    def get_cache_stats(self) -> dict:
+        """
+        Get the statistics of the caches of the architecture.
+        Architectures without caches don't have to override this method.
+
+        :return: Dictionary of statistics (one item per cache)
+        """
+        return {}
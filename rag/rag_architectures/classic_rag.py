@@ -1,12 +1,25 @@
 from rag.rag_architectures.__rag_architecture_template import RAGArchitectureTemplate
 from config import ConfigTemplate
 from database.vector_database import VectorDatabase
-from rag.utils.document_parser import parse_to_markdown
-from rag.utils.prompt_builder import create_prompt
+from rag.utils.document_parser import parse_to_markdown, parse_to_markdown_batches, parse_to_markdown_pages
+from rag.utils.streaming import threaded_stage
+from rag.utils.prompt_builder import create_prompt, PromptBuilder
+from rag.utils.rank_fusion import reciprocal_rank_fusion
+from rag.utils.mmr import maximal_marginal_relevance
+from rag.utils.semantic_answer_cache import SemanticAnswerCache
 from rag.llms.llm_factory import LLMFactory
 from rag.embedders.embedder_factory import EmbedderFactory
 from rag.tokenizers.tokenizer_factory import TokenizerFactory
 from pymupdf import Document
+from numpy import ndarray
+from typing import AsyncIterator, Iterable, Iterator, Sequence
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import numpy as np
+import hashlib
+import logging
+import os
 
 
 class ClassicRAG(RAGArchitectureTemplate):
@@ -14,6 +27,12 @@ class ClassicRAG(RAGArchitectureTemplate):
     Classic RAG architecture for generating answers based on a given question and context.
     This class is a classic implementation of the RAG architecture, which combines a retriever and a generator.
     It uses a retriever to find relevant documents and a generator to generate answers based on the retrieved documents.
+    With hybrid search, the retriever runs a dense (embedding) search and a lexical (BM25) search concurrently and fuses
+    their results by reciprocal rank fusion, so exact matches of rare terms (part numbers, clause IDs) are found too.
+    With the semantic answer cache, the LLM is skipped for questions similar to an already answered question of the
+    conversation for which the same contexts were retrieved.
+    With the prompt budget, duplicated and overlapping contexts are removed and the rest is packed into a token budget
+    counted by the tokenizer of the LLM (the statistics are returned as prompt_stats of every response).
 
     :param rag_architecture_name: Name of the RAG architecture
     :param config: Configuration object containing RAG settings
@@ -24,28 +43,219 @@ class ClassicRAG(RAGArchitectureTemplate):
         self.config = config
         self.embedder = EmbedderFactory(self.config.embedder_name, **self.config.embedder_kwargs)
         self.tokenizer = TokenizerFactory(self.config.tokenizer_name, **self.config.tokenizer_kwargs)
+        self.tokenizer.bind_embedder(self.embedder)
         self.llm = LLMFactory(self.config.llm_name, **self.config.llm_kwargs)
-        self.vector_database = VectorDatabase()
 
+        # Hybrid search needs the texts indexed for lexical search at ingest time
+        self.__hybrid_search = self.config.rag_architecture_kwargs.get("hybrid_search", False)
+        database_kwargs = dict(self.config.database_kwargs)
+        if self.__hybrid_search:
+            database_kwargs["lexical_index"] = True
+        self.vector_database = VectorDatabase(**database_kwargs)
 
-    def process_document(self, conversation_id: int, document: Document) -> None:
+        # The lexical search runs in this executor while the queries are being embedded
+        self.__lexical_search_executor = None
+        if self.__hybrid_search:
+            self.__lexical_search_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rag-lexical")
+
+        # Whether the collections of the conversations have the lexical index (collections created without it
+        # are searched by the dense search only)
+        self.__lexical_collections = {}
+
+        # Answers of the similar questions (None if disabled)
+        answer_cache_kwargs = self.config.rag_architecture_kwargs.get("answer_cache", None)
+        self.__answer_cache = SemanticAnswerCache(**answer_cache_kwargs) if answer_cache_kwargs is not None else None
+
+        # Token budget of the prompts (None if disabled), counted by the tokenizer of the LLM by default
+        prompt_budget_kwargs = self.config.rag_architecture_kwargs.get("prompt_budget", None)
+        self.__prompt_builder = None
+        if prompt_budget_kwargs is not None:
+            self.__prompt_builder = PromptBuilder(**{"model_name": self.config.llm_kwargs.get("model_name"),
+                                                     **prompt_budget_kwargs})
+
+        # Identity of the embedder used in fragment fingerprints
+        embedder_parameters = {key: value for key, value in self.config.embedder_kwargs.items() if key not in ("device", "cache")}
+        self.__embedder_identity = f"{self.config.embedder_name}:{sorted(embedder_parameters.items())}"
+
+
+    def process_document(self, conversation_id: int, document: Document, document_id: str = None) -> None:
         """
         Process the document to extract relevant information and store it in the vector database.
         Conversation ID is used to identify the conversation and store the document in the correct vector database collection.
 
         :param conversation_id: ID of the conversation
         :param document: Document to be processed
+        :param document_id: ID identifying the revisions of the document in the conversation (by default the path
+                            of the document file, used by incremental ingestion)
         :return: None
         """
-        # Prepare the vector database for the conversation
-        self.__prepare_vector_database(conversation_id)
+        # Prepare the vector database for the conversation (collections created by older versions lack the fragment metadata)
+        stores_metadata = self.__prepare_vector_database(conversation_id)
+        document_id = self.__get_document_id(document, document_id) if stores_metadata else None
+
+        if self.config.rag_architecture_kwargs.get("incremental_ingestion", False):
+            if document_id:
+                self.__process_document_incrementally(conversation_id, document, document_id)
+                return
+
+            if stores_metadata:
+                logging.warning("Incremental ingestion: the document is not a file on disk and no document ID was passed, "
+                                "so its previous revision can't be found. Ingesting the whole document.")
+            else:
+                logging.warning("Incremental ingestion: the collection of conversation %s was created without fragment "
+                                "fingerprints. Ingesting the whole document (remove the conversation and ingest "
+                                "its documents again to enable incremental ingestion).", conversation_id)
+
+        if self.config.rag_architecture_kwargs.get("streaming_ingestion", False):
+            self.__process_document_streaming(conversation_id, document, document_id)
+            return
 
         # Parse the document to markdown
-        parsed_document_to_markdown = parse_to_markdown(document)
+        parsed_document_to_markdown = parse_to_markdown(document, **self.config.parser_kwargs)
 
         # Embedding
         embeddings_with_text_pairs = self.__prepare_document_embeddings_with_corresponding_text(parsed_document_to_markdown)
-        self.__store_embeddings_with_text_pairs(conversation_id, embeddings_with_text_pairs)
+        self.__store_embeddings_with_text_pairs(conversation_id, embeddings_with_text_pairs, document_id=document_id)
+
+
+    def __process_document_incrementally(self, conversation_id: int, document: Document, document_id: str) -> None:
+        """
+        Process a new revision of the document already stored in the conversation. The previous revision of the same
+        document (the rows with the same document ID) is replaced, but only the changed fragments are touched: fragments
+        which are no longer present are deleted and only the new fragments are embedded and inserted. Fragments are
+        matched by their fingerprints. The other documents of the conversation are not touched.
+        Every page is split into fragments separately, so an edit only changes the fragments of the edited pages.
+
+        :param conversation_id: ID of the conversation
+        :param document: Document to be processed
+        :param document_id: ID of the document
+        :return: None
+        """
+
+        # Split every page of the document into fragments
+        fragments = []
+        for page in parse_to_markdown_pages(document, **self.config.parser_kwargs):
+            fragments.extend(self.tokenizer.tokenize(page))
+
+        # Match the fragments with the stored ones (the same fragment can occur many times)
+        new_fingerprints = Counter(self.__get_fingerprint(fragment) for fragment in fragments)
+        stored_fingerprints = self.vector_database.get_fingerprints(conversation_id, document_id)
+
+        stale_ids = []
+        kept_fingerprints = Counter()
+        for fingerprint, ids in stored_fingerprints.items():
+            kept_count = min(len(ids), new_fingerprints[fingerprint])
+            kept_fingerprints[fingerprint] = kept_count
+            stale_ids.extend(ids[kept_count:])
+
+        new_fragments = []
+        for fragment in fragments:
+            fingerprint = self.__get_fingerprint(fragment)
+            if kept_fingerprints[fingerprint] > 0:
+                kept_fingerprints[fingerprint] -= 1
+            else:
+                new_fragments.append(fragment)
+
+        logging.info("Incremental ingestion: %d fragments kept, %d deleted, %d inserted.",
+                     len(fragments) - len(new_fragments), len(stale_ids), len(new_fragments))
+
+        # Delete the stale fragments and store only the new ones
+        self.vector_database.delete_data(conversation_id, stale_ids)
+        if new_fragments:
+            embeddings_with_text_pairs = self.__prepare_embeddings_with_corresponding_text(new_fragments, show_progress_bar=True)
+            self.__store_embeddings_with_text_pairs(conversation_id, embeddings_with_text_pairs, document_id=document_id)
+
+
+    def __get_fingerprint(self, fragment: str) -> str:
+        """
+        Get the fingerprint of the fragment. It depends on the fragment text and on the embedder, so changing
+        the embedder invalidates the stored embeddings.
+
+        :param fragment: Document fragment
+        :return: SHA-256 hex digest
+        """
+
+        return hashlib.sha256(f"{self.__embedder_identity}\0{fragment}".encode("utf-8")).hexdigest()
+
+
+    @staticmethod
+    def __get_document_id(document: Document, document_id: str = None) -> str:
+        """
+        Get the stored ID of the document, which identifies the revisions of the same document in a conversation.
+        It is the hash of the ID passed by the caller, or of the full path of the document file (documents with the same
+        file name in different directories are different documents). Documents not stored on disk have no ID unless
+        it is passed.
+
+        :param document: Document
+        :param document_id: ID of the document passed by the caller (None to identify the document by its path)
+        :return: SHA-256 hex digest of the ID (empty if the document can't be identified)
+        """
+
+        if document_id is not None:
+            return hashlib.sha256(f"id\0{document_id}".encode("utf-8")).hexdigest()
+
+        if document.name and os.path.isfile(document.name):
+            return hashlib.sha256(f"path\0{os.path.realpath(document.name)}".encode("utf-8")).hexdigest()
+
+        return ""
+
+
+    def __process_document_streaming(self, conversation_id: int, document: Document, document_id: str = None) -> None:
+        """
+        Process the document as a stream of page batches. Parsing, chunking with embedding and inserting into the vector
+        database run concurrently and are connected by bounded queues, so the first fragments are searchable before the
+        whole document is parsed and the memory usage depends on the queue depth rather than on the document size.
+
+        :param conversation_id: ID of the conversation
+        :param document: Document to be processed
+        :param document_id: ID of the document (None if the collection doesn't store the fragment metadata)
+        :return: None
+        """
+
+        pages_per_batch = self.config.rag_architecture_kwargs.get("pages_per_batch", 16)
+        queue_depth = self.config.rag_architecture_kwargs.get("queue_depth", 4)
+
+        # Parse the document batch by batch
+        markdown_batches = threaded_stage(
+            parse_to_markdown_batches(document, pages_per_batch=pages_per_batch, **self.config.parser_kwargs),
+            max_queue_size=queue_depth
+        )
+
+        # Split the batches into fragments and vectorize them
+        fragment_batches = self.__split_markdown_batches(markdown_batches)
+        embedded_batches = threaded_stage(fragment_batches, self.__prepare_embeddings_with_corresponding_text,
+                                          max_queue_size=queue_depth)
+
+        # Store every batch as soon as it is ready (unflushed data is already searchable) and flush once at the end
+        for embeddings_with_text_pairs in embedded_batches:
+            self.__store_embeddings_with_text_pairs(conversation_id, embeddings_with_text_pairs, flush=False,
+                                                    document_id=document_id)
+
+        self.vector_database.flush(conversation_id)
+
+
+    def __split_markdown_batches(self, markdown_batches: Iterable) -> Iterator:
+        """
+        Split consecutive markdown batches into fragments. The last fragment of a batch may be cut by the batch border,
+        so it is carried over and tokenized again together with the next batch.
+
+        :param markdown_batches: Iterable of consecutive markdown batches
+        :return: Generator of sequences of fragments
+        """
+
+        carry = ""
+        for markdown in markdown_batches:
+            fragments = self.tokenizer.tokenize(carry + markdown)
+            if not fragments:
+                carry = ""
+                continue
+
+            carry = fragments[-1]
+            if len(fragments) > 1:
+                yield fragments[:-1]
+
+        if carry:
+            yield [carry]
 
 
     def process_query(self, conversation_id: int, query: str) -> dict:
@@ -59,36 +269,250 @@ class ClassicRAG(RAGArchitectureTemplate):
         """
 
         # Get relevant documents to the query
-        relevant_documents = self.__get_relevant_documents_by_query(conversation_id, query)
+        relevant_documents, query_embedding = self.__get_relevant_documents_by_query(conversation_id, query)
 
-        # Build prompt
-        prompt = create_prompt(query, relevant_documents)
+        # Reuse the answer of a similar question with the same relevant documents
+        prompt_stats = {}
+        answer = self.__get_cached_answer(conversation_id, query_embedding, relevant_documents)
+        if answer is None:
+            # Build prompt
+            prompt, prompt_stats = self.__create_prompt(query, relevant_documents)
 
-        # Generate answer
-        answer = self.llm.generate(prompt)
+            # Generate answer
+            answer = self.llm.generate(prompt)
+            self.__cache_answer(conversation_id, query_embedding, relevant_documents, answer)
 
         # Create a response dictionary
         response = {
             "query": query,
             "answer": answer,
-            "contexts": relevant_documents
+            "contexts": relevant_documents,
+            "prompt_stats": prompt_stats,
         }
 
         return response
 
 
-    def __prepare_vector_database(self, conversation_id: int) -> None:
+    async def a_process_document(self, conversation_id: int, document: Document, document_id: str = None) -> None:
         """
-        Prepare the vector database for a conversation by creating a collection if it doesn't exist.
+        Asynchronously process the document and store it in the vector database. Parsing, tokenization and embedding
+        run in worker threads and the fragments are inserted with the async vector database client.
+        (Incremental and streaming ingestion run in a worker thread as a whole.)
 
         :param conversation_id: ID of the conversation
+        :param document: Document to be processed
+        :param document_id: ID identifying the revisions of the document in the conversation (by default the path
+                            of the document file, used by incremental ingestion)
         :return: None
         """
 
+        if (self.config.rag_architecture_kwargs.get("incremental_ingestion", False)
+                or self.config.rag_architecture_kwargs.get("streaming_ingestion", False)):
+            await asyncio.to_thread(self.process_document, conversation_id, document, document_id)
+            return
+
+        # Prepare the vector database for the conversation
+        stores_metadata = await asyncio.to_thread(self.__prepare_vector_database, conversation_id)
+        document_id = self.__get_document_id(document, document_id) if stores_metadata else None
+
+        # Parse the document to markdown
+        parsed_document_to_markdown = await asyncio.to_thread(parse_to_markdown, document, **self.config.parser_kwargs)
+
+        # Embedding
+        fragments, embeddings = await asyncio.to_thread(self.__prepare_document_embeddings_with_corresponding_text,
+                                                        parsed_document_to_markdown)
+        fingerprints = [self.__get_fingerprint(fragment) for fragment in fragments] if document_id is not None else None
+        await self.vector_database.a_insert_columns(conversation_id, embeddings, fragments, fingerprints, flush=True,
+                                                    document_id=document_id)
+
+
+    async def a_process_query(self, conversation_id: int, query: str) -> dict:
+        """
+        Asynchronously process the query. The query is embedded in a worker thread, and the vector database and the LLM
+        are called with their async clients, so a single event loop can serve many conversations concurrently.
+
+        :param conversation_id: ID of the conversation
+        :param query: Query to be processed
+        :return: Answer to the query
+        """
+
+        # Get relevant documents to the query
+        relevant_documents, query_embedding = await self.__a_get_relevant_documents_by_query(conversation_id, query)
+
+        # Reuse the answer of a similar question with the same relevant documents
+        prompt_stats = {}
+        answer = self.__get_cached_answer(conversation_id, query_embedding, relevant_documents)
+        if answer is None:
+            # Build prompt
+            prompt, prompt_stats = self.__create_prompt(query, relevant_documents)
+
+            # Generate answer
+            answer = await self.llm.a_generate(prompt)
+            self.__cache_answer(conversation_id, query_embedding, relevant_documents, answer)
+
+        # Create a response dictionary
+        response = {
+            "query": query,
+            "answer": answer,
+            "contexts": relevant_documents,
+            "prompt_stats": prompt_stats,
+        }
+
+        return response
+
+
+    def stream_query(self, conversation_id: int, query: str) -> Iterator[dict]:
+        """
+        Process the query and stream the response as events. The relevant documents are yielded first
+        ({"event": "contexts", "query", "contexts"}), so they can be shown before the answer starts, then every text delta
+        of the answer ({"event": "delta", "text"}) and finally the whole answer with the statistics of the LLM call
+        and of the prompt ({"event": "done", "answer", "stats", "prompt_stats"}, e.g. time to the first token,
+        tokens per second and saved prompt tokens).
+
+        :param conversation_id: ID of the conversation
+        :param query: Query to be processed
+        :return: Iterator of response events
+        """
+
+        # Get relevant documents to the query
+        relevant_documents, query_embedding = self.__get_relevant_documents_by_query(conversation_id, query)
+        yield {"event": "contexts", "query": query, "contexts": relevant_documents}
+
+        # Reuse the answer of a similar question with the same relevant documents
+        stats = {}
+        prompt_stats = {}
+        answer = self.__get_cached_answer(conversation_id, query_embedding, relevant_documents)
+        if answer is not None:
+            yield {"event": "delta", "text": answer}
+        else:
+            # Build prompt
+            prompt, prompt_stats = self.__create_prompt(query, relevant_documents)
+
+            # Stream answer
+            deltas = []
+            for delta in self.llm.stream(prompt, stats):
+                deltas.append(delta)
+                yield {"event": "delta", "text": delta}
+
+            answer = "".join(deltas)
+            self.__cache_answer(conversation_id, query_embedding, relevant_documents, answer)
+
+        yield {"event": "done", "answer": answer, "stats": stats, "prompt_stats": prompt_stats}
+
+
+    async def a_stream_query(self, conversation_id: int, query: str) -> AsyncIterator[dict]:
+        """
+        Asynchronously process the query and stream the response as events (the same as stream_query).
+        The vector database and the LLM are called with their async clients.
+
+        :param conversation_id: ID of the conversation
+        :param query: Query to be processed
+        :return: Async iterator of response events
+        """
+
+        # Get relevant documents to the query
+        relevant_documents, query_embedding = await self.__a_get_relevant_documents_by_query(conversation_id, query)
+        yield {"event": "contexts", "query": query, "contexts": relevant_documents}
+
+        # Reuse the answer of a similar question with the same relevant documents
+        stats = {}
+        prompt_stats = {}
+        answer = self.__get_cached_answer(conversation_id, query_embedding, relevant_documents)
+        if answer is not None:
+            yield {"event": "delta", "text": answer}
+        else:
+            # Build prompt
+            prompt, prompt_stats = self.__create_prompt(query, relevant_documents)
+
+            # Stream answer
+            deltas = []
+            async for delta in self.llm.a_stream(prompt, stats):
+                deltas.append(delta)
+                yield {"event": "delta", "text": delta}
+
+            answer = "".join(deltas)
+            self.__cache_answer(conversation_id, query_embedding, relevant_documents, answer)
+
+        yield {"event": "done", "answer": answer, "stats": stats, "prompt_stats": prompt_stats}
+
+
+    def process_queries(self, conversation_id: int, queries: list) -> list:
+        """
+        Process many queries against the same conversation. All queries are embedded in a single batch and searched
+        with a single multi-vector search, and the answers are generated concurrently (at most max_concurrent_llm_calls
+        LLM calls at a time). Returns the responses in the order of the queries. A query whose answer couldn't be
+        generated doesn't fail the others, its response has no answer and the error message instead.
+
+        :param conversation_id: ID of the conversation
+        :param queries: List of queries to be processed
+        :return: List of responses to the queries
+        """
+
+        if not queries:
+            return []
+
+        # Get relevant documents to all queries at once
+        relevant_documents, query_embeddings = self.__get_relevant_documents_by_queries(conversation_id, queries)
+
+        # Reuse the answers of similar questions with the same relevant documents
+        answers = [self.__get_cached_answer(conversation_id, query_embedding, documents)
+                   for query_embedding, documents in zip(query_embeddings, relevant_documents)]
+        missing = [i for i, answer in enumerate(answers) if answer is None]
+
+        # Build prompts
+        prompts_with_stats = [self.__create_prompt(queries[i], relevant_documents[i]) for i in missing]
+        prompts = [prompt for prompt, _ in prompts_with_stats]
+        prompt_stats = [{} for _ in queries]
+        for i, (_, stats) in zip(missing, prompts_with_stats):
+            prompt_stats[i] = stats
+
+        # Generate answers (in the order of the prompts)
+        max_concurrency = self.config.rag_architecture_kwargs.get("max_concurrent_llm_calls", 8)
+        errors = [None for _ in queries]
+        for i, answer in zip(missing, self.llm.generate_many(prompts, max_concurrency=max_concurrency)):
+            if isinstance(answer, Exception):
+                logging.warning("Generating the answer to query %d of conversation %s failed: %r", i, conversation_id, answer)
+                errors[i] = str(answer) or type(answer).__name__
+                continue
+
+            answers[i] = answer
+            self.__cache_answer(conversation_id, query_embeddings[i], relevant_documents[i], answer)
+
+        # Create response dictionaries
+        return [
+            {
+                "query": query,
+                "answer": answer,
+                "contexts": documents,
+                "prompt_stats": stats,
+                "error": error,
+            }
+            for query, answer, documents, stats, error in zip(queries, answers, relevant_documents, prompt_stats, errors)
+        ]
+
+
+    def __prepare_vector_database(self, conversation_id: int) -> bool:
+        """
+        Prepare the vector database for a conversation by creating a collection if it doesn't exist.
+        Existing collections are kept as they are, even if they were created by older versions without the fragment
+        metadata (fingerprints and document IDs).
+
+        :param conversation_id: ID of the conversation
+        :return: True if the collection stores the fragment metadata, False otherwise
+        """
+
+        # Collections created without the fragment metadata are kept, the documents are only appended to them
+        stores_metadata = (not self.vector_database.has_collection(conversation_id)
+                           or (self.vector_database.has_field(conversation_id, "fingerprint")
+                               and self.vector_database.has_field(conversation_id, "document_id")))
+
         # Create a collection for the conversation if it doesn't exist
         if not self.vector_database.has_collection(conversation_id):
             dim = self.config.database_kwargs["embedding_dimension"]
             self.vector_database.create_collection(conversation_id, dimension=dim)
+            self.__lexical_collections.pop(conversation_id, None)
+
+        return stores_metadata
 
 
     def remove_conversation(self, conversation_id: int) -> None:
@@ -101,63 +525,365 @@ class ClassicRAG(RAGArchitectureTemplate):
 
         if self.vector_database.has_collection(conversation_id):
             self.vector_database.remove_collection(conversation_id)
+        self.__lexical_collections.pop(conversation_id, None)
+
+        if self.__answer_cache is not None:
+            self.__answer_cache.remove(conversation_id)
+
+
+    def get_cache_stats(self) -> dict:
+        """
+        Get the statistics of the retrieval cache and of the semantic answer cache.
+
+        :return: Dictionary of statistics of the enabled caches
+        """
+
+        stats = {}
+        if self.vector_database.get_retrieval_cache() is not None:
+            stats["retrieval"] = self.vector_database.get_retrieval_cache_stats()
+        if self.__answer_cache is not None:
+            stats["answer"] = self.__answer_cache.get_stats()
+
+        return stats
+
+
+    def __create_prompt(self, query: str, relevant_documents: list) -> tuple:
+        """
+        Create the prompt for the LLM (within the token budget if the prompt budget is enabled).
+
+        :param query: Query to be processed
+        :param relevant_documents: Relevant documents to the query
+        :return: Tuple of the prompt and a dictionary of its statistics (empty if the prompt budget is disabled)
+        """
+
+        if self.__prompt_builder is None:
+            return create_prompt(query, relevant_documents), {}
+
+        return self.__prompt_builder.create_prompt(query, relevant_documents)
+
+
+    def __get_cached_answer(self, conversation_id: int, query_embedding: ndarray, relevant_documents: list) -> str | None:
+        """
+        Get the cached answer of a similar question with the same relevant documents.
+
+        :param conversation_id: ID of the conversation
+        :param query_embedding: Embedding of the query
+        :param relevant_documents: Relevant documents to the query
+        :return: Cached answer or None if there is none (or the cache is disabled)
+        """
+
+        if self.__answer_cache is None:
+            return None
+
+        return self.__answer_cache.get(conversation_id, query_embedding, relevant_documents)
+
+
+    def __cache_answer(self, conversation_id: int, query_embedding: ndarray, relevant_documents: list, answer) -> None:
+        """
+        Store the answer in the semantic answer cache (if it is enabled and the answer is a text).
+
+        :param conversation_id: ID of the conversation
+        :param query_embedding: Embedding of the query
+        :param relevant_documents: Relevant documents to the query
+        :param answer: Answer to the query
+        :return: None
+        """
 
+        if self.__answer_cache is not None and isinstance(answer, str):
+            self.__answer_cache.put(conversation_id, query_embedding, relevant_documents, answer)
 
-    def __prepare_document_embeddings_with_corresponding_text(self, document: str) -> list:
+
+    def __prepare_document_embeddings_with_corresponding_text(self, document: str) -> tuple:
         """
         Prepare document embeddings by splitting the document into fragments and vectorizing them.
 
         :param document: Document to be embedded
-        :return: List of document fragments
+        :return: Tuple of the document fragments and the 2D array of their embeddings
         """
 
         # Split the document into fragments
         fragments = self.tokenizer.tokenize(document)
 
-        # Vectorize the fragments
-        embeddings = self.embedder.encode(fragments, show_progress_bar=True)
+        return self.__prepare_embeddings_with_corresponding_text(fragments, show_progress_bar=True)
 
-        # Create a list of dictionaries with text and embedding
-        embeddings_with_text_pairs = [
-            {
-                "text": fragment,
-                "embedding": embedding.tolist()
-            } for fragment, embedding in zip(fragments, embeddings)
-        ]
 
-        return embeddings_with_text_pairs
+    def __prepare_embeddings_with_corresponding_text(self, fragments: Sequence, show_progress_bar: bool = False) -> tuple:
+        """
+        Vectorize the document fragments and pair them with their text.
 
+        :param fragments: Sequence of document fragments (list or Chunks)
+        :param show_progress_bar: Whether to show a progress bar
+        :return: Tuple of the document fragments and the 2D array of their embeddings
+        """
 
-    def __store_embeddings_with_text_pairs(self, conversation_id: int, data: list) -> None:
+        # Vectorize the fragments
+        embeddings = self.embedder.encode(fragments, show_progress_bar=show_progress_bar)
+
+        return fragments, embeddings
+
+
+    def __store_embeddings_with_text_pairs(self, conversation_id: int, data: tuple, flush: bool = True,
+                                           document_id: str = None) -> None:
         """
-        Store the embeddings with their corresponding text in the vector database.
+        Store the embeddings with their corresponding text (and the fragment metadata) in the vector database as columns.
 
         :param conversation_id: ID of the conversation
-        :param data: List of tuples containing embeddings and their corresponding text
+        :param data: Tuple of the document fragments and the 2D array of their embeddings
+        :param flush: Whether to flush the collection after inserting
+        :param document_id: ID of the document (None if the collection doesn't store the fragment metadata)
         :return: None
         """
 
-        self.vector_database.insert_data(conversation_id, data)
+        fragments, embeddings = data
+        fingerprints = [self.__get_fingerprint(fragment) for fragment in fragments] if document_id is not None else None
+        self.vector_database.insert_columns(conversation_id, embeddings, fragments, fingerprints, flush=flush,
+                                            document_id=document_id)
 
 
-    def __get_relevant_documents_by_query(self, conversation_id: int, query: str) -> list:
+    def __get_relevant_documents_by_query(self, conversation_id: int, query: str) -> tuple:
         """
         Get relevant documents by processing the query and searching the vector database.
 
         :param conversation_id: ID of the conversation
         :param query: Query to be processed
+        :return: Tuple of the list of relevant documents and the query embedding
+        """
+
+        relevant_documents, query_embeddings = self.__get_relevant_documents_by_queries(conversation_id, [query])
+        return relevant_documents[0], query_embeddings[0]
+
+
+    def __get_relevant_documents_by_queries(self, conversation_id: int, queries: list) -> tuple:
+        """
+        Get relevant documents of many queries. With the retrieval cache of the vector database, the relevant documents
+        (and the query embeddings) are looked up by the normalized query texts first, and only the queries missing
+        from the cache are embedded and searched.
+
+        :param conversation_id: ID of the conversation
+        :param queries: List of queries to be processed
+        :return: Tuple of the list of lists of relevant documents (one list per query) and the list of query embeddings
+        """
+
+        cache = self.vector_database.get_retrieval_cache()
+        if cache is None:
+            relevant_documents, query_embeddings = self.__search_relevant_documents(conversation_id, queries)
+            return relevant_documents, list(query_embeddings)
+
+        generation = cache.get_generation(conversation_id)
+        keys = [cache.get_text_key(query, *self.__get_retrieval_key_params()) for query in queries]
+        entries = [cache.get(conversation_id, key) for key in keys]
+
+        missing = [i for i, entry in enumerate(entries) if entry is None]
+        if missing:
+            found_documents, found_embeddings = self.__search_relevant_documents(conversation_id,
+                                                                                 [queries[i] for i in missing])
+            for i, documents, query_embedding in zip(missing, found_documents, found_embeddings):
+                entries[i] = (documents, query_embedding)
+                cache.put(conversation_id, keys[i], entries[i], generation)
+
+        # Callers get their own lists, so they can't change the cached ones
+        return [list(documents) for documents, _ in entries], [query_embedding for _, query_embedding in entries]
+
+
+    async def __a_get_relevant_documents_by_query(self, conversation_id: int, query: str) -> tuple:
+        """
+        Asynchronously get relevant documents to the query, looking them up in the retrieval cache first (if enabled).
+
+        :param conversation_id: ID of the conversation
+        :param query: Query to be processed
+        :return: Tuple of the list of relevant documents and the query embedding
+        """
+
+        cache = self.vector_database.get_retrieval_cache()
+        if cache is None:
+            return await self.__a_search_relevant_documents(conversation_id, query)
+
+        generation = cache.get_generation(conversation_id)
+        key = cache.get_text_key(query, *self.__get_retrieval_key_params())
+        entry = cache.get(conversation_id, key)
+
+        if entry is None:
+            entry = await self.__a_search_relevant_documents(conversation_id, query)
+            cache.put(conversation_id, key, entry, generation)
+
+        relevant_documents, query_embedding = entry
+        return list(relevant_documents), query_embedding
+
+
+    def __get_retrieval_key_params(self) -> tuple:
+        """
+        Get the retrieval parameters the relevant documents depend on (a part of the retrieval cache keys).
+
+        :return: Tuple of the retrieval parameters
+        """
+
+        return "relevant_documents", self.__hybrid_search, *self.__get_retrieval_params()
+
+
+    def __search_relevant_documents(self, conversation_id: int, queries: list) -> tuple:
+        """
+        Search relevant documents of many queries by embedding them in a single batch and searching the vector database
+        with all query embeddings at once. With hybrid search, the lexical search runs while the queries are embedded.
+        With MMR, fetch_k candidates are searched and top_k diverse ones are selected.
+
+        :param conversation_id: ID of the conversation
+        :param queries: List of queries to be processed
+        :return: Tuple of the list of lists of relevant documents (one list per query) and the 2D array of query embeddings
+        """
+
+        top_k, fetch_k, mmr_lambda = self.__get_retrieval_params()
+        include_embeddings = mmr_lambda is not None
+
+        if not self.__uses_hybrid_search(conversation_id):
+            # Embedding
+            query_embeddings = self.embedder.encode(queries, show_progress_bar=True).reshape(len(queries), -1)
+
+            # Search the vector database
+            results = self.vector_database.search(conversation_id, query_embeddings.tolist(), limit=fetch_k,
+                                                  include_embeddings=include_embeddings)
+        else:
+            candidate_count = max(fetch_k, self.config.rag_architecture_kwargs.get("hybrid_candidates", 20))
+            lexical_request = self.__lexical_search_executor.submit(self.vector_database.search_text, conversation_id,
+                                                                    queries, candidate_count, include_embeddings)
+
+            # Embedding and dense search
+            query_embeddings = self.embedder.encode(queries, show_progress_bar=True).reshape(len(queries), -1)
+            dense_results = self.vector_database.search(conversation_id, query_embeddings.tolist(), limit=candidate_count,
+                                                        include_embeddings=include_embeddings)
+
+            results = self.__fuse_results(dense_results, lexical_request.result(), fetch_k)
+
+        # Create lists of relevant documents (text only)
+        relevant_documents = [self.__select_documents(hits, query_embedding, top_k, mmr_lambda)
+                              for hits, query_embedding in zip(results, query_embeddings)]
+
+        return relevant_documents, query_embeddings
+
+
+    async def __a_search_relevant_documents(self, conversation_id: int, query: str) -> tuple:
+        """
+        Asynchronously search relevant documents to the query. The query is embedded in a worker thread and the searches
+        use the async vector database client. With hybrid search, the lexical search runs concurrently.
+
+        :param conversation_id: ID of the conversation
+        :param query: Query to be processed
+        :return: Tuple of the list of relevant documents and the query embedding
+        """
+
+        top_k, fetch_k, mmr_lambda = self.__get_retrieval_params()
+        include_embeddings = mmr_lambda is not None
+        query_embedding = None
+
+        async def dense_search(candidate_count: int) -> list:
+            nonlocal query_embedding
+            query_embedding = (await asyncio.to_thread(self.embedder.encode, [query])).reshape(-1)
+            return await self.vector_database.a_search(conversation_id, [query_embedding.tolist()],
+                                                       limit=candidate_count, include_embeddings=include_embeddings)
+
+        # The collection is described only once per conversation, in a worker thread (it's a blocking call)
+        if not self.__hybrid_search or conversation_id in self.__lexical_collections:
+            hybrid_search = self.__uses_hybrid_search(conversation_id)
+        else:
+            hybrid_search = await asyncio.to_thread(self.__uses_hybrid_search, conversation_id)
+
+        if not hybrid_search:
+            results = await dense_search(fetch_k)
+        else:
+            candidate_count = max(fetch_k, self.config.rag_architecture_kwargs.get("hybrid_candidates", 20))
+            dense_results, lexical_results = await asyncio.gather(
+                dense_search(candidate_count),
+                self.vector_database.a_search_text(conversation_id, [query], limit=candidate_count,
+                                                   include_embeddings=include_embeddings),
+            )
+            results = self.__fuse_results(dense_results, lexical_results, fetch_k)
+
+        return self.__select_documents(results[0], query_embedding, top_k, mmr_lambda), query_embedding
+
+
+    def __uses_hybrid_search(self, conversation_id: int) -> bool:
+        """
+        Check if the conversation is searched by hybrid search. Collections created without the lexical index
+        (e.g. before hybrid search was enabled) are kept and searched by the dense search only.
+
+        :param conversation_id: ID of the conversation
+        :return: True if the hybrid search is enabled and the collection has the lexical index, False otherwise
+        """
+
+        if not self.__hybrid_search:
+            return False
+
+        lexical = self.__lexical_collections.get(conversation_id)
+        if lexical is None:
+            # Describing a missing collection fails, and there is nothing to search anyway
+            if not self.vector_database.has_collection(conversation_id):
+                return False
+
+            lexical = self.vector_database.has_field(conversation_id, "sparse_embedding")
+            if not lexical:
+                logging.warning("Hybrid search: the collection of conversation %s was created without the lexical index, "
+                                "so it is searched by the dense search only (remove the conversation and ingest "
+                                "its documents again to enable hybrid search).", conversation_id)
+            self.__lexical_collections[conversation_id] = lexical
+
+        return lexical
+
+
+    def __get_retrieval_params(self) -> tuple:
+        """
+        Get the number of relevant documents, the number of searched candidates and the MMR trade-off.
+        Without MMR, only top_k candidates are searched.
+
+        :return: Tuple of top_k, fetch_k and the MMR lambda (None if MMR is disabled)
+        """
+
+        top_k = self.config.rag_architecture_kwargs.get("top_k", 5)
+        mmr_lambda = self.config.rag_architecture_kwargs.get("mmr_lambda", None)
+        if mmr_lambda is None:
+            return top_k, top_k, None
+
+        fetch_k = top_k * max(1, self.config.rag_architecture_kwargs.get("fetch_k_factor", 4))
+        return top_k, fetch_k, mmr_lambda
+
+
+    def __select_documents(self, hits: list, query_embedding: ndarray, top_k: int, mmr_lambda: float | None) -> list:
+        """
+        Select the relevant documents among the search candidates, by maximal marginal relevance if it is enabled.
+
+        :param hits: Search candidates of the query (ordered by relevance)
+        :param query_embedding: Embedding of the query
+        :param top_k: Number of relevant documents
+        :param mmr_lambda: Trade-off between relevance (1) and diversity (0) or None to take the top candidates
         :return: List of relevant documents
         """
 
-        # Embedding
-        query_embedding = self.embedder.encode([query], show_progress_bar=True)
+        hits = list(hits)
+        if mmr_lambda is None or len(hits) <= top_k:
+            return [hit['entity']['text'] for hit in hits[:top_k]]
 
-        # Search the vector database
-        results = self.vector_database.search(conversation_id, query_embedding.tolist())
+        # Candidates without a returned embedding (e.g. missing in the full-precision store) are embedded again
+        embeddings = [hit['entity'].get('embedding') for hit in hits]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            for i, embedding in zip(missing, self.embedder.encode([hits[i]['entity']['text'] for i in missing])):
+                embeddings[i] = embedding
 
-        # Create a list of relevant documents (text only)
-        result = []
-        for i in results[0]:
-            result.append(i['entity']['text'])
+        selected = maximal_marginal_relevance(query_embedding, np.asarray(embeddings, dtype=np.float32), top_k, mmr_lambda)
+        return [hits[i]['entity']['text'] for i in selected]
 
-        return result
\ No newline at end of file
+
+    def __fuse_results(self, dense_results: list, lexical_results: list, limit: int) -> list:
+        """
+        Fuse the dense and lexical search results of every query by reciprocal rank fusion.
+
+        :param dense_results: Results of the dense search (one list of hits per query)
+        :param lexical_results: Results of the lexical search (one list of hits per query)
+        :param limit: Number of fused hits per query
+        :return: List of lists of fused hits (one list per query)
+        """
+
+        rrf_k = self.config.rag_architecture_kwargs.get("rrf_k", 60)
+
+        return [
+            reciprocal_rank_fusion([list(dense_hits), list(lexical_hits)], limit, k=rrf_k)
+            for dense_hits, lexical_hits in zip(dense_results, lexical_results)
+        ]
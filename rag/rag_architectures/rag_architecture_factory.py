@@ -4,6 +4,7 @@ from rag.rag_architectures.classic_rag import ClassicRAG
 
 from rag.rag_architectures.__rag_architecture_template import RAGArchitectureTemplate
 from pymupdf import Document
+from typing import AsyncIterator, Iterator
 
 
 class RAGArchitectureFactory(RAGArchitectureTemplate):
@@ -65,16 +66,18 @@ class RAGArchitectureFactory(RAGArchitectureTemplate):
         # ======================================================================================
 
 
-    def process_document(self, conversation_id: int, document: Document) -> None:
+    def process_document(self, conversation_id: int, document: Document, document_id: str = None) -> None:
         """
         Process the document to extract relevant information and store it in the vector database.
         Conversation ID is used to identify the conversation and store the document in the correct vector database collection.
 
         :param conversation_id: ID of the conversation
         :param document: Document to be processed
+        :param document_id: ID identifying the revisions of the document in the conversation (by default the path
+                            of the document file, used by incremental ingestion)
         :return: None
         """
-        return self.__rag_architecture.process_document(conversation_id, document)
+        return self.__rag_architecture.process_document(conversation_id, document, document_id)
 
 
     def process_query(self, conversation_id: int, query: str) -> dict:
@@ -87,7 +90,64 @@ class RAGArchitectureFactory(RAGArchitectureTemplate):
         :return: Response to the query
         """
         return self.__rag_architecture.process_query(conversation_id, query)
-    
+
+
+    def process_queries(self, conversation_id: int, queries: list) -> list:
+        """
+        Process many queries against the same conversation. Returns the responses in the order of the queries.
+
+        :param conversation_id: ID of the conversation
+        :param queries: List of queries to be processed
+        :return: List of responses to the queries
+        """
+        return self.__rag_architecture.process_queries(conversation_id, queries)
+
+
+    async def a_process_document(self, conversation_id: int, document: Document, document_id: str = None) -> None:
+        """
+        Asynchronously process the document and store it in the vector database.
+
+        :param conversation_id: ID of the conversation
+        :param document: Document to be processed
+        :param document_id: ID identifying the revisions of the document in the conversation (by default the path
+                            of the document file, used by incremental ingestion)
+        :return: None
+        """
+        return await self.__rag_architecture.a_process_document(conversation_id, document, document_id)
+
+
+    async def a_process_query(self, conversation_id: int, query: str) -> dict:
+        """
+        Asynchronously process the query. Returns the answer to the query based on the processed document.
+
+        :param conversation_id: ID of the conversation
+        :param query: Query to be processed
+        :return: Response to the query
+        """
+        return await self.__rag_architecture.a_process_query(conversation_id, query)
+
+
+    def stream_query(self, conversation_id: int, query: str) -> Iterator[dict]:
+        """
+        Process the query and stream the response as events (contexts first, then the deltas of the answer).
+
+        :param conversation_id: ID of the conversation
+        :param query: Query to be processed
+        :return: Iterator of response events
+        """
+        return self.__rag_architecture.stream_query(conversation_id, query)
+
+
+    def a_stream_query(self, conversation_id: int, query: str) -> AsyncIterator[dict]:
+        """
+        Asynchronously process the query and stream the response as events (contexts first, then the deltas of the answer).
+
+        :param conversation_id: ID of the conversation
+        :param query: Query to be processed
+        :return: Async iterator of response events
+        """
+        return self.__rag_architecture.a_stream_query(conversation_id, query)
+
 
     def remove_conversation(self, conversation_id: int) -> None:
         """
@@ -97,3 +157,12 @@ class RAGArchitectureFactory(RAGArchitectureTemplate):
         :return: None
         """
         return self.__rag_architecture.remove_conversation(conversation_id)
+
+
+    def get_cache_stats(self) -> dict:
+        """
+        Get the statistics of the caches of the architecture.
+
+        :return: Dictionary of statistics (one item per cache)
+        """
+        return self.__rag_architecture.get_cache_stats()
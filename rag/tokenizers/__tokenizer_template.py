@@ -1,4 +1,6 @@
 from abc import ABC, abstractmethod
+from rag.embedders.__embedder_template import EmbedderTemplate
+from collections.abc import Sequence
 
 
 class TokenizerTemplate(ABC):
@@ -14,12 +16,25 @@ class TokenizerTemplate(ABC):
 
 
     @abstractmethod
-    def tokenize(self, text: str) -> list:
+    def tokenize(self, text: str) -> Sequence:
         """
-        Tokenize the input text and return a list of tokens.
+        Tokenize the input text and return a sequence of tokens. Tokenizers should return Chunks (offsets into the text,
+        see rag.tokenizers.chunks), but any sequence of strings (for example, a list) is accepted.
 
         :param text: Input text to be tokenized
-        :return: List of tokens
+        :return: Sequence of tokens
         """
 
-        pass
\ No newline at end of file
+        pass
+
+
+    def bind_embedder(self, embedder: EmbedderTemplate) -> None:
+        """
+        Bind the embedder which encodes the fragments, so the tokenizer can adapt the fragments to it (for example,
+        to its maximal sequence length). Tokenizers which don't need the embedder don't have to override this method.
+
+        :param embedder: Embedder used to encode the fragments
+        :return: None
+        """
+
+        pass
@@ -0,0 +1,83 @@
+from collections.abc import Sequence
+import numpy as np
+import operator
+
+
+class Chunks(Sequence):
+    """
+    Compact container of document fragments. Fragments are stored as (start, end) character offsets into a single backing
+    text, and strings are only created when a fragment is accessed, so the document is not copied into many small strings
+    up front.
+    Chunks behave like a read-only list of strings (indexing, iteration, len), and slicing returns another Chunks object
+    sharing the same backing text.
+
+    :param text: Backing text
+    :param offsets: 2D integer array of (start, end) character offsets of the fragments
+    """
+
+    def __init__(self, text: str, offsets: np.ndarray) -> None:
+        self.text = text
+        self.offsets = np.asarray(offsets, dtype=np.int64).reshape(-1, 2)
+
+
+    @classmethod
+    def from_boundaries(cls, text: str, starts: np.ndarray, ends: np.ndarray) -> "Chunks":
+        """
+        Create chunks from separate arrays of fragment starts and ends.
+
+        :param text: Backing text
+        :param starts: Integer array of character offsets where the fragments start
+        :param ends: Integer array of character offsets where the fragments end
+        :return: Chunks
+        """
+
+        return cls(text, np.stack([np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64)], axis=1))
+
+
+    @property
+    def starts(self) -> np.ndarray:
+        """
+        Character offsets where the fragments start.
+        """
+
+        return self.offsets[:, 0]
+
+
+    @property
+    def ends(self) -> np.ndarray:
+        """
+        Character offsets where the fragments end.
+        """
+
+        return self.offsets[:, 1]
+
+
+    def tolist(self) -> list:
+        """
+        Materialize all fragments.
+
+        :return: List of fragments
+        """
+
+        return [self.text[start:end] for start, end in self.offsets.tolist()]
+
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return Chunks(self.text, self.offsets[index])
+
+        start, end = self.offsets[operator.index(index)]
+        return self.text[start:end]
+
+
+    def __iter__(self):
+        for start, end in self.offsets.tolist():
+            yield self.text[start:end]
+
+
+    def __repr__(self) -> str:
+        return f"Chunks({len(self)} fragments of {len(self.text)} characters)"
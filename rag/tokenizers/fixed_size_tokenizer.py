@@ -1,4 +1,6 @@
 from rag.tokenizers.__tokenizer_template import TokenizerTemplate
+from rag.tokenizers.chunks import Chunks
+import numpy as np
 
 
 class FixedSizeTokenizer(TokenizerTemplate):
@@ -6,7 +8,7 @@ class FixedSizeTokenizer(TokenizerTemplate):
     Fixed size tokenizer which tokenizes text into fixed-size tokens.
     This tokenizer is used for creating fixed-size embeddings from text.
     It is a subclass of TokenizerTemplate and implements the tokenize method.
-    The tokenize method takes a string as input and returns a list of tokens.
+    The tokenize method takes a string as input and returns Chunks of tokens (offsets into the input string).
 
     :param tokenizer_name: Name of the tokenizer
     :param chunk_size: Maximum length of the tokens
@@ -17,13 +19,14 @@ class FixedSizeTokenizer(TokenizerTemplate):
         self.chunk_size = chunk_size
 
 
-    def tokenize(self, text: str) -> list:
+    def tokenize(self, text: str) -> Chunks:
         """
         Tokenize the input text into fixed-size tokens.
 
         :param text: Input text to be tokenized
-        :return: List of fixed-size tokens
+        :return: Chunks of fixed-size tokens
         """
 
         # Create fixed-size tokens
-        return [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
\ No newline at end of file
+        starts = np.arange(0, len(text), self.chunk_size)
+        return Chunks.from_boundaries(text, starts, np.minimum(starts + self.chunk_size, len(text)))
\ No newline at end of file
@@ -0,0 +1,123 @@
+from rag.tokenizers.__tokenizer_template import TokenizerTemplate
+from rag.embedders.__embedder_template import EmbedderTemplate
+from rag.tokenizers.chunks import Chunks
+import numpy as np
+
+
+class TokenBudgetTokenizer(TokenizerTemplate):
+    """
+    Token budget tokenizer which splits text into fragments of an exact number of model tokens.
+    It uses a fast HuggingFace tokenizer to compute the character offsets of all tokens of the text (the text is split into
+    segments tokenized as a single batch), and then cuts the fragments at the token budget boundaries with NumPy,
+    so no tokenizer calls are made per fragment. Consecutive fragments can overlap by a number of tokens.
+    By default, the tokenizer and the token budget are taken from the embedder bound to the tokenizer, so fragments
+    fill the whole sequence length of the embedding model and are never truncated by it.
+
+    :param tokenizer_name: Name of the tokenizer
+    :param hf_tokenizer_name: Name of the HuggingFace tokenizer (None to use the tokenizer of the bound embedder)
+    :param max_tokens: Maximal number of tokens in a fragment (None to use the sequence length of the bound embedder)
+    :param overlap_tokens: Number of tokens shared by consecutive fragments
+    :param segment_size: Approximate number of characters of the segments tokenized in a single batch
+    """
+
+    def __init__(self, tokenizer_name: str, hf_tokenizer_name: str = None, max_tokens: int = None, overlap_tokens: int = 0,
+                 segment_size: int = 65536) -> None:
+        super().__init__(tokenizer_name)
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.segment_size = segment_size
+        self.__hf_tokenizer = None
+
+        if hf_tokenizer_name is not None:
+            from transformers import AutoTokenizer
+            self.__set_hf_tokenizer(AutoTokenizer.from_pretrained(hf_tokenizer_name, use_fast=True))
+
+
+    def bind_embedder(self, embedder: EmbedderTemplate) -> None:
+        """
+        Take the tokenizer and the token budget from the embedder (unless they were given explicitly).
+
+        :param embedder: Embedder used to encode the fragments
+        :return: None
+        """
+
+        if self.__hf_tokenizer is None and embedder.get_tokenizer() is not None:
+            self.__set_hf_tokenizer(embedder.get_tokenizer())
+
+        max_sequence_length = embedder.get_max_sequence_length()
+        if self.max_tokens is None and max_sequence_length is not None:
+            # Leave room for the special tokens added by the embedding model
+            special_tokens_count = self.__hf_tokenizer.num_special_tokens_to_add() if self.__hf_tokenizer is not None else 2
+            self.max_tokens = max_sequence_length - special_tokens_count
+
+
+    def tokenize(self, text: str) -> Chunks:
+        """
+        Tokenize the input text into fragments of at most max_tokens tokens.
+
+        :param text: Input text to be tokenized
+        :return: Chunks of the text
+        """
+
+        if self.__hf_tokenizer is None or self.max_tokens is None:
+            raise ValueError("Token budget tokenizer needs a HuggingFace tokenizer and a token budget. Pass them explicitly "
+                             "or bind an embedder which provides them.")
+        if self.overlap_tokens >= self.max_tokens:
+            raise ValueError(f"Overlap ({self.overlap_tokens}) must be smaller than the token budget ({self.max_tokens}).")
+
+        offsets = self.__get_token_offsets(text)
+        tokens_count = len(offsets)
+
+        if tokens_count == 0:
+            return Chunks(text, np.empty((0, 2), dtype=np.int64))
+
+        # Token ranges of the fragments, skipping the ranges fully covered by the previous fragment's overlap
+        step = self.max_tokens - self.overlap_tokens
+        token_starts = np.arange(0, tokens_count, step)
+        token_starts = token_starts[(token_starts == 0) | (token_starts + self.overlap_tokens < tokens_count)]
+        token_ends = np.minimum(token_starts + self.max_tokens, tokens_count)
+
+        # Character ranges of the fragments
+        return Chunks.from_boundaries(text, offsets[token_starts, 0], offsets[token_ends - 1, 1])
+
+
+    def __set_hf_tokenizer(self, hf_tokenizer) -> None:
+        """
+        Set the HuggingFace tokenizer (it has to be a fast tokenizer, which computes character offsets).
+
+        :param hf_tokenizer: HuggingFace tokenizer
+        :return: None
+        """
+
+        if not getattr(hf_tokenizer, "is_fast", False):
+            raise ValueError("Token budget tokenizer needs a fast HuggingFace tokenizer (with offset mapping).")
+
+        self.__hf_tokenizer = hf_tokenizer
+
+
+    def __get_token_offsets(self, text: str) -> np.ndarray:
+        """
+        Compute the character offsets of all tokens of the text. The text is split at whitespace into segments of about
+        segment_size characters, which are tokenized as a single batch.
+
+        :param text: Input text
+        :return: 2D array of (start, end) character offsets of the tokens
+        """
+
+        # Split the text into segments, cutting at whitespace so no word is split
+        segment_starts = [0]
+        while len(text) - segment_starts[-1] > self.segment_size:
+            start = segment_starts[-1]
+            cut = max(text.rfind(" ", start + 1, start + self.segment_size), text.rfind("\n", start + 1, start + self.segment_size))
+            segment_starts.append(cut if cut > start else start + self.segment_size)
+
+        segment_ends = segment_starts[1:] + [len(text)]
+        segments = [text[start:end] for start, end in zip(segment_starts, segment_ends)]
+
+        encodings = self.__hf_tokenizer(segments, add_special_tokens=False, return_offsets_mapping=True,
+                                        return_attention_mask=False, return_token_type_ids=False, verbose=False)
+
+        offsets = [np.asarray(segment_offsets, dtype=np.int64).reshape(-1, 2) + start
+                   for segment_offsets, start in zip(encodings["offset_mapping"], segment_starts)]
+
+        return np.concatenate(offsets)
@@ -1,9 +1,14 @@
 # ============================ Models import ===========================
 from rag.tokenizers.fixed_size_tokenizer import FixedSizeTokenizer
+from rag.tokenizers.token_budget_tokenizer import TokenBudgetTokenizer
 # ======================================================================
 
 from rag.tokenizers.__tokenizer_template import TokenizerTemplate
+from rag.embedders.__embedder_template import EmbedderTemplate
+from rag.utils.metrics_sink import get_metrics_sink
+from collections.abc import Sequence
 import logging
+import time
 
 
 class TokenizerFactory(TokenizerTemplate):
@@ -51,26 +56,52 @@ class TokenizerFactory(TokenizerTemplate):
         match tokenizer_name:
             case "fixed-size-tokenizer":
                 self.__tokenizer = FixedSizeTokenizer(tokenizer_name, **kwargs)
+            case "token-budget-tokenizer":
+                self.__tokenizer = TokenBudgetTokenizer(tokenizer_name, **kwargs)
             case _:
                 raise ValueError(f"Unsupported tokenizer name: {tokenizer_name}. Please use a valid tokenizer name.")
         # ============================= Switch between models =============================
 
 
-    def tokenize(self, text: str) -> list:
+    def bind_embedder(self, embedder: EmbedderTemplate) -> None:
         """
-        Tokenize the input text and return a list of tokens.
+        Bind the embedder which encodes the fragments to the tokenizer.
+
+        :param embedder: Embedder used to encode the fragments
+        :return: None
+        """
+
+        if self.__tokenizer is None:
+            raise ValueError("Tokenizer not set. Please set a tokenizer before binding an embedder.")
+
+        self.__tokenizer.bind_embedder(embedder)
+
+
+    def tokenize(self, text: str) -> Sequence:
+        """
+        Tokenize the input text and return a sequence of tokens (Chunks for the built-in tokenizers).
 
         :param text: Input text to be tokenized
-        :return: List of tokens
+        :return: Sequence of tokens
         """
 
-        logging.info(f"Tokenizing text: {len(text)} characters.")
+        logging.info("Tokenizing text: %d characters.", len(text))
 
         if self.__tokenizer is None:
             raise ValueError("Tokenizer not set. Please set a tokenizer before tokenizing.")
 
+        start = time.perf_counter()
         list_of_tokens = self.__tokenizer.tokenize(text)
 
-        logging.info(f"Tokenized text: {len(list_of_tokens)} tokens.")
+        logging.info("Tokenized text: %d tokens.", len(list_of_tokens))
+
+        # Record the call in the metrics sink (if the metrics are enabled)
+        sink = get_metrics_sink()
+        if sink is not None:
+            sink.record("tokenizer_call", {
+                "latency_seconds": time.perf_counter() - start,
+                "characters": len(text),
+                "fragments": len(list_of_tokens),
+            }, {"tokenizer": self.tokenizer_name})
 
         return list_of_tokens
\ No newline at end of file
@@ -1,53 +1,321 @@
 import pymupdf4llm
 from pymupdf import Document
-from multiprocessing import Pool, cpu_count
+from multiprocessing import get_context, cpu_count
+from collections import deque
+from typing import Iterator
+from rag.utils.markdown_cache import MarkdownCache, get_markdown_cache
+import atexit
+import hashlib
 import logging
+import os
+import tempfile
 
 
-def parse_to_markdown(document: Document) -> str:
+# Long-lived pool of parser processes, created on first use and reused for every document
+__parser_pool = None
+
+
+def parse_to_markdown(document: Document, min_pages_per_process: int = 16, cache_dir: str = None,
+                      cache_max_size_bytes: int = 1024 ** 3) -> str:
     """
     Parse the document to markdown using multiprocessing for performance.
+    Small documents (up to min_pages_per_process pages) are parsed in-process. Bigger documents are split into page
+    ranges of at least min_pages_per_process pages and parsed by the shared parser pool. Workers read the document
+    from a file (a temporary file in shared memory if the document is not stored on disk), so the document bytes
+    are never pickled into the tasks.
+    If cache_dir is set, the markdown of every page is cached on disk and only the pages missing from the cache are parsed.
+
     :param document: Document object
+    :param min_pages_per_process: Minimal number of pages parsed by a single process
+    :param cache_dir: Directory of the parsed markdown cache (None disables the cache)
+    :param cache_max_size_bytes: Maximal size of the parsed markdown cache
     :return: Parsed markdown content
     """
 
-    logging.info(f"Parsing document to markdown: {document.name}")
+    return "".join(parse_to_markdown_pages(document, min_pages_per_process, cache_dir, cache_max_size_bytes))
 
-    num_proc = cpu_count()
-    total_pages = document.page_count
 
-    # Serialize the document into bytes
-    document_bytes = document.write()  # Serialize the document
-    document.close()  # Close the document after serialization
+def parse_to_markdown_pages(document: Document, min_pages_per_process: int = 16, cache_dir: str = None,
+                            cache_max_size_bytes: int = 1024 ** 3) -> list:
+    """
+    Parse the document to markdown page by page (see parse_to_markdown).
 
-    # Divide the pages into chunks for each process
-    pages_list = []
-    pages = list(range(total_pages))
-    chunk_size = (total_pages + num_proc - 1) // num_proc
+    :param document: Document object
+    :param min_pages_per_process: Minimal number of pages parsed by a single process
+    :param cache_dir: Directory of the parsed markdown cache (None disables the cache)
+    :param cache_max_size_bytes: Maximal size of the parsed markdown cache
+    :return: List of markdown content of the consecutive pages
+    """
 
-    for i in range(0, total_pages, chunk_size):
-        pages_list.append(pages[i:i + chunk_size])
+    logging.info(f"Parsing document to markdown: {document.name}")
+
+    # Divide the pages into ranges sized by the page count (at least min_pages_per_process pages per range)
+    pages_per_range = max(min_pages_per_process, (document.page_count + cpu_count() - 1) // cpu_count())
 
-    # Use multiprocessing to parse the document
-    with Pool(processes=num_proc) as pool:
-        results = pool.starmap(__parse_to_markdown, [(document_bytes, pages) for pages in pages_list])
-        parsed_document_to_markdown = "".join(results)
+    parsed_pages = []
+    for batch in __parse_page_batches(document, pages_per_range, cpu_count(), min_pages_per_process, cache_dir,
+                                      cache_max_size_bytes):
+        parsed_pages.extend(batch)
 
     logging.info(f"Parsed document to markdown: {document.name}")
 
-    return parsed_document_to_markdown
+    return parsed_pages
+
+
+def parse_to_markdown_batches(document: Document, pages_per_batch: int = 16, min_pages_per_process: int = 16,
+                              cache_dir: str = None, cache_max_size_bytes: int = 1024 ** 3) -> Iterator:
+    """
+    Parse the document to markdown batch by batch. Batches of pages_per_batch pages are parsed by the shared parser pool
+    and yielded in the page order as soon as they are ready, so the consumer can process the beginning of the document
+    while the rest is still being parsed. Only a bounded number of batches is parsed ahead of the consumer.
+    Small documents (up to min_pages_per_process pages to parse) are parsed in-process.
+
+    :param document: Document object
+    :param pages_per_batch: Number of pages in a single batch
+    :param min_pages_per_process: Minimal number of pages for which the parser pool is used
+    :param cache_dir: Directory of the parsed markdown cache (None disables the cache)
+    :param cache_max_size_bytes: Maximal size of the parsed markdown cache
+    :return: Generator of markdown content of the consecutive page batches
+    """
+
+    logging.info(f"Parsing document to markdown in batches: {document.name}")
+
+    for batch in __parse_page_batches(document, pages_per_batch, 2 * cpu_count(), min_pages_per_process, cache_dir,
+                                      cache_max_size_bytes):
+        yield "".join(batch)
+
+    logging.info(f"Parsed document to markdown in batches: {document.name}")
+
+
+def shutdown_parser_pool() -> None:
+    """
+    Terminate the shared parser pool. A new pool is created when it is needed again.
+
+    :return: None
+    """
+
+    global __parser_pool
+
+    if __parser_pool is not None:
+        __parser_pool.terminate()
+        __parser_pool.join()
+        __parser_pool = None
+
+
+def __parse_page_batches(document: Document, pages_per_batch: int, max_pending: int, min_pages_per_process: int,
+                         cache_dir: str, cache_max_size_bytes: int) -> Iterator:
+    """
+    Parse consecutive page batches of the document. Pages found in the cache are not parsed again. If there are more
+    than min_pages_per_process pages to parse, they are parsed by the shared parser pool with at most max_pending
+    batches submitted ahead of the consumer. Otherwise, they are parsed in-process. The document is closed.
+
+    :param document: Document object (closed by this function)
+    :param pages_per_batch: Number of pages in a single batch
+    :param max_pending: Maximal number of batches submitted to the pool and not yet consumed
+    :param min_pages_per_process: Minimal number of pages for which the parser pool is used
+    :param cache_dir: Directory of the parsed markdown cache (None disables the cache)
+    :param cache_max_size_bytes: Maximal size of the parsed markdown cache
+    :return: Generator of lists of markdown content of the pages in the consecutive batches
+    """
+
+    pages = list(range(document.page_count))
+    pages_list = [pages[i:i + pages_per_batch] for i in range(0, len(pages), pages_per_batch)]
+
+    # Look up the pages in the cache
+    cache, cache_key, cached_pages, document_bytes = None, None, {}, None
+    if cache_dir is not None:
+        cache = get_markdown_cache(cache_dir, cache_max_size_bytes)
+        document_hash, document_bytes = __hash_document(document)
+        cache_key = MarkdownCache.make_key(document_hash, __get_parser_options())
+        cached_pages = cache.get_pages(cache_key, pages)
+
+    missing_pages_count = len(pages) - len(cached_pages)
+
+    # Small amount of work is not worth sending to the pool
+    if missing_pages_count <= min_pages_per_process:
+        try:
+            for batch in pages_list:
+                missing_pages = [page for page in batch if page not in cached_pages]
+                parsed_pages = __parse_document_pages(document, missing_pages) if missing_pages else []
+                yield __merge_pages(batch, cached_pages, parsed_pages, cache, cache_key)
+        finally:
+            document.close()  # Close the document after processing
+        return
+
+    pool = __get_parser_pool()
+
+    # Share the document with the workers through a file instead of pickling its bytes into every task
+    document_path, is_temporary = __share_document(document, document_bytes)
+    document.close()  # Close the document after sharing
+    del document_bytes
+
+    try:
+        pending = deque()
+        for batch in pages_list:
+            # Wait for the oldest batch before submitting more work than allowed
+            if len(pending) >= max_pending:
+                yield __merge_pending_batch(pending.popleft(), cached_pages, cache, cache_key)
+
+            missing_pages = [page for page in batch if page not in cached_pages]
+            result = pool.apply_async(__parse_to_markdown, (document_path, missing_pages)) if missing_pages else None
+            pending.append((batch, result))
+
+        while pending:
+            yield __merge_pending_batch(pending.popleft(), cached_pages, cache, cache_key)
+    finally:
+        if is_temporary:
+            os.remove(document_path)
+
+
+def __merge_pending_batch(pending_batch: tuple, cached_pages: dict, cache: MarkdownCache, cache_key: str) -> list:
+    """
+    Wait for the batch submitted to the parser pool and merge it with the cached pages.
+
+    :param pending_batch: Tuple of the batch pages and the pool result (None if all pages are cached)
+    :param cached_pages: Dictionary mapping page numbers to their cached markdown
+    :param cache: Markdown cache (None if disabled)
+    :param cache_key: Cache key of the document
+    :return: List of markdown content of the batch pages
+    """
+
+    batch, result = pending_batch
+    parsed_pages = result.get() if result is not None else []
+    return __merge_pages(batch, cached_pages, parsed_pages, cache, cache_key)
+
+
+def __merge_pages(batch: list, cached_pages: dict, parsed_pages: list, cache: MarkdownCache, cache_key: str) -> list:
+    """
+    Merge the cached and the newly parsed pages of the batch and store the newly parsed pages in the cache.
+
+    :param batch: List of page numbers of the batch
+    :param cached_pages: Dictionary mapping page numbers to their cached markdown
+    :param parsed_pages: Markdown content of the batch pages missing from the cache (in the page order)
+    :param cache: Markdown cache (None if disabled)
+    :param cache_key: Cache key of the document
+    :return: List of markdown content of the batch pages
+    """
+
+    missing_pages = [page for page in batch if page not in cached_pages]
+    new_pages = dict(zip(missing_pages, parsed_pages))
+
+    if cache is not None:
+        cache.put_pages(cache_key, new_pages)
+
+    return [cached_pages[page] if page in cached_pages else new_pages[page] for page in batch]
+
+
+def __get_parser_pool():
+    """
+    Get the shared parser pool, creating it on the first call. The pool uses the "spawn" start method, so it is safe
+    to create it from a process which already runs threads or has initialized CUDA.
+
+    :return: Parser pool
+    """
+
+    global __parser_pool
+
+    if __parser_pool is None:
+        __parser_pool = get_context("spawn").Pool(processes=cpu_count())
+        atexit.register(shutdown_parser_pool)
+
+    return __parser_pool
+
+
+def __get_parser_options() -> dict:
+    """
+    Get the parser name, version and options which influence the parsed markdown (part of the cache key).
+
+    :return: Dictionary of the parser options
+    """
+
+    return {
+        "parser": "pymupdf4llm",
+        "version": getattr(pymupdf4llm, "__version__", "unknown"),
+        "page_chunks": True,
+    }
+
+
+def __hash_document(document: Document) -> tuple:
+    """
+    Compute the SHA-256 of the original document bytes, so the same unmodified PDF has the same hash whether it was
+    opened from disk or from memory. Documents opened from disk are hashed by reading their file, documents opened
+    from memory by their stream. Modified documents are serialized (without a new file ID, so the serialization
+    is deterministic), and the bytes of the documents not stored on disk are returned to be reused.
+
+    :param document: Document object
+    :return: Tuple of the hex digest and the document bytes (None if the file was read from disk)
+    """
+
+    if __is_shareable_by_path(document):
+        with open(document.name, "rb") as file:
+            return hashlib.file_digest(file, "sha256").hexdigest(), None
+
+    stream = getattr(document, "stream", None)
+    if isinstance(stream, (bytes, bytearray, memoryview)) and not document.is_dirty:
+        document_bytes = bytes(stream)
+    else:
+        document_bytes = document.write(no_new_id=True)
 
+    return hashlib.sha256(document_bytes).hexdigest(), document_bytes
 
-def __parse_to_markdown(document_bytes: bytes, pages: list) -> str:
+
+def __is_shareable_by_path(document: Document) -> bool:
+    """
+    Check whether the document is an unmodified file on disk, so other processes can open it by its path.
+
+    :param document: Document object
+    :return: True if the document can be opened by its path, False otherwise
+    """
+
+    return bool(document.name) and os.path.isfile(document.name) and not document.is_dirty
+
+
+def __share_document(document: Document, document_bytes: bytes = None) -> tuple:
+    """
+    Get a path the worker processes can open the document from. Unmodified documents opened from disk are shared
+    by their own path. Other documents are saved to a temporary file, placed in shared memory (/dev/shm) if available.
+
+    :param document: Document object
+    :param document_bytes: Already serialized document bytes (None to serialize the document if needed)
+    :return: Tuple of the document path and a flag telling whether the file is temporary and has to be removed
+    """
+
+    if __is_shareable_by_path(document):
+        return document.name, False
+
+    temporary_directory = "/dev/shm" if os.access("/dev/shm", os.W_OK) else None
+    file_descriptor, document_path = tempfile.mkstemp(suffix=".pdf", dir=temporary_directory)
+
+    if document_bytes is not None:
+        with os.fdopen(file_descriptor, "wb") as file:
+            file.write(document_bytes)
+    else:
+        os.close(file_descriptor)
+        document.save(document_path)
+
+    return document_path, True
+
+
+def __parse_document_pages(document: Document, pages: list) -> list:
+    """
+    Parse given pages of the opened document to markdown.
+    :param document: Document object
+    :param pages: List of pages to parse
+    :return: List of markdown content of the given pages
+    """
+    chunks = pymupdf4llm.to_markdown(doc=document, pages=pages, page_chunks=True)
+    return [chunk["text"] for chunk in chunks]
+
+
+def __parse_to_markdown(document_path: str, pages: list) -> list:
     """
     Parse given pages of the document to markdown.
-    :param document_bytes: Serialized document bytes
+    :param document_path: Path to the shared document file
     :param pages: List of pages to parse
-    :return: Markdown content for the given pages
+    :return: List of markdown content of the given pages
     """
-    # Reconstruct the document from bytes
-    document = Document(stream=document_bytes, filetype="pdf")
-    markdown = pymupdf4llm.to_markdown(doc=document, pages=pages)
+    # Open the shared document (pages are read lazily, so only the needed ones are loaded)
+    document = Document(document_path, filetype="pdf")
+    markdown = __parse_document_pages(document, pages)
     document.close()  # Close the document after processing
     return markdown
-
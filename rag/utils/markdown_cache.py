@@ -0,0 +1,267 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+
+class MarkdownCache:
+    """
+    On-disk, content-addressed cache of parsed markdown. Every document is stored in a separate directory named by its
+    key (SHA-256 of the document bytes and the parser options) and every page is stored in a separate file, so any
+    subset of pages can be served from the cache and only the missing pages have to be parsed.
+    The total size of the cache is bounded, least recently used documents are evicted first. The total size is scanned
+    once when the cache is created and then kept up to date by the puts, so the cache directory is only scanned again
+    when the size limit is exceeded (the eviction then frees space down to a low watermark below the limit).
+
+    :param cache_dir: Directory where the cache is stored
+    :param max_size_bytes: Maximal total size of the cached markdown
+    """
+
+    # Fraction of the size limit the eviction frees space down to (so the next puts don't trigger another scan)
+    __LOW_WATERMARK = 0.9
+
+
+    def __init__(self, cache_dir: str, max_size_bytes: int = 1024 ** 3) -> None:
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.__lock = threading.Lock()
+        self.__evict_lock = threading.Lock()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # Running total size of the cache (other processes sharing the directory are accounted for at the next scan)
+        self.__total_size = self.__scan()[1]
+
+
+    @staticmethod
+    def make_key(document_hash: str, parser_options: dict) -> str:
+        """
+        Create a cache key for the document parsed with the given parser options.
+
+        :param document_hash: SHA-256 of the document bytes
+        :param parser_options: Parser name, version and options which influence the output
+        :return: Cache key
+        """
+
+        options = json.dumps(parser_options, sort_keys=True)
+        return hashlib.sha256(f"{document_hash}:{options}".encode("utf-8")).hexdigest()
+
+
+    def get_pages(self, key: str, pages: list) -> dict:
+        """
+        Get the cached markdown of the given pages. Pages which are not cached are missing from the result.
+
+        :param key: Cache key of the document
+        :param pages: List of page numbers
+        :return: Dictionary mapping page numbers to their markdown
+        """
+
+        document_dir = os.path.join(self.cache_dir, key)
+        result = {}
+
+        if os.path.isdir(document_dir):
+            for page in pages:
+                try:
+                    with open(self.__get_page_path(document_dir, page), "r", encoding="utf-8") as file:
+                        result[page] = file.read()
+                except FileNotFoundError:
+                    continue
+
+            # Mark the document as recently used
+            if result:
+                self.__touch(document_dir)
+
+        with self.__lock:
+            self.hits += len(result)
+            self.misses += len(pages) - len(result)
+
+        return result
+
+
+    def put_pages(self, key: str, pages: dict) -> None:
+        """
+        Store the markdown of the given pages and evict the least recently used documents if the cache is too big.
+
+        :param key: Cache key of the document
+        :param pages: Dictionary mapping page numbers to their markdown
+        :return: None
+        """
+
+        if not pages:
+            return
+
+        document_dir = os.path.join(self.cache_dir, key)
+        os.makedirs(document_dir, exist_ok=True)
+
+        added_size = 0
+        for page, markdown in pages.items():
+            # Write to a temporary file first, so other processes never read a partially written page
+            file_descriptor, temporary_path = tempfile.mkstemp(dir=document_dir, suffix=".tmp")
+            with os.fdopen(file_descriptor, "w", encoding="utf-8") as file:
+                file.write(markdown)
+
+            page_path = self.__get_page_path(document_dir, page)
+            added_size += os.path.getsize(temporary_path) - self.__get_size(page_path)
+            os.replace(temporary_path, page_path)
+
+        self.__touch(document_dir)
+
+        with self.__lock:
+            self.__total_size += added_size
+            over_limit = self.__total_size > self.max_size_bytes
+
+        if over_limit:
+            self.__evict()
+
+
+    def get_stats(self) -> dict:
+        """
+        Get the cache statistics (counted in pages).
+
+        :return: Dictionary with hits, misses, evictions and hit rate
+        """
+
+        with self.__lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+    def __evict(self) -> None:
+        """
+        Remove the least recently used documents until the cache fits under the low watermark of its size limit.
+        The cache directory is scanned, so the running total size is corrected for the changes made by other processes.
+        Only one thread evicts at a time (the other threads skip the eviction).
+
+        :return: None
+        """
+
+        if not self.__evict_lock.acquire(blocking=False):
+            return
+
+        try:
+            entries, total_size = self.__scan()
+
+            if total_size > self.max_size_bytes:
+                target_size = self.max_size_bytes * self.__LOW_WATERMARK
+
+                # Oldest documents first
+                entries.sort()
+                for _, size, path in entries:
+                    if total_size <= target_size:
+                        break
+
+                    shutil.rmtree(path, ignore_errors=True)
+                    total_size -= size
+
+                    with self.__lock:
+                        self.evictions += 1
+
+                    logging.info("Markdown cache: evicted %s (%d bytes).", path, size)
+
+            with self.__lock:
+                self.__total_size = total_size
+        finally:
+            self.__evict_lock.release()
+
+
+    def __scan(self) -> tuple:
+        """
+        Scan the cache directory for the cached documents.
+
+        :return: Tuple of the list of (modification time, size, path) of the documents and their total size
+        """
+
+        entries = []
+        total_size = 0
+
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_dir():
+                continue
+            try:
+                size = sum(file.stat().st_size for file in os.scandir(entry.path))
+                entries.append((entry.stat().st_mtime, size, entry.path))
+            except FileNotFoundError:  # Removed by another process
+                continue
+            total_size += size
+
+        return entries, total_size
+
+
+    @staticmethod
+    def __get_size(path: str) -> int:
+        """
+        Get the size of the file.
+
+        :param path: Path of the file
+        :return: Size in bytes (0 if the file doesn't exist)
+        """
+
+        try:
+            return os.path.getsize(path)
+        except FileNotFoundError:
+            return 0
+
+
+    @staticmethod
+    def __get_page_path(document_dir: str, page: int) -> str:
+        """
+        Get the path of the file storing the markdown of the page.
+
+        :param document_dir: Directory of the cached document
+        :param page: Page number
+        :return: Path of the page file
+        """
+
+        return os.path.join(document_dir, f"{page}.md")
+
+
+    @staticmethod
+    def __touch(path: str) -> None:
+        """
+        Update the modification time of the path, which is used as the last access time.
+
+        :param path: Path to be touched
+        :return: None
+        """
+
+        try:
+            os.utime(path)
+        except FileNotFoundError:  # Evicted by another process
+            pass
+
+
+# Cache instances shared by all callers within the process (one per cache directory)
+__markdown_caches = {}
+__markdown_caches_lock = threading.Lock()
+
+
+def get_markdown_cache(cache_dir: str, max_size_bytes: int = 1024 ** 3) -> MarkdownCache:
+    """
+    Get the markdown cache stored in the given directory. The same instance is returned for the same directory,
+    so the hit and miss counters are shared within the process.
+
+    :param cache_dir: Directory where the cache is stored
+    :param max_size_bytes: Maximal total size of the cached markdown
+    :return: Markdown cache
+    """
+
+    cache_dir = os.path.abspath(cache_dir)
+
+    with __markdown_caches_lock:
+        if cache_dir not in __markdown_caches:
+            __markdown_caches[cache_dir] = MarkdownCache(cache_dir, max_size_bytes)
+        cache = __markdown_caches[cache_dir]
+        cache.max_size_bytes = max_size_bytes
+
+    return cache
@@ -0,0 +1,213 @@
+from abc import ABC, abstractmethod
+import bisect
+import math
+import threading
+
+
+class MetricsSink(ABC):
+    """
+    Base class for metrics sinks. The factories (LLMs, embedders, tokenizers) record an event for every call with its
+    measured values (e.g. latency_seconds, input_tokens) and its labels (e.g. model name, cache status).
+    A new sink (e.g. forwarding the events to a monitoring system) can be created by inheriting from this class
+    and implementing the record method, and installed by set_metrics_sink.
+    """
+
+    @abstractmethod
+    def record(self, event: str, values: dict, labels: dict) -> None:
+        """
+        Record an event. It is called on the hot paths, so it should be cheap and must be thread-safe.
+
+        :param event: Name of the event (e.g. "llm_call")
+        :param values: Dictionary of the measured values of the event (names ending with _seconds are durations)
+        :param labels: Dictionary of the labels of the event (strings)
+        :return: None
+        """
+        pass
+
+
+class InMemoryMetricsSink(MetricsSink):
+    """
+    Metrics sink keeping a histogram of every value of every event (per label set) in memory. Durations (values whose
+    names end with _seconds) and counts have separate bucket bounds. The histograms can be summarized (count, sum,
+    mean and quantiles interpolated within the buckets) or exported in the Prometheus text format.
+
+    :param duration_buckets: Upper bounds of the buckets of the durations in seconds
+    :param count_buckets: Upper bounds of the buckets of the other values
+    """
+
+    def __init__(self, duration_buckets: tuple = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+                 count_buckets: tuple = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10_000, 50_000, 100_000)) -> None:
+        self.duration_buckets = tuple(duration_buckets)
+        self.count_buckets = tuple(count_buckets)
+
+        # (metric name, sorted label items) -> [bucket counts (the last one is +Inf), sum, count]
+        self.__histograms = {}
+        self.__lock = threading.Lock()
+
+
+    def record(self, event: str, values: dict, labels: dict) -> None:
+        """
+        Add the values of the event to their histograms.
+
+        :param event: Name of the event
+        :param values: Dictionary of the measured values of the event (None values are skipped)
+        :param labels: Dictionary of the labels of the event
+        :return: None
+        """
+
+        label_items = tuple(sorted(labels.items()))
+
+        with self.__lock:
+            for name, value in values.items():
+                if value is None:
+                    continue
+
+                buckets = self.duration_buckets if name.endswith("_seconds") else self.count_buckets
+                key = (f"{event}_{name}", label_items)
+                histogram = self.__histograms.get(key)
+                if histogram is None:
+                    histogram = self.__histograms[key] = [[0] * (len(buckets) + 1), 0.0, 0]
+
+                histogram[0][bisect.bisect_left(buckets, value)] += 1
+                histogram[1] += value
+                histogram[2] += 1
+
+
+    def get_stats(self) -> dict:
+        """
+        Summarize the histograms.
+
+        :return: Dictionary mapping the metric names to lists of dictionaries (one per label set) with the labels, count,
+                 sum, mean and the approximate p50, p95 and p99
+        """
+
+        with self.__lock:
+            histograms = [(key, (list(counts), total, count)) for key, (counts, total, count) in self.__histograms.items()]
+
+        stats = {}
+        for (name, label_items), (counts, total, count) in sorted(histograms):
+            buckets = self.duration_buckets if name.endswith("_seconds") else self.count_buckets
+            stats.setdefault(name, []).append({
+                "labels": dict(label_items),
+                "count": count,
+                "sum": total,
+                "mean": total / count if count else 0.0,
+                "p50": self.__get_quantile(counts, buckets, 0.50),
+                "p95": self.__get_quantile(counts, buckets, 0.95),
+                "p99": self.__get_quantile(counts, buckets, 0.99),
+            })
+
+        return stats
+
+
+    def export_prometheus(self, prefix: str = "rag_") -> str:
+        """
+        Export the histograms in the Prometheus text exposition format.
+
+        :param prefix: Prefix of the metric names
+        :return: Text of the metrics
+        """
+
+        with self.__lock:
+            histograms = [(key, (list(counts), total, count)) for key, (counts, total, count) in self.__histograms.items()]
+
+        lines = []
+        last_name = None
+        for (name, label_items), (counts, total, count) in sorted(histograms):
+            metric = prefix + name
+            if name != last_name:
+                lines.append(f"# TYPE {metric} histogram")
+                last_name = name
+
+            buckets = self.duration_buckets if name.endswith("_seconds") else self.count_buckets
+            cumulative = 0
+            for bound, bucket_count in zip([*buckets, math.inf], counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == math.inf else repr(float(bound))
+                lines.append(f"{metric}_bucket{self.__format_labels(label_items + (('le', le),))} {cumulative}")
+            lines.append(f"{metric}_sum{self.__format_labels(label_items)} {total!r}")
+            lines.append(f"{metric}_count{self.__format_labels(label_items)} {count}")
+
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+    def clear(self) -> None:
+        """
+        Remove all histograms.
+
+        :return: None
+        """
+
+        with self.__lock:
+            self.__histograms.clear()
+
+
+    @staticmethod
+    def __get_quantile(counts: list, buckets: tuple, quantile: float) -> float:
+        """
+        Approximate the quantile by a linear interpolation within its bucket (values in the +Inf bucket are reported
+        as the last bound).
+
+        :param counts: Counts of the buckets
+        :param buckets: Upper bounds of the buckets
+        :param quantile: Quantile (0 to 1)
+        :return: Approximate quantile
+        """
+
+        count = sum(counts)
+        if count == 0:
+            return 0.0
+
+        rank = quantile * count
+        cumulative = 0
+        for i, bucket_count in enumerate(counts):
+            if cumulative + bucket_count >= rank and bucket_count > 0:
+                if i == len(buckets):
+                    return float(buckets[-1])
+                lower = buckets[i - 1] if i > 0 else min(0.0, buckets[0])
+                return lower + (buckets[i] - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+
+        return float(buckets[-1])
+
+
+    @staticmethod
+    def __format_labels(label_items: tuple) -> str:
+        """
+        Format the labels of a Prometheus sample.
+
+        :param label_items: Tuple of (name, value) pairs
+        :return: Formatted labels (empty if there are none)
+        """
+
+        if not label_items:
+            return ""
+
+        escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, value in label_items)
+        return "{" + ",".join(f"{name}=\"{value}\"" for (name, _), value in zip(label_items, escaped)) + "}"
+
+
+# Process-wide metrics sink of the factories (None disables the metrics)
+__sink = InMemoryMetricsSink()
+
+
+def get_metrics_sink() -> MetricsSink | None:
+    """
+    Get the process-wide metrics sink.
+
+    :return: Metrics sink or None if the metrics are disabled
+    """
+
+    return __sink
+
+
+def set_metrics_sink(sink: MetricsSink | None) -> None:
+    """
+    Set the process-wide metrics sink (None disables the metrics, so the factories only check for it).
+
+    :param sink: Metrics sink
+    :return: None
+    """
+
+    global __sink
+    __sink = sink
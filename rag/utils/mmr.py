@@ -0,0 +1,46 @@
+from numpy import ndarray
+import numpy as np
+
+
+def maximal_marginal_relevance(query_embedding: ndarray, candidate_embeddings: ndarray, k: int,
+                               lambda_mult: float = 0.5) -> list:
+    """
+    Select k candidates by maximal marginal relevance. Candidates are picked greedily by
+    lambda_mult * similarity to the query - (1 - lambda_mult) * maximal similarity to the already selected candidates,
+    so near-duplicates of a selected candidate are pushed down. Similarities are cosine similarities.
+    Every greedy step is a single matrix-vector product with the last selected candidate and a vectorized update
+    of the maximal similarities (the full pairwise similarity matrix is never computed), so a few hundred candidates
+    are processed in microseconds.
+
+    :param query_embedding: 1D array of the query embedding
+    :param candidate_embeddings: 2D array of the candidate embeddings (ordered by relevance)
+    :param k: Number of selected candidates
+    :param lambda_mult: Trade-off between relevance (1) and diversity (0)
+    :return: List of the indices of the selected candidates (in the order of selection)
+    """
+
+    candidates = np.asarray(candidate_embeddings, dtype=np.float32)
+    k = min(k, len(candidates))
+    if k <= 0:
+        return []
+
+    # Dot products are divided by the norms instead of normalizing the candidates (which would copy them)
+    inverse_norms = 1 / np.maximum(np.sqrt(np.einsum("ij,ij->i", candidates, candidates)), 1e-12)
+    query = np.asarray(query_embedding, dtype=np.float32).ravel()
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+    relevance = lambda_mult * (candidates @ query) * inverse_norms
+
+    # Maximal similarity of every candidate to the selected ones
+    redundancy = np.full(len(candidates), -np.inf, dtype=np.float32)
+    scores = relevance.copy()
+
+    selected = [int(np.argmax(relevance))]
+    for _ in range(k - 1):
+        last = selected[-1]
+        np.maximum(redundancy, (candidates @ candidates[last]) * (inverse_norms * inverse_norms[last]), out=redundancy)
+        np.subtract(relevance, (1 - lambda_mult) * redundancy, out=scores)
+        scores[selected] = -np.inf
+        selected.append(int(np.argmax(scores)))
+
+    return selected
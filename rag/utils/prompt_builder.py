@@ -1,3 +1,12 @@
+from typing import Sequence
+import hashlib
+import logging
+import math
+import re
+
+
+# Sentence boundaries: whitespace after a sentence-ending punctuation mark, or a line break
+__SENTENCE_BOUNDARY_PATTERN = re.compile(r"(?<=[.!?])\s+|\n+")
 
 
 def create_prompt(query: str, relevant_documents: list) -> str:
@@ -5,28 +14,287 @@ def create_prompt(query: str, relevant_documents: list) -> str:
     Create a prompt for the LLM based on the query and relevant documents.
 
     :param query: The user's query
-    :param relevant_documents:
+    :param relevant_documents: List of relevant documents
     :return: Formatted prompt string
     """
 
-    prompt = f"Question: {query}\n\n"
-    prompt += "Relevant documents:\n"
-    prompt += __format_relevant_documents(relevant_documents)
+    return get_prompt_header(query) + "".join(get_document_header(i) + doc for i, doc in enumerate(relevant_documents))
 
-    return prompt
 
+def get_prompt_header(query: str) -> str:
+    """
+    Get the part of the prompt preceding the relevant documents.
 
-def __format_relevant_documents(relevant_documents: list) -> str:
+    :param query: The user's query
+    :return: Header of the prompt
     """
-    Format the relevant documents for the prompt.
 
-    :param relevant_documents: List of relevant documents
-    :return: Formatted string of relevant documents
+    return f"Question: {query}\n\nRelevant documents:\n"
+
+
+def get_document_header(index: int) -> str:
+    """
+    Get the header preceding a relevant document in the prompt.
+
+    :param index: Index of the document (from 0)
+    :return: Header of the document
+    """
+
+    return f"\n================= Document {index + 1} =================\n"
+
+
+def split_sentences(text: str) -> list:
+    """
+    Split the text into sentences. Every sentence keeps the whitespace following it, so joining the sentences
+    gives back the text.
+
+    :param text: Text to be split
+    :return: List of sentences
+    """
+
+    sentences = []
+    start = 0
+    for boundary in __SENTENCE_BOUNDARY_PATTERN.finditer(text):
+        if boundary.start() > start:
+            sentences.append(text[start:boundary.end()])
+            start = boundary.end()
+
+    if start < len(text):
+        sentences.append(text[start:])
+
+    return sentences
+
+
+class PromptBuilder:
     """
+    Prompt builder which fits the relevant documents into a token budget. Tokens are counted by the tokenizer of the target
+    model (a HuggingFace tokenizer, or tiktoken for OpenAI models; about 4 characters per token if neither is available).
+    Before packing, duplicated documents are removed, the parts of the documents overlapping an already selected document
+    (e.g. the overlap of consecutive fragments) are cut off, and near-duplicates (most of their word 3-grams occur
+    in the selected documents) are removed. Then the documents are packed from the most relevant one until the budget
+    is spent, and the first document which doesn't fit is truncated at a sentence boundary.
+
+    :param max_tokens: Maximal number of tokens of the prompt (None for no limit, only deduplication)
+    :param model_name: Name of the target model (its tiktoken encoding is used)
+    :param hf_tokenizer_name: Name of the HuggingFace tokenizer of the target model (takes precedence over model_name)
+    :param duplicate_threshold: Fraction of the word 3-grams of a document occurring in the selected documents above which
+                                the document is a near-duplicate
+    :param min_overlap_chars: Minimal number of characters of an overlap cut off from a document
+    :param min_truncated_tokens: Minimal number of tokens of a truncated document (smaller remainders are dropped)
+    """
+
+    # Words used for the shingles of the near-duplicate detection
+    __WORD_PATTERN = re.compile(r"\w+")
+
+
+    def __init__(self, max_tokens: int = None, model_name: str = None, hf_tokenizer_name: str = None,
+                 duplicate_threshold: float = 0.8, min_overlap_chars: int = 64, min_truncated_tokens: int = 32) -> None:
+        self.max_tokens = max_tokens
+        self.duplicate_threshold = duplicate_threshold
+        self.min_overlap_chars = min_overlap_chars
+        self.min_truncated_tokens = min_truncated_tokens
+        self.__count_tokens = self.__create_token_counter(model_name, hf_tokenizer_name)
+
+
+    def create_prompt(self, query: str, relevant_documents: Sequence) -> tuple:
+        """
+        Create a prompt for the LLM based on the query and the relevant documents within the token budget.
+        The question is never cut, so if it alone exceeds the budget, the prompt has no documents and the overrun
+        is logged and reported in the statistics.
+
+        :param query: The user's query
+        :param relevant_documents: Sequence of relevant documents (ordered from the most relevant one)
+        :return: Tuple of the prompt and a dictionary of statistics (number of tokens of all the documents and of the prompt,
+                 saved tokens, tokens over the budget, and numbers of removed duplicates, truncated and dropped documents)
+        """
+
+        header = get_prompt_header(query)
+        document_headers = [get_document_header(i) for i in range(len(relevant_documents))]
+
+        # Token counts of the headers and of the original documents (a single tokenizer call)
+        counts = self.__count_tokens([header] + document_headers + list(relevant_documents))
+        header_tokens = counts[0]
+        document_header_tokens = counts[1:len(relevant_documents) + 1]
+        original_tokens = header_tokens + sum(counts[1:])
+
+        documents = self.__deduplicate(relevant_documents)
+        duplicates_removed = len(relevant_documents) - len(documents)
+
+        # Pack the documents from the most relevant one (the headers are numbered by the position in the prompt)
+        document_tokens = self.__count_tokens(documents)
+        budget = self.max_tokens - header_tokens if self.max_tokens is not None else math.inf
+        selected = []
+        truncated = 0
+        for i, (document, tokens) in enumerate(zip(documents, document_tokens)):
+            available = budget - document_header_tokens[i]
+            if tokens > available:
+                document, tokens = self.__truncate(document, available)
+                if document:
+                    selected.append(get_document_header(i) + document)
+                    budget -= document_header_tokens[i] + tokens
+                    truncated += 1
+                break
+
+            selected.append(get_document_header(i) + document)
+            budget -= document_header_tokens[i] + tokens
+
+        prompt = header + "".join(selected)
+        prompt_tokens = self.max_tokens - budget if self.max_tokens is not None \
+            else header_tokens + sum(document_header_tokens[:len(selected)]) + sum(document_tokens)
+
+        over_budget_tokens = max(0, prompt_tokens - self.max_tokens) if self.max_tokens is not None else 0
+        if over_budget_tokens:
+            logging.warning("Prompt builder: the question alone takes %d tokens, %d over the budget of %d tokens "
+                            "(no documents were added).", header_tokens, over_budget_tokens, self.max_tokens)
+
+        stats = {
+            "original_tokens": original_tokens,
+            "prompt_tokens": prompt_tokens,
+            "saved_tokens": original_tokens - prompt_tokens,
+            "over_budget_tokens": over_budget_tokens,
+            "duplicates_removed": duplicates_removed,
+            "truncated_documents": truncated,
+            "dropped_documents": len(documents) - len(selected),
+        }
+
+        logging.info("Prompt builder: %d of %d tokens used (%d saved, %d duplicates removed, %d documents dropped).",
+                     prompt_tokens, original_tokens, stats["saved_tokens"], duplicates_removed, stats["dropped_documents"])
+
+        return prompt, stats
+
+
+    def __deduplicate(self, documents: Sequence) -> list:
+        """
+        Remove the duplicated and near-duplicated documents and cut off the parts overlapping the selected documents
+        (a more relevant document always wins).
+
+        :param documents: Sequence of documents (ordered from the most relevant one)
+        :return: List of the deduplicated documents
+        """
+
+        selected = []
+        seen_hashes = set()
+        seen_shingles = set()
+
+        for document in documents:
+            normalized = " ".join(document.split())
+            digest = hashlib.sha256(normalized.casefold().encode("utf-8")).digest()
+            if not normalized or digest in seen_hashes:
+                continue
+
+            for other in selected:
+                document = self.__remove_overlap(other, document)
+                if not document:
+                    break
+            if not document.strip():
+                continue
+
+            shingles = self.__get_shingles(document)
+            if shingles and len(shingles & seen_shingles) >= self.duplicate_threshold * len(shingles):
+                continue
+
+            selected.append(document)
+            seen_hashes.add(digest)
+            seen_shingles |= shingles
+
+        return selected
+
+
+    def __remove_overlap(self, selected: str, document: str) -> str:
+        """
+        Cut off the parts of the document overlapping the selected document: a prefix equal to a suffix of the selected
+        document and a suffix equal to its prefix (the overlaps of consecutive fragments).
+
+        :param selected: Already selected document
+        :param document: Document to be cut
+        :return: The rest of the document (empty if the selected document contains it)
+        """
+
+        if document in selected:
+            return ""
+
+        # The document starts inside the selected one
+        probe = document[:self.min_overlap_chars]
+        position = selected.rfind(probe)
+        if len(probe) == self.min_overlap_chars and position >= 0 and document.startswith(selected[position:]):
+            document = document[len(selected) - position:]
+
+        # The document ends inside the selected one
+        probe = selected[:self.min_overlap_chars]
+        position = document.find(probe)
+        if len(probe) == self.min_overlap_chars and position >= 0 and selected.startswith(document[position:]):
+            document = document[:position]
+
+        return document
+
+
+    @staticmethod
+    def __get_shingles(document: str) -> set:
+        """
+        Get the word 3-grams of the document.
+
+        :param document: Document
+        :return: Set of the 3-grams
+        """
+
+        words = PromptBuilder.__WORD_PATTERN.findall(document.casefold())
+        return set(zip(words, words[1:], words[2:]))
+
+
+    def __truncate(self, document: str, max_tokens: float) -> tuple:
+        """
+        Truncate the document to at most max_tokens tokens at a sentence boundary.
+
+        :param document: Document to be truncated
+        :param max_tokens: Maximal number of tokens
+        :return: Tuple of the truncated document (empty if fewer than min_truncated_tokens tokens would be left)
+                 and its number of tokens
+        """
+
+        if max_tokens < self.min_truncated_tokens:
+            return "", 0
+
+        sentences = split_sentences(document)
+        sentence_tokens = self.__count_tokens(sentences)
+
+        count = 0
+        tokens = 0
+        while count < len(sentences) and tokens + sentence_tokens[count] <= max_tokens:
+            tokens += sentence_tokens[count]
+            count += 1
+
+        if tokens < self.min_truncated_tokens:
+            return "", 0
+
+        return "".join(sentences[:count]).rstrip(), tokens
+
+
+    @staticmethod
+    def __create_token_counter(model_name: str | None, hf_tokenizer_name: str | None):
+        """
+        Create the function counting the tokens of texts with the tokenizer of the target model.
+
+        :param model_name: Name of the target model
+        :param hf_tokenizer_name: Name of the HuggingFace tokenizer of the target model
+        :return: Function mapping a list of texts to a list of their token counts
+        """
+
+        if hf_tokenizer_name is not None:
+            from transformers import AutoTokenizer
+            hf_tokenizer = AutoTokenizer.from_pretrained(hf_tokenizer_name, use_fast=True)
+            return lambda texts: [len(ids) for ids in hf_tokenizer(list(texts), add_special_tokens=False)["input_ids"]] \
+                if texts else []
 
-    formatted_docs = ""
+        try:
+            import tiktoken
+        except ImportError:
+            logging.info("Prompt builder: tiktoken is not installed, tokens are estimated from the number of characters.")
+            return lambda texts: [math.ceil(len(text) / 4) for text in texts]
 
-    for i, doc in enumerate(relevant_documents):
-        formatted_docs += f"\n================= Document {i + 1} =================\n{doc}"
+        try:
+            encoding = tiktoken.encoding_for_model(model_name) if model_name is not None else tiktoken.get_encoding("o200k_base")
+        except KeyError:
+            # Models unknown to tiktoken (e.g. OpenRouter models) are approximated by the newest OpenAI encoding
+            encoding = tiktoken.get_encoding("o200k_base")
 
-    return formatted_docs
\ No newline at end of file
+        return lambda texts: [len(tokens) for tokens in encoding.encode_ordinary_batch(list(texts))]
@@ -0,0 +1,30 @@
+from typing import Sequence
+
+
+def reciprocal_rank_fusion(rankings: Sequence, limit: int, k: int = 60, weights: Sequence = None) -> list:
+    """
+    Fuse rankings of the same collection (e.g. dense and lexical search results of a query) by reciprocal rank fusion.
+    Every hit scores weight / (k + rank) in every ranking it occurs in, so only the ranks matter and the scores
+    of different searches don't have to be comparable. Hits are matched by their IDs.
+
+    :param rankings: Sequence of rankings (lists of hits ordered from the best one, every hit has an "id")
+    :param limit: Number of fused hits
+    :param k: Rank constant (higher values flatten the differences between the top ranks)
+    :param weights: Weights of the rankings (None for equal weights)
+    :return: List of the fused hits (the first occurrence of every hit with the fused score as its distance)
+    """
+
+    if weights is None:
+        weights = [1.0] * len(rankings)
+
+    scores = {}
+    hits = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, hit in enumerate(ranking, start=1):
+            scores[hit["id"]] = scores.get(hit["id"], 0.0) + weight / (k + rank)
+            hits.setdefault(hit["id"], hit)
+
+    # Ties keep the order of the first occurrence (dicts preserve the insertion order and sorted is stable)
+    fused = sorted(scores, key=scores.get, reverse=True)[:limit]
+
+    return [{**hits[hit_id], "distance": scores[hit_id]} for hit_id in fused]
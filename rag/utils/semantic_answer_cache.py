@@ -0,0 +1,203 @@
+from collections import OrderedDict
+from typing import Sequence
+from numpy import ndarray
+import numpy as np
+import hashlib
+import threading
+
+
+class SemanticAnswerCache:
+    """
+    In-memory cache of the answers of every conversation, looked up by the similarity of the questions. A cached answer
+    is reused if the cosine similarity of the query embeddings reaches similarity_threshold and the same set of contexts
+    was retrieved for both questions (so the answer is never reused after the relevant documents changed).
+    The query embeddings of a conversation are kept in a normalized matrix, so the lookup is a single matrix-vector
+    product. Every conversation keeps at most max_entries answers and at most max_conversations conversations are kept
+    (least recently used ones are evicted first in both cases).
+
+    :param similarity_threshold: Minimal cosine similarity of the query embeddings
+    :param max_entries: Maximal number of cached answers of a conversation
+    :param max_conversations: Maximal number of conversations with cached answers
+    """
+
+    def __init__(self, similarity_threshold: float = 0.95, max_entries: int = 1_000, max_conversations: int = 1_000) -> None:
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.max_conversations = max_conversations
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # Conversations ordered from the least to the most recently used, mapped to their entries
+        self.__conversations = OrderedDict()
+        self.__lock = threading.Lock()
+
+
+    @staticmethod
+    def get_context_key(contexts: Sequence) -> str:
+        """
+        Get the key of the set of contexts (independent of their order).
+
+        :param contexts: Sequence of context texts
+        :return: Key
+        """
+
+        hashes = sorted(hashlib.sha256(context.encode("utf-8")).hexdigest() for context in contexts)
+        return hashlib.sha256("\0".join(hashes).encode("ascii")).hexdigest()
+
+
+    def get(self, conversation_id: int, query_embedding: ndarray, contexts: Sequence) -> str | None:
+        """
+        Get the cached answer of the most similar cached question with the same contexts.
+
+        :param conversation_id: ID of the conversation
+        :param query_embedding: Embedding of the query
+        :param contexts: Contexts retrieved for the query
+        :return: Cached answer or None if there is no such question
+        """
+
+        query = self.__normalize(query_embedding)
+        context_key = self.get_context_key(contexts)
+
+        with self.__lock:
+            entries = self.__conversations.get(conversation_id)
+            if entries is None or entries["size"] == 0 or entries["embeddings"].shape[1] != len(query):
+                self.misses += 1
+                return None
+
+            similarities = entries["embeddings"][:entries["size"]] @ query
+            candidates = np.flatnonzero(similarities >= self.similarity_threshold)
+
+            # The most similar candidate with the same contexts wins
+            for row in candidates[np.argsort(-similarities[candidates], kind="stable")].tolist():
+                if entries["context_keys"][row] == context_key:
+                    self.hits += 1
+                    entries["clock"] += 1
+                    entries["last_used"][row] = entries["clock"]
+                    self.__conversations.move_to_end(conversation_id)
+                    return entries["answers"][row]
+
+            self.misses += 1
+            return None
+
+
+    def put(self, conversation_id: int, query_embedding: ndarray, contexts: Sequence, answer: str) -> None:
+        """
+        Store the answer of the query. If the conversation has max_entries answers, the least recently used one
+        is replaced.
+
+        :param conversation_id: ID of the conversation
+        :param query_embedding: Embedding of the query
+        :param contexts: Contexts retrieved for the query
+        :param answer: Answer to the query
+        :return: None
+        """
+
+        query = self.__normalize(query_embedding)
+        context_key = self.get_context_key(contexts)
+
+        with self.__lock:
+            entries = self.__conversations.get(conversation_id)
+            if entries is None or entries["embeddings"].shape[1] != len(query):
+                entries = self.__create_entries(len(query))
+                self.__conversations[conversation_id] = entries
+                while len(self.__conversations) > self.max_conversations:
+                    _, evicted = self.__conversations.popitem(last=False)
+                    self.evictions += evicted["size"]
+            self.__conversations.move_to_end(conversation_id)
+
+            if entries["size"] < self.max_entries:
+                row = entries["size"]
+                if row == len(entries["embeddings"]):
+                    self.__grow(entries)
+                entries["size"] += 1
+                entries["context_keys"].append(None)
+                entries["answers"].append(None)
+            else:
+                row = int(np.argmin(entries["last_used"][:entries["size"]]))
+                self.evictions += 1
+
+            entries["clock"] += 1
+            entries["embeddings"][row] = query
+            entries["last_used"][row] = entries["clock"]
+            entries["context_keys"][row] = context_key
+            entries["answers"][row] = answer
+
+
+    def remove(self, conversation_id: int) -> None:
+        """
+        Remove the cached answers of the conversation.
+
+        :param conversation_id: ID of the conversation
+        :return: None
+        """
+
+        with self.__lock:
+            self.__conversations.pop(conversation_id, None)
+
+
+    def get_stats(self) -> dict:
+        """
+        Get the cache statistics.
+
+        :return: Dictionary with the number of entries, hits, misses, evictions and hit rate
+        """
+
+        with self.__lock:
+            total = self.hits + self.misses
+            return {
+                "entries": sum(entries["size"] for entries in self.__conversations.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+    def __create_entries(self, dimension: int) -> dict:
+        """
+        Create the empty entries of a conversation.
+
+        :param dimension: Dimension of the query embeddings
+        :return: Dictionary of the entries
+        """
+
+        capacity = min(self.max_entries, 16)
+        return {
+            "size": 0,
+            "clock": 0,
+            "embeddings": np.zeros((capacity, dimension), dtype=np.float32),
+            "last_used": np.zeros(capacity, dtype=np.int64),
+            "context_keys": [],
+            "answers": [],
+        }
+
+
+    def __grow(self, entries: dict) -> None:
+        """
+        Double the capacity of the entries of a conversation (up to max_entries).
+
+        :param entries: Dictionary of the entries
+        :return: None
+        """
+
+        capacity = min(self.max_entries, 2 * len(entries["embeddings"]))
+        embeddings = np.zeros((capacity, entries["embeddings"].shape[1]), dtype=np.float32)
+        embeddings[:entries["size"]] = entries["embeddings"][:entries["size"]]
+        last_used = np.zeros(capacity, dtype=np.int64)
+        last_used[:entries["size"]] = entries["last_used"][:entries["size"]]
+        entries["embeddings"] = embeddings
+        entries["last_used"] = last_used
+
+
+    @staticmethod
+    def __normalize(embedding: ndarray) -> ndarray:
+        """
+        Normalize the embedding to the unit length.
+
+        :param embedding: Embedding
+        :return: 1D float32 array of the normalized embedding
+        """
+
+        embedding = np.asarray(embedding, dtype=np.float32).ravel()
+        return embedding / max(float(np.linalg.norm(embedding)), 1e-12)
@@ -0,0 +1,72 @@
+from queue import Queue, Empty, Full
+from threading import Thread, Event
+from typing import Callable, Iterable, Iterator
+
+
+# Marks the end of the stream in the stage queue
+__END_OF_STREAM = object()
+
+
+def threaded_stage(items: Iterable, function: Callable = None, max_queue_size: int = 4) -> Iterator:
+    """
+    Run a pipeline stage in a background thread. The thread consumes items, applies the function to each of them and
+    puts the results into a bounded queue, which is consumed by the returned generator. Chaining stages lets every stage
+    work concurrently, while the memory used by the pipeline is bounded by the queue sizes.
+    Exceptions raised in the background thread are re-raised by the generator. When the consumer stops early (or the stage
+    fails), the thread stops and closes the input items, so the upstream stages release their resources immediately.
+
+    :param items: Iterable of items to be processed (it can be another stage)
+    :param function: Function applied to every item (None passes the items through unchanged)
+    :param max_queue_size: Maximal number of processed items waiting for the consumer
+    :return: Generator of processed items, in the same order as the input items
+    """
+
+    results = Queue(maxsize=max_queue_size)
+    stopped = Event()
+
+    def put(value) -> bool:
+        # Put the value into the queue, giving up when the consumer stopped reading
+        while not stopped.is_set():
+            try:
+                results.put(value, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def worker() -> None:
+        try:
+            for item in items:
+                if stopped.is_set() or not put(function(item) if function is not None else item):
+                    return
+        except BaseException as e:  # Forward the error to the consumer
+            put(e)
+            return
+        finally:
+            # Close the upstream generator (e.g. the parser or a previous stage) in the thread iterating it
+            close = getattr(items, "close", None)
+            if close is not None:
+                close()
+        put(__END_OF_STREAM)
+
+    thread = Thread(target=worker, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            try:
+                result = results.get(timeout=0.1)
+            except Empty:
+                if not thread.is_alive() and results.empty():
+                    return
+                continue
+
+            if result is __END_OF_STREAM:
+                return
+            if isinstance(result, BaseException):
+                raise result
+
+            yield result
+    finally:
+        # Signal the worker to stop, it closes the upstream items
+        stopped.set()
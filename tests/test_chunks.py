@@ -0,0 +1,56 @@
+from rag.tokenizers.chunks import Chunks
+from rag.tokenizers.fixed_size_tokenizer import FixedSizeTokenizer
+import numpy as np
+import pytest
+
+
+TEXT = "alpha beta gamma delta"
+
+
+def create_chunks() -> Chunks:
+    return Chunks.from_boundaries(TEXT, [0, 6, 11, 17], [5, 10, 16, 22])
+
+
+def test_chunks_behave_like_a_list_of_strings():
+    chunks = create_chunks()
+
+    assert len(chunks) == 4
+    assert chunks[0] == "alpha"
+    assert chunks[-1] == "delta"
+    assert chunks[np.int64(2)] == "gamma"
+    assert list(chunks) == ["alpha", "beta", "gamma", "delta"]
+    assert chunks.tolist() == list(chunks)
+    assert "beta" in chunks
+    assert chunks.index("gamma") == 2
+
+
+def test_out_of_range_index_raises_index_error():
+    with pytest.raises(IndexError):
+        create_chunks()[4]
+
+
+def test_slices_share_the_backing_text():
+    chunks = create_chunks()[1:3]
+
+    assert isinstance(chunks, Chunks)
+    assert chunks.text is TEXT
+    assert chunks.tolist() == ["beta", "gamma"]
+    assert chunks.starts.tolist() == [6, 11]
+    assert chunks.ends.tolist() == [10, 16]
+
+
+def test_empty_chunks():
+    chunks = Chunks(TEXT, np.empty((0, 2), dtype=np.int64))
+
+    assert len(chunks) == 0
+    assert chunks.tolist() == []
+    assert repr(chunks) == f"Chunks(0 fragments of {len(TEXT)} characters)"
+
+
+def test_fixed_size_tokenizer_covers_the_text():
+    text = "x" * 10 + "y" * 10 + "z" * 5
+    chunks = FixedSizeTokenizer("fixed-size-tokenizer", chunk_size=10).tokenize(text)
+
+    assert isinstance(chunks, Chunks)
+    assert chunks.tolist() == ["x" * 10, "y" * 10, "z" * 5]
+    assert "".join(chunks) == text
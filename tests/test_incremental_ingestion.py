@@ -0,0 +1,137 @@
+from config import ConfigTemplate
+from rag.embedders.__embedder_template import EmbedderTemplate
+from rag.rag_architectures.classic_rag import ClassicRAG
+from types import SimpleNamespace
+import hashlib
+import numpy as np
+import pytest
+
+
+DIMENSION = 64
+
+
+class HashingEmbedder(EmbedderTemplate):
+    """
+    Deterministic embedder hashing the words of the fragments into the embedding dimensions. It remembers the encoded
+    fragments, so the tests can check which fragments were embedded.
+    """
+
+    def __init__(self, embedder_name: str, **kwargs) -> None:
+        super().__init__(embedder_name)
+        self.encoded = []
+
+
+    def encode(self, fragments: list, show_progress_bar: bool = False) -> np.ndarray:
+        fragments = [fragments] if isinstance(fragments, str) else list(fragments)
+        self.encoded.append(fragments)
+
+        embeddings = np.zeros((len(fragments), DIMENSION), dtype=np.float32)
+        embeddings[:, 0] = 1.0
+        for i, fragment in enumerate(fragments):
+            for word in fragment.split():
+                embeddings[i, int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16) % (DIMENSION - 1) + 1] += 1.0
+
+        return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def rag(monkeypatch):
+    embedders = []
+
+    def create_embedder(embedder_name: str, **kwargs) -> HashingEmbedder:
+        embedders.append(HashingEmbedder(embedder_name, **kwargs))
+        return embedders[-1]
+
+    monkeypatch.setattr("rag.embedders.embedder_factory.BasicEmbedder", create_embedder)
+    monkeypatch.setattr("rag.rag_architectures.classic_rag.parse_to_markdown_pages",
+                        lambda document, **kwargs: iter(document.pages))
+
+    config = ConfigTemplate(
+        database_kwargs={"backend": "numpy", "embedding_dimension": DIMENSION},
+        rag_architecture_name="classic-rag",
+        embedder_name="basic-embedder",
+        embedder_kwargs={"sentence_transformer_name": "hashing-embedder", "device": "cpu"},
+        tokenizer_name="fixed-size-tokenizer",
+        tokenizer_kwargs={"chunk_size": 256},
+        llm_name="local-stub",
+        llm_kwargs={"initial_prompt": "", "base_url": "http://127.0.0.1:9/v1"},
+        evaluation_llm_name="local-stub",
+        evaluation_kwargs={},
+        parser_kwargs={},
+        rag_architecture_kwargs={"incremental_ingestion": True},
+    )
+
+    rag = ClassicRAG("classic-rag", config)
+    rag.encoded = embedders[0].encoded
+    return rag
+
+
+def create_document(path, *pages) -> SimpleNamespace:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"%PDF")
+    return SimpleNamespace(name=str(path), pages=list(pages))
+
+
+def get_stored_texts(rag: ClassicRAG, conversation_id: int) -> list:
+    query = np.zeros((1, DIMENSION), dtype=np.float32)
+    query[0, 0] = 1.0
+    return sorted(hit["entity"]["text"] for hit in rag.vector_database.search(conversation_id, query.tolist(), limit=1000)[0])
+
+
+def test_only_changed_fragments_are_embedded(rag, tmp_path):
+    path = tmp_path / "report.pdf"
+    rag.process_document(1, create_document(path, "page one", "page two", "page three"))
+    rag.encoded.clear()
+
+    rag.process_document(1, create_document(path, "page one", "page two revised", "page three"))
+
+    assert rag.encoded == [["page two revised"]]
+    assert get_stored_texts(rag, 1) == ["page one", "page three", "page two revised"]
+
+
+def test_unchanged_document_is_not_embedded_again(rag, tmp_path):
+    document = create_document(tmp_path / "report.pdf", "page one", "page one", "page two")
+    rag.process_document(1, document)
+    rag.encoded.clear()
+
+    rag.process_document(1, document)
+
+    assert rag.encoded == []
+    assert get_stored_texts(rag, 1) == ["page one", "page one", "page two"]
+
+
+def test_documents_with_the_same_file_name_are_different_documents(rag, tmp_path):
+    rag.process_document(1, create_document(tmp_path / "a" / "report.pdf", "first report"))
+    rag.process_document(1, create_document(tmp_path / "b" / "report.pdf", "second report"))
+
+    rag.process_document(1, create_document(tmp_path / "a" / "report.pdf", "first report revised"))
+
+    assert get_stored_texts(rag, 1) == ["first report revised", "second report"]
+
+
+def test_document_id_identifies_documents_not_stored_on_disk(rag):
+    rag.process_document(1, SimpleNamespace(name="", pages=["uploaded text"]), document_id="upload")
+    rag.process_document(1, SimpleNamespace(name="", pages=["other text"]), document_id="other upload")
+
+    rag.process_document(1, SimpleNamespace(name="", pages=["uploaded text revised"]), document_id="upload")
+
+    assert get_stored_texts(rag, 1) == ["other text", "uploaded text revised"]
+
+
+def test_documents_without_id_are_ingested_whole(rag, monkeypatch):
+    monkeypatch.setattr("rag.rag_architectures.classic_rag.parse_to_markdown", lambda document, **kwargs: document.pages[0])
+    document = SimpleNamespace(name="", pages=["uploaded text"])
+
+    rag.process_document(1, document)
+    rag.process_document(1, document)
+
+    assert get_stored_texts(rag, 1) == ["uploaded text", "uploaded text"]
+
+
+def test_conversations_are_independent(rag, tmp_path):
+    path = tmp_path / "report.pdf"
+    rag.process_document(1, create_document(path, "first conversation"))
+    rag.process_document(2, create_document(path, "second conversation"))
+
+    assert get_stored_texts(rag, 1) == ["first conversation"]
+    assert get_stored_texts(rag, 2) == ["second conversation"]
@@ -0,0 +1,101 @@
+from rag.llms.llm_dispatcher import a_dispatch, dispatch, set_rate_limit
+from rag.llms.local_stub_server import LocalStubServer
+import asyncio
+import openai
+import pytest
+import time
+
+
+MODEL_NAME = "local-stub"
+API_KEY = "local-stub"
+
+
+@pytest.fixture
+def create_server():
+    servers = []
+
+    def create(max_retries: int = 10, **kwargs) -> LocalStubServer:
+        server = LocalStubServer(**{"port": 0, "answer_tokens": 4, "retry_after": 0, **kwargs})
+        servers.append(server)
+        set_rate_limit(server.start(), API_KEY, MODEL_NAME, max_retries=max_retries, initial_backoff=0.001,
+                       max_backoff=0.01)
+        return server
+
+    yield create
+
+    for server in servers:
+        server.stop()
+
+
+def send(client):
+    return client.chat.completions.create(model=MODEL_NAME, messages=[{"role": "user", "content": "hello"}])
+
+
+def test_transient_errors_are_retried(create_server):
+    server = create_server(rate_limit_error_rate=0.2, server_error_rate=0.3)
+
+    usages = [{} for _ in range(10)]
+    for usage in usages:
+        response = dispatch(server.base_url, API_KEY, MODEL_NAME, send, input_text="hello", usage=usage)
+        assert response.choices[0].message.content
+
+    assert server.errors > 0
+    assert sum(usage["retries"] for usage in usages) == server.errors
+    assert server.requests == len(usages) + server.errors
+
+
+def test_errors_are_raised_after_the_last_retry(create_server):
+    server = create_server(max_retries=2, server_error_rate=1.0)
+    usage = {}
+
+    with pytest.raises(openai.InternalServerError):
+        dispatch(server.base_url, API_KEY, MODEL_NAME, send, usage=usage)
+
+    assert server.requests == 3
+    assert usage["retries"] == 2
+
+
+def test_retry_after_is_respected(create_server):
+    server = create_server(max_retries=1, rate_limit_error_rate=1.0, retry_after=0.2)
+
+    start = time.perf_counter()
+    with pytest.raises(openai.RateLimitError):
+        dispatch(server.base_url, API_KEY, MODEL_NAME, send)
+
+    assert time.perf_counter() - start >= 0.2
+    assert server.requests == 2
+
+
+def test_client_errors_are_not_retried(create_server):
+    server = create_server()
+    calls = []
+
+    class BadRequestError(Exception):
+        status_code = 400
+
+    def request(client):
+        calls.append(client)
+        raise BadRequestError("bad request")
+
+    with pytest.raises(BadRequestError):
+        dispatch(server.base_url, API_KEY, MODEL_NAME, request)
+
+    assert len(calls) == 1
+
+
+def test_concurrent_async_requests_are_retried(create_server):
+    server = create_server(rate_limit_error_rate=0.2, server_error_rate=0.3)
+    usages = [{} for _ in range(10)]
+
+    async def send_all() -> list:
+        async def request(client):
+            return await client.chat.completions.create(model=MODEL_NAME, messages=[{"role": "user", "content": "hello"}])
+
+        return await asyncio.gather(*[a_dispatch(server.base_url, API_KEY, MODEL_NAME, request, usage=usage)
+                                      for usage in usages])
+
+    responses = asyncio.run(send_all())
+
+    assert all(response.choices[0].message.content for response in responses)
+    assert server.errors > 0
+    assert sum(usage["retries"] for usage in usages) == server.errors
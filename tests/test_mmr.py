@@ -0,0 +1,32 @@
+from rag.utils.mmr import maximal_marginal_relevance
+import numpy as np
+
+
+QUERY = np.array([1.0, 0.0, 0.0], dtype=np.float32)
+
+# The first two candidates are near-duplicates, the third one is less relevant but different
+CANDIDATES = np.array([
+    [0.9, 0.1, 0.0],
+    [0.89, 0.11, 0.0],
+    [0.7, 0.0, 0.7],
+], dtype=np.float32)
+
+
+def test_relevance_only_keeps_the_relevance_order():
+    assert maximal_marginal_relevance(QUERY, CANDIDATES, 3, lambda_mult=1.0) == [0, 1, 2]
+
+
+def test_near_duplicates_are_pushed_down():
+    assert maximal_marginal_relevance(QUERY, CANDIDATES, 2, lambda_mult=0.5) == [0, 2]
+
+
+def test_similarities_are_cosine_similarities():
+    scaled = CANDIDATES * np.array([[10.0], [0.1], [3.0]], dtype=np.float32)
+
+    assert maximal_marginal_relevance(QUERY * 5, scaled, 2, lambda_mult=0.5) == [0, 2]
+
+
+def test_k_is_limited_by_the_candidates():
+    assert sorted(maximal_marginal_relevance(QUERY, CANDIDATES, 10)) == [0, 1, 2]
+    assert maximal_marginal_relevance(QUERY, CANDIDATES, 0) == []
+    assert maximal_marginal_relevance(QUERY, np.empty((0, 3), dtype=np.float32), 3) == []
@@ -0,0 +1,41 @@
+from rag.utils.rank_fusion import reciprocal_rank_fusion
+import pytest
+
+
+def hits(*ids) -> list:
+    return [{"id": hit_id, "distance": 0.0, "entity": {"text": f"text {hit_id}"}} for hit_id in ids]
+
+
+def test_hits_found_by_both_searches_come_first():
+    fused = reciprocal_rank_fusion([hits(1, 2, 3), hits(3, 4, 1)], limit=4, k=60)
+
+    assert [hit["id"] for hit in fused] == [1, 3, 2, 4]
+    assert fused[0]["distance"] == pytest.approx(1 / 61 + 1 / 63)
+    assert fused[2]["distance"] == pytest.approx(1 / 62)
+
+
+def test_limit_and_entities_of_the_first_occurrence():
+    dense = hits(1, 2)
+    lexical = [{"id": 2, "distance": 7.5, "entity": {"text": "lexical text"}}]
+
+    fused = reciprocal_rank_fusion([dense, lexical], limit=1)
+
+    assert len(fused) == 1
+    assert fused[0]["id"] == 2
+    assert fused[0]["entity"] == {"text": "text 2"}
+
+
+def test_ties_keep_the_order_of_the_first_occurrence():
+    fused = reciprocal_rank_fusion([hits(1, 2), hits(2, 1)], limit=2)
+
+    assert [hit["id"] for hit in fused] == [1, 2]
+
+
+def test_weights():
+    fused = reciprocal_rank_fusion([hits(1, 2), hits(2, 1)], limit=2, weights=[1.0, 2.0])
+
+    assert [hit["id"] for hit in fused] == [2, 1]
+
+
+def test_empty_rankings():
+    assert reciprocal_rank_fusion([[], []], limit=5) == []
@@ -0,0 +1,104 @@
+from database.retrieval_cache import RetrievalCache
+from database.vector_database import VectorDatabase
+import itertools
+import numpy as np
+import time
+
+
+# The generations are shared by all caches of the process, so every test uses its own conversations
+conversation_ids = itertools.count(1_000_000)
+
+
+def test_text_keys_are_normalized():
+    assert RetrievalCache.get_text_key("What is RAG?", 5) == RetrievalCache.get_text_key("  what  is rag ", 5)
+    assert RetrievalCache.get_text_key("What is RAG?", 5) != RetrievalCache.get_text_key("What is RAG?", 10)
+
+
+def test_embedding_keys_are_quantized():
+    cache = RetrievalCache(embedding_step=1e-3)
+    embedding = np.array([0.1, 0.2, 0.3], dtype=np.float32)
+
+    assert cache.get_embedding_key(embedding, 5) == cache.get_embedding_key(embedding + 1e-5, 5)
+    assert cache.get_embedding_key(embedding, 5) != cache.get_embedding_key(embedding + 1e-2, 5)
+
+
+def test_least_recently_used_results_are_evicted():
+    cache = RetrievalCache(max_entries=2)
+    conversation_id = next(conversation_ids)
+    generation = cache.get_generation(conversation_id)
+
+    cache.put(conversation_id, "a", 1, generation)
+    cache.put(conversation_id, "b", 2, generation)
+    assert cache.get(conversation_id, "a") == 1
+    cache.put(conversation_id, "c", 3, generation)
+
+    assert cache.get(conversation_id, "b") is None
+    assert cache.get(conversation_id, "a") == 1
+    assert cache.get(conversation_id, "c") == 3
+    assert cache.get_stats()["evictions"] == 1
+
+
+def test_results_expire():
+    cache = RetrievalCache(ttl_seconds=0.01)
+    conversation_id = next(conversation_ids)
+
+    cache.put(conversation_id, "a", 1, cache.get_generation(conversation_id))
+    time.sleep(0.02)
+
+    assert cache.get(conversation_id, "a") is None
+
+
+def test_invalidation_removes_the_results_of_the_conversation():
+    cache = RetrievalCache()
+    conversation_id, other_conversation_id = next(conversation_ids), next(conversation_ids)
+    cache.put(conversation_id, "a", 1, cache.get_generation(conversation_id))
+    cache.put(other_conversation_id, "a", 2, cache.get_generation(other_conversation_id))
+
+    cache.invalidate(conversation_id)
+
+    assert cache.get(conversation_id, "a") is None
+    assert cache.get(other_conversation_id, "a") == 2
+
+
+def test_results_of_searches_running_during_a_write_are_not_stored():
+    cache = RetrievalCache()
+    conversation_id = next(conversation_ids)
+    generation = cache.get_generation(conversation_id)
+
+    cache.invalidate(conversation_id)
+    cache.put(conversation_id, "a", 1, generation)
+
+    assert cache.get(conversation_id, "a") is None
+
+
+def test_invalidation_is_shared_by_the_caches_of_the_process():
+    cache, other_cache = RetrievalCache(), RetrievalCache()
+    conversation_id = next(conversation_ids)
+    cache.put(conversation_id, "a", 1, cache.get_generation(conversation_id))
+
+    other_cache.invalidate(conversation_id)
+
+    assert cache.get(conversation_id, "a") is None
+
+
+def test_writes_invalidate_cached_search_results():
+    vector_database = VectorDatabase(backend="numpy", retrieval_cache={"embedding_step": 1e-3})
+    conversation_id = next(conversation_ids)
+    vector_database.create_collection(conversation_id, 4)
+    vector_database.insert_columns(conversation_id, np.array([[1, 0, 0, 0], [0, 1, 0, 0]], dtype=np.float32),
+                                   ["first", "second"], flush=True)
+    query = [[1.0, 0.1, 0.0, 0.0]]
+
+    first = vector_database.search(conversation_id, query, limit=10)
+    assert vector_database.search(conversation_id, query, limit=10) == first
+    assert vector_database.get_retrieval_cache_stats()["hits"] == 1
+
+    vector_database.insert_columns(conversation_id, np.array([[1, 0.1, 0, 0]], dtype=np.float32), ["third"], flush=True)
+    hits = vector_database.search(conversation_id, query, limit=10)[0]
+
+    assert [hit["entity"]["text"] for hit in hits][0] == "third"
+    assert len(hits) == 3
+    assert vector_database.get_retrieval_cache_stats()["hits"] == 1
+
+    vector_database.delete_data(conversation_id, [hits[0]["id"]])
+    assert [hit["entity"]["text"] for hit in vector_database.search(conversation_id, query, limit=10)[0]] == ["first", "second"]